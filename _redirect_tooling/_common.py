@@ -1,13 +1,16 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-_common.py — build_redirects.py 與 test_redirects.py 共用的常數與函式。
+_common.py — _redirect_tooling/ 全部工具（以及 scripts/check_html_quality.py）
+共用的常數與函式。
 
-放在這裡的東西必須是「兩支腳本都要用、且必須保持完全一致」的邏輯：
+放在這裡的東西必須是「多支工具都要用、且必須保持完全一致」的邏輯；
+只有單一工具用到的 helper 留在該工具內，工具之間也不互相 import
+CLI 模組取用 helper（要共用就搬到這裡）：
     - MANAGED_MARKER：build 寫入時用來標記「本工具管理」，test 驗證時
       也要用同一個字串去檢查，兩邊如果各自硬編碼一份、日後很容易改一邊
       忘了改另一邊，造成誤判。
-    - reconfigure_utf8_streams()：Windows 主控台編碼修正，兩支腳本都需要。
+    - reconfigure_utf8_streams()：Windows 主控台編碼修正，每支工具都需要。
     - js_escape_target()：寫入 <script> 內的 target 字串跳脫規則。
       build 用它「寫」，test 用它「驗證寫得對不對」，必須是同一份函式，
       不能各寫一份，否則其中一邊改了跳脫規則、另一邊沒跟著改，
@@ -15,24 +18,58 @@ _common.py — build_redirects.py 與 test_redirects.py 共用的常數與函式
     - compute_display_title()：<title> / og:title / twitter:title 用的
       顯示名稱（note 為空時的 fallback 規則）。同樣是 build 用它「寫」、
       test 用它「驗證」，必須共用同一份，理由同上。
+    - ROUTER_PAGE_NAME / ROUTER_TABLE_ID：router 模式的 404.html 檔名與
+      對照表 id，build 寫、test 讀，理由同 MANAGED_MARKER。
+    - AtomicBatchWriter：所有會改寫網站檔案的工具（build_redirects、
+      sweep_expired、inject_fragment、prune_css 等）共用的交易式寫入。
+      寫到一半當掉或被 Ctrl-C 中斷時，網站不會停在「一半新、一半舊」的
+      狀態。
+    - phase() / count() / add_bytes() 與 --profile / --timings-json：所有
+      工具共用的分階段計時、計數器與讀寫位元組統計，CI log 與本機都用
+      同一套格式，才能跨工具、跨次執行比較。
+    - rebase_urls()：把 CSS 內相對 url() 改寫成網站根目錄絕對路徑。
+      prune_css（critical CSS 搬進頁面）與 externalize_fragments（inline
+      CSS 搬到共用檔）都要用，兩邊改寫規則必須一致。
+    - format_bytes()：報告中的檔案大小格式（B / KB / MB），各工具印出的
+      大小才能直接對照。
+    - list_pages()：各工具要處理的頁面清單。範圍以名稱明確指定
+      （PAGES_ROOT / PAGES_SITE），避免每支工具各寫一份、範圍與回傳型別
+      悄悄分歧。
 
 用法：
-    import 前，兩支腳本檔案必須跟本檔放在同一個目錄
-    （_redirect_tooling/）。Python 執行 `python _redirect_tooling/build_redirects.py`
-    時，直譯器會自動把「腳本所在目錄」加進 sys.path[0]，
-    所以 `import _common` 不需要額外處理 sys.path 就能解析，
-    不論目前工作目錄（cwd）是 repo root 還是別的地方都一樣。
+    _redirect_tooling/ 內的工具與本檔放在同一個目錄。Python 執行
+    `python _redirect_tooling/build_redirects.py` 時，直譯器會自動把
+    「腳本所在目錄」加進 sys.path[0]，所以 `import _common` 不需要額外
+    處理 sys.path 就能解析，不論目前工作目錄（cwd）是 repo root 還是
+    別的地方都一樣。
+    不在這個目錄的腳本（scripts/check_html_quality.py）先把
+    _redirect_tooling/ 插到 sys.path 最前面再 import。
 """
 
 from __future__ import annotations
 
+import atexit
 import json
+import os
+import re
+import shutil
+import stat
 import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterable, Iterator
 
 # 本工具產生的 index.html 一律帶這個管理標記；覆寫/刪除舊資料夾前都要先
 # 檢查此標記是否存在，才允許覆寫/刪除，避免動到被人工接手改過的頁面。
 MANAGED_MARKER = "hdh-redirect-tooling:managed"
 
+# router 模式的對照表頁面（GitHub Pages 找不到路徑時回傳的頁面）與頁內
+# 對照表 <script> 的 id：build 依此寫入、test 依此讀回驗證。
+ROUTER_PAGE_NAME = "404.html"
+ROUTER_TABLE_ID = "hdh-router-table"
+
 # note 為空時，<title> / og:title / twitter:title 的預設顯示名稱。
 DEFAULT_DISPLAY_TITLE = "匯東華統計顧問"
 
@@ -84,3 +121,361 @@ def compute_display_title(note: str) -> str:
     """
     stripped = note.strip() if note else ""
     return stripped if stripped else DEFAULT_DISPLAY_TITLE
+
+
+_CSS_URL_PATTERN = re.compile(r"""url\(\s*(["']?)([^"')]+)\1\s*\)""")
+
+
+def rebase_urls(css: str, css_dir: str) -> str:
+    """把 css_dir 為基準的相對 url() 改寫成網站根目錄絕對路徑（超出根目錄者停在根目錄）。"""
+
+    def repl(m: re.Match) -> str:
+        quote, ref = m.group(1), m.group(2).strip()
+        if ref.startswith(("data:", "/", "#")) or re.match(r"[a-z]+:", ref, re.IGNORECASE):
+            return m.group(0)
+        parts: list[str] = []
+        for part in f"{css_dir}/{ref}".split("/"):
+            if part == "..":
+                if parts:
+                    parts.pop()
+            elif part not in ("", "."):
+                parts.append(part)
+        return f"url({quote}/{'/'.join(parts)}{quote})"
+
+    return _CSS_URL_PATTERN.sub(repl, css)
+
+
+def format_bytes(n: float) -> str:
+    """位元組數 → 「123 B」/「4.5 KB」/「6.7 MB」（MB 以上一律以 MB 表示）。"""
+    for unit in ("B", "KB"):
+        if n < 1024:
+            return f"{n:.1f} {unit}" if unit != "B" else f"{n} B"
+        n /= 1024
+    return f"{n:.1f} MB"
+
+
+# ---------------------------------------------------------------------------
+# 頁面清單
+# ---------------------------------------------------------------------------
+
+# 網站資源目錄：repo root 下的這些目錄，以及任何層級名為 ASSET_DIR_NAMES 的目錄
+ASSET_ROOTS = ("__system", "__edited_images")
+ASSET_DIR_NAMES = ("_imagecache",)
+
+# 不是網站頁面的目錄（工具、CI 設定、搜尋索引等）
+NON_SITE_DIRS = {".git", ".github", ".cache", "_redirect_tooling", "scripts", "pagefind", "__pycache__"}
+
+# 根目錄的內容頁：*.html，不含 _demo 開頭的 demo 檔。全站片段注入、
+# 過期公告清理等「每個內容頁各一份」的工具用這個範圍。
+PAGES_ROOT = "root"
+# 全站所有 HTML：遞迴各層（含轉址頁資料夾內的 index.html、404.html），
+# 略過 NON_SITE_DIRS 與資源目錄。資源引用、sitemap、搜尋索引等以「網站
+# 實際會送出的頁面」為準的工具用這個範圍。
+PAGES_SITE = "site"
+
+
+def list_pages(repo_root: Path, scope: str) -> list[str]:
+    """scope 範圍內的頁面，回傳 repo 相對路徑（/ 分隔）；同一目錄內依名稱排序。"""
+    if scope == PAGES_ROOT:
+        return sorted(p.name for p in repo_root.glob("*.html") if not p.name.startswith("_demo"))
+    if scope != PAGES_SITE:
+        raise ValueError(f"未知的頁面範圍：{scope!r}（可用 {PAGES_ROOT!r} / {PAGES_SITE!r}）")
+    pages: list[str] = []
+    skip = NON_SITE_DIRS | set(ASSET_ROOTS) | set(ASSET_DIR_NAMES)
+    for dirpath, dirnames, filenames in os.walk(repo_root):
+        dirnames[:] = sorted(d for d in dirnames if d not in skip and not d.startswith("."))
+        rel_dir = os.path.relpath(dirpath, repo_root).replace(os.sep, "/")
+        for name in sorted(filenames):
+            if name.lower().endswith(".html"):
+                pages.append(name if rel_dir == "." else f"{rel_dir}/{name}")
+    return pages
+
+
+class BatchWriteError(Exception):
+    """交易式寫入失敗（驗證不通過或 I/O 錯誤），整批已回復原狀。"""
+
+
+def _default_file_mode() -> int:
+    # 新檔案比照一般 open() 建檔的權限（0o666 扣掉 umask）；mkstemp 預設
+    # 是 0o600，直接 rename 過去會讓網站檔案變成只有擁有者可讀。
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+class AtomicBatchWriter:
+    """
+    交易式批次寫入：
+
+        with AtomicBatchWriter(validate=check) as writer:
+            writer.stage(path_a, data_a)
+            writer.stage(path_b, data_b)
+        # 正常離開 with 才 commit；with 內任何例外（含 Ctrl-C）一律 rollback
+
+    stage()：把內容寫進「同一目錄」的暫存檔（同目錄才能保證 rename 是
+        原子操作），先呼叫 validate(path, data)，回傳錯誤字串時拋出
+        BatchWriteError，整批回復。stage_chunks() / stage_file() 逐段寫入，
+        不經 validate。
+    commit()：先對所有暫存檔統一 fsync（批次進行，不是每寫一檔就同步
+        一次），再逐檔以 os.replace() 原子換上；覆蓋既有檔案前先以硬連結
+        保留一份備份。任何一檔換上失敗時，已換上的檔案全部還原成備份
+        （原本不存在的則刪除），網站回到 commit 前的狀態。全部成功後
+        fsync 目錄、刪除備份。
+    rollback()：刪除所有暫存檔，目標檔案完全不受影響。
+    """
+
+    def __init__(self, validate: Callable[[Path, bytes], str | None] | None = None) -> None:
+        self._validate = validate
+        self._staged: list[tuple[Path, Path]] = []
+        self._new_mode: int | None = None
+
+    def __enter__(self) -> "AtomicBatchWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+    def __len__(self) -> int:
+        return len(self._staged)
+
+    def stage(self, path: Path, data: bytes) -> None:
+        path = Path(path)
+        if self._validate is not None:
+            error = self._validate(path, data)
+            if error:
+                raise BatchWriteError(f"{path}：{error}")
+
+        self.stage_chunks(path, (data,))
+
+    def stage_chunks(self, path: Path, chunks: Iterable[bytes]) -> None:
+        """
+        與 stage() 相同，但內容由 chunks 逐段寫進暫存檔，不需要先在記憶體
+        組出整份內容（大型 JSON 產出等）。不經過 validate：有設定 validate
+        的 writer 請用 stage()。chunks 產生途中拋出例外時，暫存檔已登記，
+        離開 with 時隨整批 rollback 刪除。
+        """
+        with self.stage_file(path) as f:
+            for chunk in chunks:
+                f.write(chunk)
+
+    @contextmanager
+    def stage_file(self, path: Path) -> Iterator[BinaryIO]:
+        """
+        與 stage_chunks() 相同，但交出暫存檔的檔案物件，由呼叫端邊處理邊
+        寫入（例如邊讀 CSV 邊產生轉址頁、同時寫出 redirects.json）。同樣
+        不經過 validate；with 內拋出例外時暫存檔已登記，隨整批 rollback。
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+        tmp_path = Path(tmp_name)
+        self._staged.append((path, tmp_path))
+        with os.fdopen(fd, "wb") as f:
+            yield f
+            add_bytes(written=f.tell())
+        try:
+            mode = stat.S_IMODE(path.stat().st_mode)
+        except FileNotFoundError:
+            if self._new_mode is None:
+                self._new_mode = _default_file_mode()
+            mode = self._new_mode
+        os.chmod(tmp_path, mode)
+
+    def rollback(self) -> None:
+        for _, tmp_path in self._staged:
+            try:
+                tmp_path.unlink()
+            except FileNotFoundError:
+                pass
+        self._staged = []
+
+    def commit(self) -> None:
+        staged, self._staged = self._staged, []
+        if not staged:
+            return
+        with phase("commit"):
+            self._commit(staged)
+
+    def _commit(self, staged: list[tuple[Path, Path]]) -> None:
+
+        try:
+            # 1) 批次 fsync：內容全部落盤後才開始換檔
+            for _, tmp_path in staged:
+                with tmp_path.open("rb+") as f:
+                    os.fsync(f.fileno())
+        except BaseException:
+            self._staged = staged
+            self.rollback()
+            raise
+
+        # 2) 逐檔原子換上；backups[i] 為 None 表示目標原本不存在
+        done: list[tuple[Path, Path | None]] = []
+        try:
+            for path, tmp_path in staged:
+                backup: Path | None = None
+                if path.exists():
+                    backup = tmp_path.with_suffix(".bak")
+                    try:
+                        os.link(path, backup)
+                    except OSError:
+                        shutil.copy2(path, backup)
+                done.append((path, backup))
+                os.replace(tmp_path, path)
+        except BaseException as e:
+            for path, backup in reversed(done):
+                try:
+                    if backup is not None:
+                        os.replace(backup, path)
+                    else:
+                        path.unlink()
+                except FileNotFoundError:
+                    pass
+            self._staged = staged
+            self.rollback()
+            if isinstance(e, Exception):
+                raise BatchWriteError(f"批次寫入失敗，已還原 {len(done)} 個檔案：{e}") from e
+            raise
+
+        # 3) 目錄 fsync（POSIX；Windows 無法對目錄開檔，略過）與清除備份
+        if os.name == "posix":
+            for directory in {path.parent for path, _ in staged}:
+                fd = os.open(directory, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+        for _, backup in done:
+            if backup is not None:
+                backup.unlink()
+
+
+# ---------------------------------------------------------------------------
+# 分階段計時 / 計數器 / 讀寫位元組（--profile、--timings-json）
+# ---------------------------------------------------------------------------
+
+
+class Instrumentation:
+    """
+    記錄每個階段（phase）的累計耗時、呼叫次數與讀寫位元組，以及任意
+    計數器。階段可以巢狀，位元組一律記在「目前最內層」的階段；不在任何
+    階段內時記在 "(other)"。
+
+        with phase("render"):
+            ...
+            add_bytes(written=len(data))
+        count("pages_scanned")
+
+    平行工具的子 process 各有自己的一份（不會回傳給主 process），主
+    process 的階段耗時即為整段平行處理的 wall-clock。
+    """
+
+    OTHER = "(other)"
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.phases: dict[str, dict[str, float]] = {}
+        self.counters: dict[str, int] = {}
+        self._stack: list[str] = []
+
+    def _entry(self, name: str) -> dict[str, float]:
+        entry = self.phases.get(name)
+        if entry is None:
+            entry = self.phases[name] = {"seconds": 0.0, "calls": 0, "bytes_read": 0, "bytes_written": 0}
+        return entry
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        entry = self._entry(name)
+        self._stack.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry["seconds"] += time.perf_counter() - start
+            entry["calls"] += 1
+            self._stack.pop()
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_bytes(self, read: int = 0, written: int = 0) -> None:
+        entry = self._entry(self._stack[-1] if self._stack else self.OTHER)
+        entry["bytes_read"] += read
+        entry["bytes_written"] += written
+
+    def as_dict(self) -> dict:
+        return {
+            "script": Path(sys.argv[0]).name,
+            "argv": sys.argv[1:],
+            "total_seconds": round(time.perf_counter() - self.started, 6),
+            "phases": {
+                name: {**entry, "seconds": round(entry["seconds"], 6)} for name, entry in self.phases.items()
+            },
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+
+INSTRUMENTATION = Instrumentation()
+
+
+def phase(name: str):
+    """with phase("名稱"): 計時一個階段（見 Instrumentation）。"""
+    return INSTRUMENTATION.phase(name)
+
+
+def count(name: str, n: int = 1) -> None:
+    INSTRUMENTATION.count(name, n)
+
+
+def add_bytes(read: int = 0, written: int = 0) -> None:
+    INSTRUMENTATION.add_bytes(read, written)
+
+
+def add_profiling_arguments(parser) -> None:
+    """為 argparse parser 加上 --profile / --timings-json（每支工具共用）。"""
+    parser.add_argument(
+        "--timings-json",
+        metavar="PATH",
+        help="結束時把各階段耗時、計數器與讀寫位元組輸出成 JSON（- 表示 stderr）",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        help="以 cProfile 執行並把統計資料存到 PATH（可用 python -m pstats 或 snakeviz 檢視）",
+    )
+
+
+def enable_profiling(args) -> None:
+    """
+    parse_args() 之後呼叫：依 --profile 啟動 cProfile，並在程式結束時
+    （含 sys.exit）輸出 --timings-json 與 cProfile 檔。兩個旗標都沒給時
+    什麼都不做。
+    """
+    timings_path = getattr(args, "timings_json", None)
+    profile_path = getattr(args, "profile", None)
+    if not timings_path and not profile_path:
+        return
+
+    profiler = None
+    if profile_path:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    def finish() -> None:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+        if timings_path:
+            text = json.dumps(INSTRUMENTATION.as_dict(), ensure_ascii=False, indent=2) + "\n"
+            if timings_path == "-":
+                sys.stderr.write(text)
+            else:
+                Path(timings_path).write_text(text, encoding="utf-8", newline="\n")
+
+    atexit.register(finish)
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+_fragments.py — 全站注入片段（hdh-*-root）與 @hdh-expire 標記的共用定位邏輯。
+
+背景：
+    全站每頁都批次注入了數個片段（公告彈窗 hdh-annc-root、訂閱彈窗
+    hdh-nlpop-root、品牌頁尾 hdh-footer-root、吉祥物 hdh-mascot-root），
+    每個片段的結構固定為：
+
+        <!-- @hdh-expire date=... type=... item=... onexpire=... -->  （可選）
+        <!-- ====== 片段說明註解 ====== -->
+        <div id="hdh-XXX-root"> ... </div>
+        <!-- ====== 匯東華...片段結束（...） ====== -->
+
+    過期片段的移除（sweep_expired.py）與日後其他依片段定位的工具都必須
+    用「同一套」規則找邊界，否則其中一支改了、另一支沒跟著改，就可能
+    一支判定安全、另一支卻刪多了。規則沿用一次性腳本
+    remove_annc_live26-07_20260713_CSX.py 的 process()：
+
+        - 雙錨點：起點是 @hdh-expire 註解，終點是片段結束 marker 註解，
+          兩者之間必須恰好包住一個 hdh-*-root
+        - 片段 root 與結束 marker 在整頁都必須恰好出現 1 次
+        - 移除塊內不得含其他 hdh-*-root（防超刪）
+        - 吃掉緊接在塊後的一個換行，避免留下空白行
+
+    注入 / 改版（inject_fragment.py）以 locate_fragment() 定位：範圍是真正的
+    <div id="hdh-XXX-root"> 起點到片段結束 marker 註解結尾，片段說明註解
+    不在範圍內（各片段的說明註解彼此交錯，無法可靠地歸屬）。註解內文字
+    提到的同名 root（例如頁尾說明裡的「<div id="hdh-nlpop-root">」）不算。
+
+    @hdh-expire 也會標在一般內容（例如最新消息卡片，onexpire=移除NEW徽章），
+    這類標記後面沒有緊接 hdh-*-root 片段，不屬於可自動整塊移除的範圍，
+    定位時會以 ExpireMarker.block 為 None 表示，由呼叫端列為「需人工處理」。
+"""
+
+from __future__ import annotations
+
+import re
+from datetime import date
+from typing import NamedTuple
+
+EXPIRE_TAG = "@hdh-expire"
+
+# 整個註解以 @hdh-expire 開頭者才算標記；片段說明文字裡順帶提到
+# 「@hdh-expire」的長註解不算。
+EXPIRE_COMMENT_PATTERN = re.compile(r"<!--\s*@hdh-expire\b(.*?)-->", re.DOTALL)
+EXPIRE_ATTR_PATTERN = re.compile(r"(\w+)=(\S+)")
+
+# 片段 root：<div id="hdh-XXX-root" ...>
+ROOT_PATTERN = re.compile(r'<div id="hdh-([a-z0-9]+)-root"')
+ROOT_ID_PATTERN = re.compile(r'id="hdh-[a-z0-9]+-root"')
+
+# 片段結束 marker 一律是含有這段文字的註解
+END_MARKER_TEXT = "片段結束"
+
+# @hdh-expire 註解與 root 之間只允許空白與其他註解（片段說明註解）
+_GAP_PATTERN = re.compile(r"(?:\s|<!--.*?-->)*", re.DOTALL)
+
+
+class FragmentBlock(NamedTuple):
+    """一個可整塊移除的片段：text[start:end] 即為要移除的範圍（含尾端換行）。"""
+
+    root: str
+    start: int
+    end: int
+    end_marker: str
+
+
+class ExpireMarker(NamedTuple):
+    """一個 @hdh-expire 標記；block 為 None 表示不是片段（需人工處理）。"""
+
+    item: str
+    expires: date | None
+    attrs: dict
+    offset: int
+    block: FragmentBlock | None
+    warning: str | None
+
+
+def parse_expire_attrs(raw: str) -> dict:
+    return dict(EXPIRE_ATTR_PATTERN.findall(raw))
+
+
+def parse_expire_date(value: str | None) -> date | None:
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def _consume_newline(text: str, pos: int) -> int:
+    if text.startswith("\r\n", pos):
+        return pos + 2
+    if text.startswith("\n", pos):
+        return pos + 1
+    return pos
+
+
+def locate_fragment_end(text: str, root: str, root_pos: int) -> tuple[int, str] | str:
+    """
+    從 root 位置往後找片段結束 marker 註解，回傳 (註解結尾位置, marker 文字)；
+    失敗時回傳 SKIP-WARN 說明字串。
+    """
+    if text.count(f'id="hdh-{root}-root"') != 1:
+        return f"SKIP-WARN: hdh-{root}-root 出現次數 != 1"
+    return _find_end_marker(text, root_pos)
+
+
+def _find_end_marker(text: str, root_pos: int) -> tuple[int, str] | str:
+    idx_marker = text.find(END_MARKER_TEXT, root_pos)
+    if idx_marker == -1:
+        return "SKIP-WARN: 找不到結束 marker"
+    comment_start = text.rfind("<!--", root_pos, idx_marker)
+    idx_close = text.find("-->", idx_marker)
+    if comment_start == -1 or idx_close == -1:
+        return "SKIP-WARN: 結束 marker 不在註解內"
+    # marker 文字取註解內含「片段結束」的那一行，整頁必須恰好 1 次
+    line_start = text.rfind("\n", comment_start, idx_marker) + 1
+    line_end = text.find("\n", idx_marker, idx_close)
+    end_marker = text[line_start:line_end if line_end != -1 else idx_close].strip()
+    if text.count(end_marker) != 1:
+        return "SKIP-WARN: 結束 marker 出現次數 != 1"
+    return idx_close + len("-->"), end_marker
+
+
+def _in_comment(text: str, pos: int) -> bool:
+    return text.rfind("<!--", 0, pos) > text.rfind("-->", 0, pos)
+
+
+def find_fragment_roots(text: str, root: str | None = None) -> list[int]:
+    """
+    頁面中真正的 <div id="hdh-{root}-root"> 起點（root 為 None 時不限片段），
+    略過註解內提到的同名字串；div 上有其他屬性也認得。
+    """
+    name = re.escape(root) if root is not None else "[a-z0-9]+"
+    pattern = re.compile(rf'<div\b[^>]*?\bid="hdh-{name}-root"')
+    return [m.start() for m in pattern.finditer(text) if not _in_comment(text, m.start())]
+
+
+def locate_fragment(text: str, root: str) -> tuple[int, int, str] | str | None:
+    """
+    定位片段 hdh-{root}-root：回傳 (root 起點, 結束 marker 註解結尾, marker 文字)；
+    頁面沒有這個片段時回傳 None，無法安全定位時回傳 SKIP-WARN 說明字串。
+    """
+    starts = find_fragment_roots(text, root)
+    if not starts:
+        return None
+    if len(starts) != 1:
+        return f"SKIP-WARN: hdh-{root}-root 出現次數 != 1"
+    found = _find_end_marker(text, starts[0])
+    if isinstance(found, str):
+        return found
+    end, end_marker = found
+    # 防超刪：範圍內只能有這一個 hdh-*-root
+    if len(find_fragment_roots(text[starts[0]:end])) != 1:
+        return "SKIP-WARN: 片段範圍內含其他 hdh-*-root，中止防超刪"
+    return starts[0], end, end_marker
+
+
+def find_expire_markers(text: str) -> list[ExpireMarker]:
+    """
+    找出頁面中所有 @hdh-expire 標記，並為後面緊接 hdh-*-root 片段者定位
+    可移除範圍。同一片段前若重複注入了多個 @hdh-expire 註解，只保留
+    最前面那一個（範圍涵蓋後面的重複註解），不會回報重疊的區塊。
+    """
+    markers: list[ExpireMarker] = []
+    claimed_ends: set[int] = set()
+
+    for m in EXPIRE_COMMENT_PATTERN.finditer(text):
+        attrs = parse_expire_attrs(m.group(1))
+        item = attrs.get("item", "")
+        expires = parse_expire_date(attrs.get("date"))
+        block: FragmentBlock | None = None
+        warning: str | None = None
+
+        gap = _GAP_PATTERN.match(text, m.end())
+        root_m = ROOT_PATTERN.match(text, gap.end())
+        if expires is None:
+            warning = f"SKIP-WARN: date 格式錯誤（{attrs.get('date')}）"
+        elif root_m is not None:
+            root = root_m.group(1)
+            found = locate_fragment_end(text, root, root_m.start())
+            if isinstance(found, str):
+                warning = found
+            else:
+                close_end, end_marker = found
+                block_text = text[m.start():close_end]
+                # 防超刪：塊內只能有這一個 hdh-*-root
+                if len(ROOT_ID_PATTERN.findall(block_text)) != 1:
+                    warning = "SKIP-WARN: 移除塊內含其他 hdh-*-root，中止防超刪"
+                elif close_end in claimed_ends:
+                    # 重複注入的 @hdh-expire 註解：已由前一個標記涵蓋
+                    continue
+                else:
+                    claimed_ends.add(close_end)
+                    block = FragmentBlock(root, m.start(), _consume_newline(text, close_end), end_marker)
+
+        markers.append(ExpireMarker(item, expires, attrs, m.start(), block, warning))
+
+    return markers
+
+
+def check_page_intact(path, data: bytes) -> str | None:
+    """
+    AtomicBatchWriter 的 validate：改寫後的頁面必須仍是完整的 UTF-8 HTML
+    （結尾為 </html>），否則回傳錯誤訊息、整批不寫入。用來擋下定位錯誤
+    把頁尾一起切掉之類的超刪。
+    """
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError as e:
+        return f"改寫後不是合法 UTF-8（{e}）"
+    if not text.rstrip().lower().endswith("</html>"):
+        return "改寫後頁面結尾不是 </html>，疑似超刪"
+    return None
+
+
+def remove_blocks(text: str, blocks: list[FragmentBlock]) -> str:
+    """移除多個互不重疊的片段，只複製片段之間的內容一次。"""
+    parts: list[str] = []
+    pos = 0
+    for block in sorted(blocks, key=lambda b: b.start):
+        parts.append(text[pos:block.start])
+        pos = block.end
+    parts.append(text[pos:])
+    return "".join(parts)
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+asset_graph.py — 全站「頁面 → 資源」引用圖與未引用資源報告
+
+用途：
+    網站帶著 __system（雜湊命名的 CSS / JS 目錄，約 88 MB）、_imagecache
+    （根目錄約 25 MB，另有 首頁/_imagecache 等各區塊的圖片快取）與
+    __edited_images，但沒有任何工具能回答「哪些檔案還有頁面在用」。
+    本腳本把全站 HTML 各解析一次（ProcessPoolExecutor 平行），抽出：
+
+        - 屬性 src / href / data-lazy / data-src / srcset / poster / content
+        - CSS url(...)（<style> 區塊與 style 屬性內）
+        - 任何字串中直接出現的資源目錄路徑（例如 JS 內組出來的
+          "__system/__js/..."），避免漏算動態引用
+
+    並遞迴解析被引用到的 .css / .js 檔（其 url() 以檔案所在目錄為基準），
+    建立「頁面 → 資源」引用圖，寫入索引檔，再列出資源目錄中沒有任何頁面
+    （直接或經由 CSS/JS 間接）引用的檔案與位元組總數。
+
+資源範圍（ASSET_ROOTS / ASSET_DIR_NAMES，可用 --include 追加）：
+    __system/、__edited_images/ 底下所有檔案，以及任何層級名為 _imagecache
+    的資料夾底下所有檔案。
+
+引用解析：
+    - 去掉 ?query / #fragment，解 HTML 實體與 %XX 百分比編碼
+    - 以 / 開頭或 https://www.medatatw.com/ 開頭者以 repo root 為基準，
+      其他相對路徑以頁面（或 CSS/JS 檔）所在目錄為基準；相對路徑不存在
+      時再以 repo root 為基準試一次（頁面多半放在根目錄，JS 內的字串
+      也是以根目錄為基準）
+    - 其他網域、data:、mailto:、javascript: 一律忽略
+
+索引檔（預設 _redirect_tooling/asset_graph.json，已列入 .gitignore）：
+    {
+      "version": 1,
+      "pages": {"index.html": ["__system/__css/h_.../x.css", ...]},
+      "assets": {"__system/__css/h_.../x.css": ["_imagecache/a.png", ...]},
+      "orphans": ["__system/__js/h_.../y.js", ...]
+    }
+    pages 為頁面直接引用的資源，assets 為 CSS/JS 資源再引用的資源。
+
+用法：
+    python asset_graph.py [--repo-root PATH] [--index PATH] [--jobs N]
+                          [--include DIR ...] [--list] [--top N]
+
+    --list 列出每一個未引用的檔案；預設只列各資源目錄的統計與佔用最大的
+    未引用子目錄（--top，預設 20）。報告僅供判斷，本腳本不會刪除任何檔案。
+"""
+
+from __future__ import annotations
+
+import argparse
+import html
+import json
+import os
+import posixpath
+import re
+import sys
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+from _common import (
+    ASSET_DIR_NAMES,
+    ASSET_ROOTS,
+    NON_SITE_DIRS,
+    PAGES_SITE,
+    add_bytes,
+    add_profiling_arguments,
+    count,
+    enable_profiling,
+    format_bytes,
+    list_pages,
+    phase,
+    reconfigure_utf8_streams,
+)
+
+reconfigure_utf8_streams()
+
+INDEX_VERSION = 1
+
+# 以網站自己的網域寫成絕對網址的引用，視同根目錄路徑
+SITE_HOSTS = {"www.medatatw.com", "medatatw.com"}
+
+# 會被遞迴解析的資源類型
+PARSED_ASSET_SUFFIXES = (".css", ".js")
+
+CHUNK_SIZE = 4
+
+ATTR_PATTERN = re.compile(
+    r"""\b(?:src|href|data-lazy|data-src|srcset|poster|content)\s*=\s*(["'])(.*?)\1""",
+    re.IGNORECASE | re.DOTALL,
+)
+CSS_URL_PATTERN = re.compile(r"""url\(\s*(["']?)([^"')]*?)\1\s*\)""", re.IGNORECASE)
+# 字串中直接出現的資源目錄路徑（JS 內組路徑、JSON 設定等）
+ASSET_MENTION_PATTERN = re.compile(
+    r"""(?:[^\s"'()<>,;=]*/)?(?:%s)/[^\s"'()<>,;\\]+""" % "|".join(re.escape(n) for n in ASSET_ROOTS + ASSET_DIR_NAMES)
+)
+
+
+def list_assets(repo_root: Path, extra_roots: tuple[str, ...] = ()) -> dict[str, int]:
+    """資源範圍內所有檔案（repo 相對路徑）與其位元組數。"""
+    assets: dict[str, int] = {}
+
+    def walk(base: Path) -> None:
+        for dirpath, dirnames, filenames in os.walk(base):
+            dirnames.sort()
+            rel_dir = os.path.relpath(dirpath, repo_root).replace(os.sep, "/")
+            for name in filenames:
+                full = os.path.join(dirpath, name)
+                assets[f"{rel_dir}/{name}"] = os.path.getsize(full)
+
+    for root in ASSET_ROOTS + tuple(extra_roots):
+        if (repo_root / root).is_dir():
+            walk(repo_root / root)
+    for dirpath, dirnames, _ in os.walk(repo_root):
+        dirnames[:] = [d for d in dirnames if d not in NON_SITE_DIRS and d not in ASSET_ROOTS and not d.startswith(".")]
+        for d in list(dirnames):
+            if d in ASSET_DIR_NAMES:
+                walk(Path(dirpath) / d)
+                dirnames.remove(d)
+    return assets
+
+
+def extract_refs(text: str) -> set[str]:
+    """抽出文字中所有可能指向本站檔案的引用字串（尚未正規化）。"""
+    refs: set[str] = set()
+    for m in ATTR_PATTERN.finditer(text):
+        value = m.group(2)
+        if "," in value and " " in value:
+            # srcset：「url 寬度, url 寬度」
+            refs.update(part.split()[0] for part in value.split(",") if part.split())
+        else:
+            refs.add(value)
+    refs.update(m.group(2) for m in CSS_URL_PATTERN.finditer(text))
+    refs.update(m.group(0) for m in ASSET_MENTION_PATTERN.finditer(text))
+    return refs
+
+
+def normalize_ref(ref: str, base_dir: str) -> list[str]:
+    """
+    把引用字串正規化成 repo 相對路徑候選（依優先順序）；外部網址等
+    不屬於本站檔案者回傳空串列。base_dir 為引用者所在目錄（repo 相對）。
+    """
+    ref = html.unescape(ref.strip())
+    if not ref or ref.startswith(("data:", "mailto:", "javascript:", "tel:", "#")):
+        return []
+    parts = urlsplit(ref)
+    if parts.scheme or ref.startswith("//"):
+        if parts.scheme not in ("http", "https", "") or parts.hostname not in SITE_HOSTS:
+            return []
+        path, from_root = parts.path, True
+    else:
+        path, from_root = parts.path, ref.startswith("/")
+    path = unquote(path).lstrip("/")
+    if not path:
+        return []
+
+    candidates = []
+    if not from_root and base_dir:
+        candidates.append(posixpath.normpath(posixpath.join(base_dir, path)))
+    candidates.append(posixpath.normpath(path))
+    return [c for c in candidates if not c.startswith("..")]
+
+
+def resolve_refs(text: str, base_dir: str, exists) -> set[str]:
+    resolved: set[str] = set()
+    for ref in extract_refs(text):
+        for candidate in normalize_ref(ref, base_dir):
+            if exists(candidate):
+                resolved.add(candidate)
+                break
+    return resolved
+
+
+def scan_file(args: tuple[str, str]) -> tuple[str, list[str]]:
+    """
+    ProcessPoolExecutor 的工作單位：讀一個檔案、抽出引用並解析成存在的
+    repo 相對路徑。args 為 (repo_root, 檔案 repo 相對路徑)。
+    """
+    repo_root, rel_path = args
+    full = os.path.join(repo_root, rel_path)
+    try:
+        with open(full, "rb") as f:
+            text = f.read().decode("utf-8", errors="replace")
+    except OSError:
+        return rel_path, []
+
+    def exists(candidate: str) -> bool:
+        return os.path.isfile(os.path.join(repo_root, candidate))
+
+    return rel_path, sorted(resolve_refs(text, posixpath.dirname(rel_path), exists))
+
+
+def scan_all(repo_root: Path, files: list[str], jobs: int) -> dict[str, list[str]]:
+    work = [(str(repo_root), f) for f in files]
+    if jobs == 1 or len(work) <= 1:
+        return dict(scan_file(w) for w in work)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return dict(executor.map(scan_file, work, chunksize=CHUNK_SIZE))
+
+
+def build_graph(repo_root: Path, assets: dict[str, int], jobs: int) -> tuple[dict, dict]:
+    """
+    回傳 (pages, asset_refs)：頁面直接引用的資源，以及 CSS/JS 資源再引用
+    的資源（逐層平行解析，直到沒有新的 CSS/JS 被引用為止）。
+    """
+    page_refs = scan_all(repo_root, list_pages(repo_root, PAGES_SITE), jobs)
+    pages = {p: [r for r in refs if r in assets] for p, refs in page_refs.items()}
+
+    asset_refs: dict[str, list[str]] = {}
+    frontier = {r for refs in pages.values() for r in refs if r.lower().endswith(PARSED_ASSET_SUFFIXES)}
+    while frontier:
+        scanned = scan_all(repo_root, sorted(frontier), jobs)
+        next_frontier: set[str] = set()
+        for asset, refs in scanned.items():
+            asset_refs[asset] = [r for r in refs if r in assets and r != asset]
+            next_frontier.update(
+                r for r in asset_refs[asset] if r.lower().endswith(PARSED_ASSET_SUFFIXES) and r not in asset_refs
+            )
+        frontier = next_frontier - set(asset_refs)
+    return pages, asset_refs
+
+
+def asset_group(path: str) -> str:
+    """報告用的分組：資源目錄本身（例如 __system/__css、首頁/_imagecache）。"""
+    parts = path.split("/")
+    if parts[0] == "__system" and len(parts) > 2:
+        return "/".join(parts[:2])
+    for i, part in enumerate(parts):
+        if part in ASSET_DIR_NAMES:
+            return "/".join(parts[: i + 1])
+    return parts[0]
+
+
+def orphan_dir(path: str) -> str:
+    """未引用子目錄的彙總單位：__system 以雜湊目錄為單位，其他以所在目錄為單位。"""
+    parts = path.split("/")
+    if parts[0] == "__system" and len(parts) > 3:
+        return "/".join(parts[:3])
+    return posixpath.dirname(path)
+
+
+def write_index(index_path: Path, data: dict) -> None:
+    tmp_path = index_path.with_name(index_path.name + ".tmp")
+    encoded = (json.dumps(data, ensure_ascii=False) + "\n").encode("utf-8")
+    tmp_path.write_bytes(encoded)
+    add_bytes(written=len(encoded))
+    tmp_path.replace(index_path)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="全站資源引用圖與未引用資源報告")
+    default_script_dir = Path(__file__).resolve().parent
+    parser.add_argument(
+        "--repo-root",
+        type=Path,
+        default=default_script_dir.parent,
+        help="repo 根目錄（預設為本腳本所在目錄的上一層）",
+    )
+    parser.add_argument(
+        "--index",
+        type=Path,
+        default=default_script_dir / "asset_graph.json",
+        help="引用圖索引檔輸出路徑",
+    )
+    parser.add_argument("--jobs", "-j", type=int, default=0, help="平行 process 數（0 = CPU 核心數）")
+    parser.add_argument(
+        "--include",
+        action="append",
+        default=[],
+        metavar="DIR",
+        help="額外納入資源範圍的 repo 相對目錄（可重複指定）",
+    )
+    parser.add_argument("--list", action="store_true", help="列出每一個未引用的檔案")
+    parser.add_argument("--top", type=int, default=20, help="列出佔用最大的前 N 個未引用子目錄（預設 20）")
+    add_profiling_arguments(parser)
+    args = parser.parse_args()
+    enable_profiling(args)
+
+    repo_root: Path = args.repo_root.resolve()
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+
+    with phase("list_assets"):
+        assets = list_assets(repo_root, tuple(d.strip("/") for d in args.include))
+    with phase("build_graph"):
+        pages, asset_refs = build_graph(repo_root, assets, jobs)
+    count("pages", len(pages))
+    count("assets", len(assets))
+
+    referenced = {r for refs in pages.values() for r in refs}
+    referenced.update(r for refs in asset_refs.values() for r in refs)
+    orphans = sorted(a for a in assets if a not in referenced)
+
+    with phase("write_index"):
+        write_index(
+            args.index.resolve(),
+            {"version": INDEX_VERSION, "pages": pages, "assets": asset_refs, "orphans": orphans},
+        )
+
+    print(f"頁面 {len(pages)} 個，資源檔 {len(assets)} 個（{format_bytes(sum(assets.values()))}）")
+    print(f"已引用 {len(referenced)} 個，未引用 {len(orphans)} 個（{format_bytes(sum(assets[a] for a in orphans))}）")
+    print()
+
+    groups: dict[str, list[int]] = defaultdict(lambda: [0, 0, 0, 0])
+    for asset, size in assets.items():
+        g = groups[asset_group(asset)]
+        g[0] += 1
+        g[1] += size
+        if asset not in referenced:
+            g[2] += 1
+            g[3] += size
+    print(f"{'資源目錄':<32}{'檔案':>8}{'大小':>12}{'未引用':>8}{'未引用大小':>14}")
+    print("-" * 78)
+    for name, (n_files, size, o_count, o_size) in sorted(groups.items(), key=lambda kv: -kv[1][3]):
+        print(f"{name:<32}{n_files:>8}{format_bytes(size):>12}{o_count:>8}{format_bytes(o_size):>14}")
+
+    by_dir: dict[str, list[int]] = defaultdict(lambda: [0, 0])
+    for asset in orphans:
+        d = by_dir[orphan_dir(asset)]
+        d[0] += 1
+        d[1] += assets[asset]
+    if by_dir and args.top > 0:
+        print()
+        print(f"佔用最大的未引用子目錄（前 {args.top} 個）：")
+        for name, (n_files, size) in sorted(by_dir.items(), key=lambda kv: -kv[1][1])[: args.top]:
+            print(f"  {format_bytes(size):>10}  {n_files:>5} 檔  {name}")
+
+    if args.list:
+        print()
+        print("未引用的檔案：")
+        for asset in orphans:
+            print(f"  {format_bytes(assets[asset]):>10}  {asset}")
+
+    print()
+    print(f"[WRITE] {args.index}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
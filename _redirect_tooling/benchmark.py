@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+benchmark.py — 網站工具效能基準（合成網站 + 各工具分階段計時）
+
+用途：
+    build_redirects.py / test_redirects.py / check_html_quality.py / 片段
+    移除工具原本都沒有任何效能量測，只能等 CI 或全站清理變慢了才發現。
+    本腳本在暫存資料夾產生一個「長得像本站」的合成 repo root：
+
+        - N 個根目錄 *.html 頁面，每頁約 200–270 KB（與正式頁面相當），
+          結尾依序注入頁尾 hdh-footer-root、訂閱彈窗 hdh-nlpop-root、
+          公告彈窗 hdh-annc-root 三個片段；公告片段前帶 @hdh-expire 註解
+          （item=live-km0710，已過期），部分頁面另有最新消息卡片的
+          @hdh-expire 標記（非片段，需人工處理）
+        - _redirect_tooling/redirects.csv 共 M 列
+
+    再對合成網站依序跑各工具的主要階段，以 _common.phase() 計時，
+    結果輸出成 JSON，作為日後比較效能迴歸的基準。各工具都直接 import
+    其模組函式在同一個程序內執行（與命令列入口相同的程式路徑），才能
+    拆出各階段的耗時；工具本身的逐筆輸出一律導向 os.devnull。
+
+規模（--scale，可重複指定）：
+    small   300 頁 / 50 筆轉址（預設）
+    medium  3,000 頁 / 5,000 筆轉址
+    large   30,000 頁 / 50,000 筆轉址（合成網站約 7 GB，請確認磁碟空間）
+
+用法：
+    python benchmark.py [--scale small|medium|large ...] [--output PATH]
+                        [--workdir PATH] [--jobs N] [--seed N] [--keep]
+
+    --output 省略時 JSON 印到 stdout；--workdir 指定合成網站的上層資料夾
+    （預設為系統暫存資料夾），--keep 保留合成網站不刪除，方便人工檢查。
+
+輸出格式：
+    {
+      "python": "3.12.3", "platform": "...", "cpu_count": 8, "seed": 0,
+      "results": [
+        {"scale": "small", "pages": 300, "redirects": 50,
+         "site_bytes": 70000000,
+         "phases": {"generate": 1.2, "build_redirects.load_csv": 0.001, ...}}
+      ]
+    }
+    phases 的值一律為秒數，鍵為「工具.階段」。
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+from datetime import date
+from pathlib import Path
+
+from _common import (
+    INSTRUMENTATION,
+    PAGES_ROOT,
+    AtomicBatchWriter,
+    add_profiling_arguments,
+    enable_profiling,
+    list_pages,
+    phase,
+    reconfigure_utf8_streams,
+)
+
+reconfigure_utf8_streams()
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+REPO_ROOT = SCRIPT_DIR.parent
+
+# check_html_quality.py 在 scripts/ 底下，不在本目錄
+sys.path.insert(0, str(REPO_ROOT / "scripts"))
+
+import build_redirects  # noqa: E402
+import check_html_quality  # noqa: E402
+import expire_index  # noqa: E402
+import sweep_expired  # noqa: E402
+import test_redirects  # noqa: E402
+
+SCALES = {
+    "small": (300, 50),
+    "medium": (3_000, 5_000),
+    "large": (30_000, 50_000),
+}
+
+PAGE_MIN_BYTES = 200 * 1024
+PAGE_MAX_BYTES = 270 * 1024
+
+# 合成公告片段沿用一次性移除腳本的 item 與結束 marker，讓
+# remove_annc_live26-07_20260713_CSX.py 不需改動即可對合成網站計時
+EXPIRED_ITEM = "live-km0710"
+EXPIRED_DATE = "2026-07-13"
+ANNC_END_MARKER = "匯東華公告彈窗片段結束（Live26-07）"
+NEWS_ITEM = "news-new-badge"
+
+# 以此日期執行過期清理，確保合成標記都已過期
+SWEEP_TODAY = date(2026, 8, 1)
+
+REMOVER_SCRIPT = SCRIPT_DIR / "remove_annc_live26-07_20260713_CSX.py"
+
+_PARAGRAPH_WORDS = [
+    "統合分析", "存活分析", "樣本數", "迴歸模型", "信賴區間", "效果量",
+    "Kaplan-Meier", "hazard ratio", "隨機對照試驗", "世代研究", "偏差",
+    "檢定力", "p 值", "標準誤", "干擾因子", "敏感度分析", "GRADE",
+]
+
+
+def _fragment(root: str, end_marker: str, body_bytes: int, rng: random.Random) -> str:
+    """產生與正式片段同結構的注入片段（說明註解 + root div + 結束 marker）。"""
+    rules = "\n".join(
+        f"  #hdh-{root}-root .hdh-{root}-c{i}{{margin:{rng.randint(0, 24)}px;color:#B82226;}}"
+        for i in range(max(1, body_bytes // 64))
+    )
+    return (
+        "<!-- ============================================================\n"
+        f"  匯東華 {root} 片段（合成基準頁）\n"
+        "============================================================ -->\n"
+        f'<div id="hdh-{root}-root">\n<style>\n{rules}\n</style>\n'
+        f"<script>\n(function(){{ var el = document.getElementById('hdh-{root}-root'); }})();\n</script>\n"
+        "</div>\n"
+        "<!-- ============================================================\n"
+        f"  {end_marker}\n"
+        "============================================================ -->\n"
+    )
+
+
+def render_synthetic_page(index: int, rng: random.Random) -> str:
+    target_bytes = rng.randint(PAGE_MIN_BYTES, PAGE_MAX_BYTES)
+
+    head = (
+        "<!DOCTYPE html>\n<html lang=\"zh-Hant-TW\">\n<head>\n<meta charset=\"UTF-8\">\n"
+        f"<title>合成基準頁 {index}</title>\n</head>\n<body>\n"
+    )
+    news = ""
+    if index % 5 == 0:
+        news = (
+            f"<!-- @hdh-expire date={EXPIRED_DATE} type=最新消息 item={NEWS_ITEM} onexpire=移除NEW徽章 -->\n"
+            '<div class="news-card"><span class="badge">NEW</span>最新消息</div>\n'
+        )
+    fragments = (
+        _fragment("footer", "匯東華全站品牌頁尾片段結束", 12_000, rng)
+        + _fragment("nlpop", "匯東華訂閱浮動按鈕 / Pop-up 片段結束", 16_000, rng)
+        + f"<!-- @hdh-expire date={EXPIRED_DATE} type=直播公告 item={EXPIRED_ITEM} onexpire=直播結束→撤下公告 -->\n"
+        + _fragment("annc", ANNC_END_MARKER, 14_000, rng)
+    )
+    tail = "</body>\n</html>\n"
+
+    # 內文段落補到目標大小（以 UTF-8 位元組計）
+    fixed = len((head + news + fragments + tail).encode("utf-8"))
+    paragraphs: list[str] = []
+    size = fixed
+    while size < target_bytes:
+        words = "、".join(rng.choice(_PARAGRAPH_WORDS) for _ in range(40))
+        p = f"<p>{words}。</p>\n"
+        paragraphs.append(p)
+        size += len(p.encode("utf-8"))
+    return head + news + "".join(paragraphs) + fragments + tail
+
+
+def generate_site(root: Path, pages: int, redirects: int, seed: int) -> int:
+    """在 root 產生合成網站，回傳頁面總位元組數。"""
+    rng = random.Random(seed)
+    (root / "_redirect_tooling").mkdir(parents=True)
+    total = 0
+    for i in range(pages):
+        data = render_synthetic_page(i, rng).encode("utf-8")
+        (root / f"bench-page-{i:05d}.html").write_bytes(data)
+        total += len(data)
+
+    lines = ["path,target,note"]
+    for i in range(redirects):
+        note = f"合成轉址 {i}" if i % 3 else ""
+        lines.append(f"go-{i:05d},https://www.medatatw.com/課程報名.html?utm_campaign=bench-{i},{note}")
+    (root / "_redirect_tooling" / "redirects.csv").write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return total
+
+
+# 基準量測的階段記在 _common 的共用計時（與各工具內部的階段同一份，
+# --timings-json 一併輸出），以這個前綴與工具自己的階段區分
+BENCH_PHASE_PREFIX = "bench:"
+
+
+def bench_phase(name: str):
+    """with bench_phase("工具.階段"): 計時一個基準量測階段。"""
+    return phase(BENCH_PHASE_PREFIX + name)
+
+
+def bench_phase_snapshot() -> dict[str, tuple[float, int]]:
+    """目前各基準階段的 (累計秒數, 呼叫次數)。"""
+    return {
+        name: (entry["seconds"], entry["calls"])
+        for name, entry in INSTRUMENTATION.phases.items()
+        if name.startswith(BENCH_PHASE_PREFIX)
+    }
+
+
+def bench_phases_since(before: dict[str, tuple[float, int]]) -> dict[str, float]:
+    """before 之後各基準階段新增的秒數（只列這段期間實際跑過的階段）。"""
+    phases: dict[str, float] = {}
+    for name, (seconds, calls) in bench_phase_snapshot().items():
+        prev_seconds, prev_calls = before.get(name, (0.0, 0))
+        if calls > prev_calls:
+            phases[name.removeprefix(BENCH_PHASE_PREFIX)] = round(seconds - prev_seconds, 6)
+    return phases
+
+
+def bench_build_redirects(root: Path) -> list[build_redirects.RedirectRow]:
+    # 與 build_redirects.main() 第一趟相同的 iter_csv_rows() + RowChecker，
+    # 只是整份一批（rows 後面還要給 render_write 與 test_redirects 用）
+    with bench_phase("build_redirects.load_csv"):
+        rows = list(
+            build_redirects.iter_csv_rows(root / "_redirect_tooling" / "redirects.csv", build_redirects.MODE_PAGE)
+        )
+    checker = build_redirects.RowChecker(build_redirects.CollisionIndex(root, set()))
+    with bench_phase("build_redirects.validate"):
+        valid = checker.validate(rows)
+    with bench_phase("build_redirects.collisions"):
+        checker.check_collisions(valid)
+    checker.raise_errors()
+
+    digests: dict[str, str] = {}
+    with bench_phase("build_redirects.render_write"):
+        with AtomicBatchWriter() as writer:
+            for row in rows:
+                _, digests[row.path] = build_redirects.write_redirect_page(
+                    root, row.path, row.target, row.note, False, None, writer
+                )
+    # 重跑一次：帳本與磁碟皆相同，量測「全部跳過」的增量建置成本
+    with bench_phase("build_redirects.incremental_rerun"):
+        with AtomicBatchWriter() as writer:
+            for row in rows:
+                build_redirects.write_redirect_page(
+                    root, row.path, row.target, row.note, False, digests[row.path], writer
+                )
+    return rows
+
+
+def bench_test_redirects(root: Path, rows: list[build_redirects.RedirectRow]) -> None:
+    with bench_phase("test_redirects.check_all"):
+        failed = [row.path for row in rows if not test_redirects.check_one(root, row.path, row.target, row.note)[0]]
+    if failed:
+        raise RuntimeError(f"test_redirects 驗證失敗：{failed[:5]}")
+
+
+def bench_check_html_quality(pages: list[str], jobs: int, workdir: Path) -> None:
+    with bench_phase("check_html_quality.scan_serial"):
+        check_html_quality.run_checks(pages, 1)
+    if jobs != 1:
+        with bench_phase("check_html_quality.scan_parallel"):
+            check_html_quality.run_checks(pages, jobs)
+
+    cache_path = str(workdir / "html_quality_cache.json")
+    ruleset = check_html_quality.compute_ruleset_version()
+    with bench_phase("check_html_quality.cache_cold"):
+        cache = check_html_quality.ResultCache(cache_path, ruleset)
+        check_html_quality.run_checks(pages, 1, cache)
+        cache.save()
+    with bench_phase("check_html_quality.cache_warm"):
+        cache = check_html_quality.ResultCache(cache_path, ruleset)
+        check_html_quality.run_checks(pages, 1, cache)
+
+
+def bench_expire_index(root: Path, workdir: Path) -> None:
+    index_path = workdir / "expire_index.json"
+    with bench_phase("expire_index.update_cold"):
+        expire_index.update_index(root, index_path)
+    with bench_phase("expire_index.update_warm"):
+        expire_index.update_index(root, index_path)
+
+
+def bench_remover(pages: list[str]) -> None:
+    # 檔名含連字號，無法以 import 陳述式載入
+    spec = importlib.util.spec_from_file_location("remove_annc_bench", REMOVER_SCRIPT)
+    remover = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(remover)
+    with bench_phase("remove_annc.scan"):
+        changed = sum(1 for f in pages if remover.scan_file(f)[1])
+    if changed != len(pages):
+        raise RuntimeError(f"片段移除工具只命中 {changed}/{len(pages)} 頁")
+
+
+def bench_sweep_expired(pages: list[str]) -> None:
+    staged: list[tuple[str, bytes]] = []
+    with bench_phase("sweep_expired.scan"):
+        for f in pages:
+            with open(f, "r", encoding="utf-8", newline="") as fh:
+                text = fh.read()
+            new_text, removed, _, _, _ = sweep_expired.sweep_page(text, SWEEP_TODAY, None)
+            if removed:
+                staged.append((f, new_text.encode("utf-8")))
+    if len(staged) != len(pages):
+        raise RuntimeError(f"sweep_expired 只命中 {len(staged)}/{len(pages)} 頁")
+    # 最後才實際改寫頁面（其他工具都在原始頁面上量測）
+    with bench_phase("sweep_expired.commit"):
+        with AtomicBatchWriter(validate=sweep_expired.check_page_intact) as writer:
+            for f, data in staged:
+                writer.stage(f, data)
+
+
+def run_scale(name: str, workdir: Path, jobs: int, seed: int, keep: bool) -> dict:
+    n_pages, n_redirects = SCALES[name]
+    root = workdir / f"site-{name}"
+    if root.exists():
+        shutil.rmtree(root)
+    before = bench_phase_snapshot()
+
+    print(f"[{name}] 產生合成網站：{n_pages} 頁 / {n_redirects} 筆轉址 → {root}", file=sys.stderr)
+    with bench_phase("generate"):
+        site_bytes = generate_site(root, n_pages, n_redirects, seed)
+    pages = [str(root / name) for name in list_pages(root, PAGES_ROOT)]
+
+    try:
+        with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+            rows = bench_build_redirects(root)
+            bench_test_redirects(root, rows)
+            bench_check_html_quality(pages, jobs, workdir)
+            bench_expire_index(root, workdir)
+            bench_remover(pages)
+            bench_sweep_expired(pages)
+    finally:
+        if not keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    phases = bench_phases_since(before)
+    for phase_name, seconds in phases.items():
+        print(f"[{name}] {phase_name:<40}{seconds:>10.3f}s", file=sys.stderr)
+    return {
+        "scale": name,
+        "pages": n_pages,
+        "redirects": n_redirects,
+        "site_bytes": site_bytes,
+        "phases": phases,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="網站工具效能基準（合成網站）")
+    parser.add_argument(
+        "--scale",
+        action="append",
+        choices=sorted(SCALES),
+        help="要跑的規模（可重複指定，預設只跑 small）",
+    )
+    parser.add_argument("--output", type=Path, help="JSON 結果輸出路徑（省略則印到 stdout）")
+    parser.add_argument("--workdir", type=Path, help="合成網站的上層資料夾（預設為系統暫存資料夾）")
+    parser.add_argument("--jobs", type=int, default=0, help="check_html_quality 平行階段的 process 數（0 = CPU 核心數）")
+    parser.add_argument("--seed", type=int, default=0, help="合成內容的亂數種子（相同種子產生相同網站）")
+    parser.add_argument(
+        "--keep", action="store_true", help="保留合成網站不刪除（未指定 --workdir 時會印出所在的暫存資料夾）"
+    )
+    add_profiling_arguments(parser)
+    args = parser.parse_args()
+    enable_profiling(args)
+
+    scales = args.scale or ["small"]
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+
+    if args.workdir is not None:
+        args.workdir.mkdir(parents=True, exist_ok=True)
+        workdir_cm = contextlib.nullcontext(str(args.workdir))
+    elif args.keep:
+        # TemporaryDirectory 離開 with 時會整個刪掉，--keep 改用不會自動清除的暫存資料夾
+        kept_dir = tempfile.mkdtemp(prefix="hdh-bench-")
+        print(f"[KEEP] 合成網站保留於 {kept_dir}", file=sys.stderr)
+        workdir_cm = contextlib.nullcontext(kept_dir)
+    else:
+        workdir_cm = tempfile.TemporaryDirectory(prefix="hdh-bench-")
+
+    with workdir_cm as workdir:
+        results = []
+        for name in scales:
+            with phase(f"scale:{name}"):
+                results.append(run_scale(name, Path(workdir).resolve(), jobs, args.seed, args.keep))
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": args.seed,
+        "jobs": jobs,
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2) + "\n"
+    if args.output is not None:
+        args.output.write_text(text, encoding="utf-8", newline="\n")
+        print(f"[WRITE] {args.output}", file=sys.stderr)
+    else:
+        sys.stdout.write(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
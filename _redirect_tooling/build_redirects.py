@@ -14,18 +14,24 @@ build_redirects.py — 靜態轉址頁產生器（GitHub Pages 用）
 
 用法：
     python build_redirects.py [--repo-root PATH] [--csv PATH] [--dry-run]
-                               [--allow-mass-delete]
+                               [--allow-mass-delete] [--shared-stylesheet]
+                               [--default-mode page|router]
 
     預設 --repo-root 為本檔案所在目錄的上一層（也就是 repo 根目錄），
     --dry-run 只做驗證與列印計畫，不寫入/刪除任何檔案。
 
 安全機制（重要）：
-    - path 只允許單一層級（不含斜線），長度上限 64 字元，對應「根目錄
-      vanity 路徑」設計，避免巢狀路徑造成更複雜的碰撞判斷
-    - 碰撞檢查：path 不可與 repo root 既有檔案/資料夾同名（不分大小寫，
-      且會比對 .html 檔案去除副檔名後的名稱），也不可使用保留字
+    - path 可為巢狀（例如 promo/2026），最多 PATH_MAX_DEPTH 層、總長度
+      上限 64 字元；每一層只允許小寫英數字與連字號
+    - 碰撞檢查：path 的每一層都不可與既有檔案/資料夾同名（不分大小寫，
+      且會比對 .html 檔案去除副檔名後的名稱），第一層也不可使用保留字
       （見 RESERVED_NAMES），除非該名稱是本工具上一輪已經管理的資料夾
-      （允許重跑/更新）
+      （允許重跑/更新）；上層資料夾只能是本工具建立的（已管理路徑或其
+      上層），不會把轉址頁放進既有網站資料夾。碰撞檢查以 repo 目錄樹的
+      前綴樹索引（CollisionIndex）進行，每個資料夾最多列舉一次，每列
+      只需走過 path 的層數
+    - 上下層衝突：同一份 CSV 內不可同時有 promo 與 promo/2026 這類
+      互為上下層的 path（刪除上層時會連帶影響下層）
     - 覆寫保護：即使 path 通過碰撞檢查，若該資料夾已存在 index.html 但
       缺少管理標記（可能被人工接手），一律跳過不覆寫，並印出警告
     - 大量刪除保護：單次刪除超過已管理路徑 50%（且刪除數 > 1）時，
@@ -36,34 +42,86 @@ build_redirects.py — 靜態轉址頁產生器（GitHub Pages 用）
       組出 repo_root 以外的路徑
     - 產生 touched_paths.json，紀錄本次「新增/更新/刪除」的根目錄名稱，
       供 CI 的自動 commit 步驟精準只加入這些路徑，不動到其他網站檔案
+
+增量建置（內容雜湊帳本）：
+    manifest.json 的 page_digests 記錄每個 path 上一輪產出的 index.html
+    內容 SHA-256（產出內容本身已涵蓋 path / target / note，另以
+    template_version 涵蓋範本版本）。本輪算出的 digest 與帳本相同、且
+    磁碟上 index.html 的位元組雜湊也仍相同時，直接跳過不重寫，也不列入
+    touched_paths.json；改一列 CSV 只會寫一個檔、CI 只 add 一個 pathspec。
+
+範本：
+    轉址頁範本在每個程序只編譯一次（redirect_template），公司文案、管理
+    標記與樣式等靜態部分預先跳脫好，逐列只代入 target / note / path
+    衍生的少數欄位。--shared-stylesheet 時改寫出共用樣式表
+    assets/redirect.css（與轉址頁同一批換上），各頁以 <link> 引用，
+    不再每頁 inline 相同的 CSS。
+
+輸出模式（CSV 可選欄位 mode，留空則用 --default-mode，預設 page）：
+    page    每列一個 {path}/index.html（四層轉址 + 社群預覽），即原本的做法
+    router  不產生資料夾，所有 router 列合併成根目錄 404.html 內一張依
+            path 排序的對照表，由頁內的小段 JS 依網址查表轉址。GitHub
+            Pages 找不到路徑時會回傳 404.html，因此短網址數量再多，網站
+            也只多一個檔案。代價是沒有 JS 就無法轉址、也沒有逐頁的社群
+            預覽，需要 OG 預覽的路徑請維持 page 模式。
+    manifest.json 以 router_paths 記錄目前由 404.html 負責的 path。
+
+串流讀取（大型 CSV）：
+    CSV 逐列讀取（iter_csv_rows，每列一個 RedirectRow tuple），不整份
+    載入：第一趟逐列驗證 + 碰撞檢查（RowChecker，只保留每個 path 的小寫
+    key 與行號），第二趟逐列產出轉址頁，redirects.json 再讀一趟邊讀邊寫。
+    各趟以 csv_stamp() 確認讀到的是同一份檔案。JSON 產出以 iter_json()
+    逐段寫入，內容與 json.dumps(..., indent=2) 逐位元組相同。
 """
 
 from __future__ import annotations
 
 import argparse
 import csv
+import hashlib
 import html
+import io
 import json
+import os
 import re
 import shutil
 import sys
+import tempfile
+from contextlib import nullcontext
 from datetime import datetime, timezone
+from functools import lru_cache
+from itertools import chain, islice
 from pathlib import Path
+from string import Formatter
+from typing import Callable, Iterable, Iterator, NamedTuple
 from urllib.parse import urlparse
 
 from _common import (
     MANAGED_MARKER,
+    ROUTER_PAGE_NAME,
+    ROUTER_TABLE_ID,
+    AtomicBatchWriter,
+    BatchWriteError,
+    add_bytes,
+    add_profiling_arguments,
     compute_display_title,
+    count,
+    enable_profiling,
     js_escape_target,
+    phase,
     reconfigure_utf8_streams,
 )
 
 reconfigure_utf8_streams()
 
-# path 驗證規則：僅允許小寫英數字與連字號，長度 1-64，不可包含斜線
-# （對應「根目錄 vanity 路徑」設計，避免巢狀路徑造成更複雜的碰撞判斷）
+# path 驗證規則：以斜線分隔的 1 到 PATH_MAX_DEPTH 層，每層僅允許小寫
+# 英數字與連字號，總長度 1-64（不允許開頭/結尾斜線、連續斜線與 . / ..）
 PATH_MAX_LENGTH = 64
-PATH_PATTERN = re.compile(r"^(?=.{1,%d}$)[a-z0-9]+(?:-[a-z0-9]+)*$" % PATH_MAX_LENGTH)
+PATH_MAX_DEPTH = 4
+PATH_SEGMENT = r"[a-z0-9]+(?:-[a-z0-9]+)*"
+PATH_PATTERN = re.compile(
+    r"^(?=.{1,%d}$)%s(?:/%s){0,%d}$" % (PATH_MAX_LENGTH, PATH_SEGMENT, PATH_SEGMENT, PATH_MAX_DEPTH - 1)
+)
 
 # 保留字：即使碰撞檢查當下 repo root 沒有同名項目，這些名稱也一律禁止
 # 拿來當 vanity path，避免未來與 GitHub Pages / repo 慣用檔案衝突
@@ -91,6 +149,19 @@ MASS_DELETE_RATIO = 0.5
 
 BRAND_RED = "#B82226"
 
+# 轉址頁範本版本：render_redirect_html() 的輸出格式有任何變動時都要 +1。
+# manifest.json 記錄的 template_version 與此不同時，整份 page_digests
+# 帳本視為失效，所有頁面都會重寫一次。
+TEMPLATE_VERSION = 1
+
+# write_redirect_page() 的回傳狀態
+WRITE_WRITTEN = "written"      # 已（或模擬）寫入
+WRITE_UNCHANGED = "unchanged"  # 帳本與磁碟內容皆與本輪產出相同，跳過
+WRITE_SKIPPED = "skipped"      # 覆寫保護：缺少管理標記，不予覆寫
+
+# sha256 hexdigest 格式，用於驗證 manifest.json 內 page_digests 的值
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
 # 社群預覽（OG / Twitter Card）用的固定內容。這些是本公司自訂的靜態文案，
 # 不是使用者輸入，但仍統一走 html.escape() 輸出（見 render_redirect_html），
 # 避免日後這些常數被改成可參數化來源時忘記補上跳脫。
@@ -117,77 +188,124 @@ def is_valid_target(target: str) -> bool:
     return parsed.scheme in ("http", "https") and bool(parsed.netloc)
 
 
-def load_csv_rows(csv_path: Path) -> list[dict]:
+class RedirectRow(NamedTuple):
+    """CSV 的一列（欄位已去除前後空白）。以 tuple 儲存，比每列一個 dict 省記憶體。"""
+
+    path: str
+    target: str
+    note: str
+    mode: str  # 已套用 default_mode；CSV 沒有 mode 欄且未指定預設時為空字串
+    line: int  # CSV 行號（第 1 行是表頭）
+
+
+def csv_stamp(csv_path: Path) -> tuple[int, int]:
+    """CSV 的 (大小, mtime_ns)，串流建置時用來確認各趟讀到的是同一份檔案。"""
+    st = csv_path.stat()
+    return st.st_size, st.st_mtime_ns
+
+
+def iter_csv_rows(
+    csv_path: Path, default_mode: str = "", expect_stamp: tuple[int, int] | None = None
+) -> Iterator[RedirectRow]:
+    """
+    逐列讀取 redirects.csv（產生器，不保留已讀過的列），記憶體用量與
+    CSV 列數無關。表頭不正確時在第一次取值時拋出 ValidationError。
+
+    expect_stamp 有給時，讀取前後都會比對 csv_stamp()：串流建置會把同一份
+    CSV 讀好幾趟，中途檔案被改過就拋 ValidationError，不會用兩份不同的
+    內容拼出一半新、一半舊的結果。
+    """
     if not csv_path.exists():
         raise ValidationError(f"找不到 CSV 檔案：{csv_path}")
+    if expect_stamp is not None and csv_stamp(csv_path) != expect_stamp:
+        raise ValidationError(f"CSV 在建置過程中被修改：{csv_path}，請重新執行")
 
-    rows: list[dict] = []
+    add_bytes(read=csv_path.stat().st_size)
     with csv_path.open("r", encoding="utf-8-sig", newline="") as f:
-        reader = csv.DictReader(f)
+        # 不用 csv.DictReader：每列建一個 dict 在大型 CSV 上是主要成本，
+        # 改為依表頭欄位位置取值（同名欄位以最後一個為準，與 DictReader 相同）
+        reader = csv.reader(f)
+        fieldnames = next((row for row in reader if row), None)
         required_cols = {"path", "target", "note"}
-        if reader.fieldnames is None or not required_cols.issubset(set(reader.fieldnames)):
+        if fieldnames is None or not required_cols.issubset(set(fieldnames)):
             raise ValidationError(
                 f"CSV 欄位不正確，需要 {sorted(required_cols)}，"
-                f"實際讀到 {reader.fieldnames}"
+                f"實際讀到 {fieldnames}"
             )
-        for line_no, row in enumerate(reader, start=2):  # 從第 2 行開始（第 1 行是表頭）
-            path = (row.get("path") or "").strip()
-            target = (row.get("target") or "").strip()
-            note = (row.get("note") or "").strip()
+        columns = {name: i for i, name in enumerate(fieldnames)}
+        # mode 為可選欄位：舊版 CSV 沒有這欄時一律留空（由 --default-mode 決定）
+        path_col, target_col, note_col = columns["path"], columns["target"], columns["note"]
+        mode_col = columns.get("mode")
+        # 從第 2 行開始（第 1 行是表頭）；與 DictReader 相同，完全空白的列不計
+        for line_no, row in enumerate((row for row in reader if row), start=2):
+            width = len(row)
+            path = row[path_col].strip() if path_col < width else ""
+            target = row[target_col].strip() if target_col < width else ""
+            note = row[note_col].strip() if note_col < width else ""
+            mode = row[mode_col].strip().lower() if mode_col is not None and mode_col < width else ""
             if not path and not target:
                 # 允許 CSV 尾端有空白列
                 continue
-            rows.append({"path": path, "target": target, "note": note, "line": line_no})
-    return rows
+            yield RedirectRow(path, target, note, mode or default_mode, line_no)
 
+    if expect_stamp is not None and csv_stamp(csv_path) != expect_stamp:
+        raise ValidationError(f"CSV 在建置過程中被修改：{csv_path}，請重新執行")
 
-def validate_rows(rows: list[dict]) -> None:
-    errors: list[str] = []
-    seen_paths: dict[str, int] = {}
 
-    for row in rows:
-        line_no = row["line"]
-        path = row["path"]
-        target = row["target"]
+def load_csv_rows(csv_path: Path, default_mode: str = "") -> list[RedirectRow]:
+    """一次讀進所有列（check_targets.py / benchmark.py 等需要整份清單的用途）。"""
+    return list(iter_csv_rows(csv_path, default_mode))
 
-        if not path:
-            errors.append(f"第 {line_no} 行：path 為空")
-            continue
-        if len(path) > PATH_MAX_LENGTH:
-            errors.append(
-                f"第 {line_no} 行：path「{path}」長度 {len(path)} 超過上限 "
-                f"{PATH_MAX_LENGTH} 字元"
-            )
-            continue
-        if not is_valid_path(path):
-            errors.append(
-                f"第 {line_no} 行：path「{path}」不合法"
-                "（僅允許小寫英數字與連字號，不可含斜線/空白/特殊字元）"
-            )
-            continue
 
-        key = path.lower()
-        if key in seen_paths:
-            errors.append(
-                f"第 {line_no} 行：path「{path}」與第 {seen_paths[key]} 行重複"
-            )
-        else:
-            seen_paths[key] = line_no
+def row_errors(row: RedirectRow, seen_paths: dict[str, int]) -> list[str]:
+    """
+    單列的驗證錯誤（空白代表通過）。seen_paths 為「小寫 path → 第一次出現
+    的行號」，用於重複檢查，通過格式檢查的 path 會加進去。
+    """
+    errors: list[str] = []
+    line_no = row.line
+    path = row.path
+    target = row.target
+
+    if not path:
+        return [f"第 {line_no} 行：path 為空"]
+    if len(path) > PATH_MAX_LENGTH:
+        return [
+            f"第 {line_no} 行：path「{path}」長度 {len(path)} 超過上限 "
+            f"{PATH_MAX_LENGTH} 字元"
+        ]
+    if not is_valid_path(path):
+        return [
+            f"第 {line_no} 行：path「{path}」不合法"
+            f"（每層僅允許小寫英數字與連字號，以斜線分隔、最多 {PATH_MAX_DEPTH} 層，"
+            "不可含空白/特殊字元）"
+        ]
+
+    key = path.lower()
+    if key in seen_paths:
+        errors.append(
+            f"第 {line_no} 行：path「{path}」與第 {seen_paths[key]} 行重複"
+        )
+    else:
+        seen_paths[key] = line_no
 
-        if key in RESERVED_NAMES:
-            errors.append(
-                f"第 {line_no} 行：path「{path}」是保留字，不可使用"
-            )
+    if key.split("/", 1)[0] in RESERVED_NAMES:
+        errors.append(
+            f"第 {line_no} 行：path「{path}」是保留字，不可使用"
+        )
 
-        if not target:
-            errors.append(f"第 {line_no} 行：target 為空（path={path}）")
-        elif not is_valid_target(target):
-            errors.append(
-                f"第 {line_no} 行：target「{target}」不是合法的 http(s) URL（path={path}）"
-            )
+    if row.mode not in ROUTE_MODES:
+        errors.append(
+            f"第 {line_no} 行：mode「{row.mode}」不合法（僅允許 {' / '.join(ROUTE_MODES)}）"
+        )
 
-    if errors:
-        raise ValidationError("CSV 驗證失敗：\n  - " + "\n  - ".join(errors))
+    if not target:
+        errors.append(f"第 {line_no} 行：target 為空（path={path}）")
+    elif not is_valid_target(target):
+        errors.append(
+            f"第 {line_no} 行：target「{target}」不是合法的 http(s) URL（path={path}）"
+        )
+    return errors
 
 
 def load_manifest(manifest_path: Path) -> dict:
@@ -200,7 +318,7 @@ def load_manifest(manifest_path: Path) -> dict:
     previously_managed，避免被用來組出 repo_root 以外的路徑。
     """
     if not manifest_path.exists():
-        return {"managed_paths": []}
+        return {"managed_paths": [], "router_paths": [], "page_digests": {}}
     try:
         with manifest_path.open("r", encoding="utf-8") as f:
             data = json.load(f)
@@ -220,44 +338,210 @@ def load_manifest(manifest_path: Path) -> dict:
                 file=sys.stderr,
             )
     data["managed_paths"] = valid_paths
+
+    # router_paths：由 404.html 對照表負責的 path，同樣逐項驗證
+    raw_router = data.get("router_paths")
+    data["router_paths"] = [
+        p for p in (raw_router if isinstance(raw_router, list) else []) if isinstance(p, str) and is_valid_path(p)
+    ]
+
+    # page_digests（增量建置帳本）：只保留 key 為合法 path、value 為
+    # sha256 hexdigest 的項目；範本版本不同時整份作廢（內容一定會變）。
+    raw_digests = data.get("page_digests")
+    digests: dict[str, str] = {}
+    if isinstance(raw_digests, dict) and data.get("template_version") == TEMPLATE_VERSION:
+        for p, d in raw_digests.items():
+            if isinstance(p, str) and is_valid_path(p) and isinstance(d, str) and DIGEST_PATTERN.match(d):
+                digests[p] = d
+    data["page_digests"] = digests
     return data
 
 
-def build_protected_names(repo_root: Path, previously_managed: set[str]) -> set[str]:
+class _TrieNode:
+    """CollisionIndex 的節點，對應 repo 目錄樹中的一個名稱（小寫）。"""
+
+    __slots__ = ("children", "disk_name", "kind", "listed", "reserved", "html_stem", "managed", "namespace")
+
+    def __init__(self, disk_name: str = "") -> None:
+        self.children: dict[str, _TrieNode] = {}
+        self.disk_name = disk_name  # 磁碟上的實際名稱（大小寫可能不同）
+        self.kind: str | None = None  # "dir" / "file"；None 表示磁碟上不存在
+        self.listed = False  # 是否已列舉過此資料夾
+        self.reserved = False  # 保留字（僅第一層）
+        self.html_stem = False  # 同一層有同名的 .html 檔
+        self.managed = False  # 本工具上一輪管理的 path
+        self.namespace = False  # 某個已管理 path 的上層資料夾
+
+    def child(self, name: str) -> "_TrieNode":
+        node = self.children.get(name)
+        if node is None:
+            node = self.children[name] = _TrieNode(name)
+        return node
+
+
+class CollisionIndex:
     """
-    列出 repo root 目前所有「非本工具管理」的項目名稱（小寫），
-    含 .html 檔案去除副檔名後的名稱，以及保留字清單，用於碰撞檢查。
+    repo 目錄樹的前綴樹索引，涵蓋既有檔案/資料夾、.html 檔名（去副檔名）、
+    保留字與上一輪已管理的 path，全部以小寫比對。
+
+    磁碟只在查詢走到某個資料夾時才列舉，且每個資料夾最多列舉一次；
+    查詢一個 path 只需走過它的層數，不會每列重新列舉整棵樹。
     """
-    protected: set[str] = {name.lower() for name in RESERVED_NAMES}
-    previously_managed_lower = {p.lower() for p in previously_managed}
 
-    for entry in repo_root.iterdir():
-        name = entry.name
-        name_lower = name.lower()
+    def __init__(self, repo_root: Path, previously_managed: set[str]) -> None:
+        self.repo_root = repo_root
+        self.root = _TrieNode()
+        self.root.kind = "dir"
+        for name in RESERVED_NAMES:
+            self.root.child(name.lower()).reserved = True
+        for path in previously_managed:
+            node = self.root
+            segments = path.lower().split("/")
+            for segment in segments[:-1]:
+                node = node.child(segment)
+                node.namespace = True
+            node.child(segments[-1]).managed = True
+
+    def _list(self, node: _TrieNode, dir_path: Path) -> None:
+        if node.listed:
+            return
+        node.listed = True
+        try:
+            entries = list(os.scandir(dir_path))
+        except OSError:
+            return
+        count("collision_dirs_scanned")
+        for entry in entries:
+            name = entry.name.lower()
+            child = node.child(name)
+            child.disk_name = entry.name
+            child.kind = "dir" if entry.is_dir() else "file"
+            if child.kind == "file" and name.endswith(".html"):
+                node.child(name[: -len(".html")]).html_stem = True
+
+    def conflict(self, path: str) -> str | None:
+        """回傳 path 與既有內容的碰撞說明；沒有碰撞時回傳 None。"""
+        segments = path.lower().split("/")
+        node = self.root
+        dir_path = self.repo_root
+        for depth, segment in enumerate(segments):
+            self._list(node, dir_path)
+            child = node.children.get(segment)
+            if child is None:
+                # 這一層以下在磁碟與索引中都不存在，全部會是新建的資料夾
+                return None
+            prefix = "/".join(segments[: depth + 1])
+            if child.reserved:
+                return f"「{prefix}」是保留字"
+            if child.html_stem:
+                return f"「{prefix}」與既有檔案 {prefix}.html 同名"
+            if child.kind == "file":
+                return f"「{prefix}」與既有檔案同名"
+            owned = child.managed or child.namespace
+            if child.kind == "dir" and not owned:
+                return f"「{prefix}」是既有網站資料夾（非本工具管理）"
+            node = child
+            dir_path = dir_path / child.disk_name
+        return None
+
+
+class NestingIndex:
+    """
+    逐一加入 path、即時找出互為上下層的 path（例如 promo 與 promo/2026）：
+    刪除或改寫上層時會連帶影響下層，一律不允許同時存在。只記每個 path
+    與其各層上層前綴（小寫），加入一個 path 只需走過它的層數，path 的
+    加入順序不影響是否抓得到衝突。
+    """
 
-        # 之前由本工具建立的資料夾，允許本次重新使用（更新內容）
-        if entry.is_dir() and name_lower in previously_managed_lower:
-            continue
+    __slots__ = ("_paths", "_below")
 
-        protected.add(name_lower)
+    def __init__(self) -> None:
+        self._paths: dict[str, str] = {}  # 小寫 path → 原始 path
+        self._below: dict[str, list[str]] = {}  # 小寫上層前綴 → 位於其下的原始 path
 
-        if entry.is_file() and entry.suffix.lower() == ".html":
-            protected.add(entry.stem.lower())
+    def add(self, path: str) -> list[str]:
+        """加入 path，回傳與已加入的 path 互為上下層的錯誤說明（有衝突時不記入）。"""
+        segments = path.lower().split("/")
+        errors: list[str] = []
+        for depth in range(1, len(segments)):
+            upper = "/".join(segments[:depth])
+            if not errors and upper in self._paths:
+                errors.append(f"path「{self._paths[upper]}」是 path「{path}」的上層，兩者不可同時存在")
+            self._below.setdefault(upper, []).append(path)
+        key = "/".join(segments)
+        if not errors:
+            errors = [
+                f"path「{path}」是 path「{lower}」的上層，兩者不可同時存在" for lower in self._below.get(key, ())
+            ]
+        if not errors:
+            self._paths.setdefault(key, path)
+        return errors
 
-    return protected
 
+def collision_error(path: str, reason: str) -> str:
+    return f"path「{path}」碰撞：{reason}，為避免覆蓋既有網站內容已中止建置"
 
-def check_collisions(rows: list[dict], protected: set[str]) -> None:
-    errors = []
-    for row in rows:
-        path_lower = row["path"].lower()
-        if path_lower in protected:
-            errors.append(
-                f"path「{row['path']}」與 repo root 既有檔案/資料夾同名"
-                "（或為保留字），為避免覆蓋既有網站內容已中止建置"
-            )
-    if errors:
-        raise ValidationError("碰撞檢查失敗：\n  - " + "\n  - ".join(errors))
+
+# 第一趟一次讀進、檢查的列數：讀 CSV 與各項檢查分批交替，才能分開計時
+# （--timings-json 的 load_csv / validate / collisions），記憶體只多佔一批
+CHECK_BATCH_ROWS = 4096
+
+
+class RowChecker:
+    """
+    串流建置的第一趟：CSV 一批一批讀進來，每批先 validate()（row_errors()
+    的逐列驗證），通過的列再 check_collisions()（上下層衝突與既有內容
+    碰撞），並記下後續步驟需要的 page path 與 router 筆數。跨批只保留每個
+    path 的小寫 key 與行號，不保留整列內容。
+
+        checker = RowChecker(CollisionIndex(repo_root, managed))
+        for batch in ...:
+            checker.check_collisions(checker.validate(batch))
+        checker.raise_errors()
+
+    驗證錯誤優先：有任何驗證錯誤時 raise_errors() 只回報驗證錯誤，不合法
+    的 path 也不會拿去查碰撞。
+    """
+
+    def __init__(self, index: CollisionIndex) -> None:
+        self.index = index
+        self.row_count = 0
+        self.router_count = 0
+        self.page_paths: list[str] = []  # page 模式的 path，依 CSV 順序
+        self._seen_paths: dict[str, int] = {}
+        self._nesting = NestingIndex()
+        self._errors: list[str] = []
+        self._collisions: list[str] = []
+
+    def validate(self, rows: Iterable[RedirectRow]) -> list[RedirectRow]:
+        """逐列驗證，回傳通過驗證的列。"""
+        valid: list[RedirectRow] = []
+        for row in rows:
+            self.row_count += 1
+            errors = row_errors(row, self._seen_paths)
+            if errors:
+                self._errors.extend(errors)
+                continue
+            if row.mode == MODE_ROUTER:
+                self.router_count += 1
+            else:
+                self.page_paths.append(row.path)
+            valid.append(row)
+        return valid
+
+    def check_collisions(self, rows: Iterable[RedirectRow]) -> None:
+        """上下層衝突與碰撞檢查（CollisionIndex 第一次查詢時才掃描網站目錄）。"""
+        for row in rows:
+            self._collisions.extend(self._nesting.add(row.path))
+            reason = self.index.conflict(row.path)
+            if reason:
+                self._collisions.append(collision_error(row.path, reason))
+
+    def raise_errors(self) -> None:
+        if self._errors:
+            raise ValidationError("CSV 驗證失敗：\n  - " + "\n  - ".join(self._errors))
+        if self._collisions:
+            raise ValidationError("碰撞檢查失敗：\n  - " + "\n  - ".join(self._collisions))
 
 
 def check_mass_delete(stale_paths: list[str], previously_managed_count: int, allow: bool) -> None:
@@ -281,64 +565,56 @@ def check_mass_delete(stale_paths: list[str], previously_managed_count: int, all
         )
 
 
-def render_redirect_html(path: str, target: str, note: str) -> str:
-    # 屬性值一律用 html.escape(quote=True)：target / note 都是 CSV 提供、
-    # 不受信任的輸入，quote=True 才會把 `"` 也跳脫成 &quot;，避免在
-    # content="..." / href="..." 這類屬性中提早結束引號、插入額外屬性
-    # 或跑出屬性範圍（attribute breakout）。
-    def esc(value: str) -> str:
-        return html.escape(value, quote=True)
-
-    safe_target_attr = esc(target)
-    safe_target_text = html.escape(target, quote=False)
-    safe_note = html.escape(note, quote=False) if note else ""
-    # H-1 修復：<script> 內嵌的 target 必須用 JS-safe 跳脫，避免 target
-    # 內含 </script> 之類字樣時提早關閉 script 區塊（context breakout）。
-    js_target = js_escape_target(target)
-
-    note_html = f'<p class="note">{safe_note}</p>' if safe_note else ""
-
-    # 社群預覽（OG / Twitter Card）：title 用 note（CSV 第 3 欄）當頁面
-    # 名稱，note 留空則回退公司名稱（compute_display_title，與
-    # test_redirects.py 共用同一份邏輯，見 _common.py）。所有塞進屬性的
-    # 值一律 esc()，包含公司自訂的靜態文案，避免日後改參數化來源時
-    # 忘記補上跳脫。
-    display_title = compute_display_title(note)
-    safe_display_title = esc(display_title)
-    title_text = f"{safe_display_title} ｜ 匯東華統計顧問" if note and note.strip() else safe_display_title
-
-    safe_og_site_name = esc(OG_SITE_NAME)
-    safe_og_description = esc(OG_DESCRIPTION)
-    safe_twitter_description = esc(TWITTER_DESCRIPTION)
-    safe_og_image = esc(OG_IMAGE_URL)
-    safe_og_image_alt = esc(OG_IMAGE_ALT)
-
-    return f"""<!DOCTYPE html>
+# 轉址頁範本（str.format 語法）。欄位分兩類：
+#   - 靜態欄位：公司自訂文案、管理標記、樣式區塊，每個程序只跳脫並代入
+#     一次（見 redirect_template）
+#   - 逐列欄位：target / note / path 衍生的值，每列以 str.join 接上
+# 範本本身有任何變動都要把 TEMPLATE_VERSION +1。
+REDIRECT_TEMPLATE = """<!DOCTYPE html>
 <html lang="zh-Hant-TW">
 <head>
 <meta charset="UTF-8">
 <meta name="viewport" content="width=device-width, initial-scale=1.0">
-<meta http-equiv="refresh" content="0; url={safe_target_attr}">
-<link rel="canonical" href="{safe_target_attr}">
+<meta http-equiv="refresh" content="0; url={target_attr}">
+<link rel="canonical" href="{target_attr}">
 <meta name="robots" content="noindex">
 <title>{title_text}</title>
 <meta property="og:type" content="website">
-<meta property="og:site_name" content="{safe_og_site_name}">
-<meta property="og:title" content="{safe_display_title}">
-<meta property="og:description" content="{safe_og_description}">
-<meta property="og:url" content="{safe_target_attr}">
-<meta property="og:image" content="{safe_og_image}">
+<meta property="og:site_name" content="{og_site_name}">
+<meta property="og:title" content="{display_title}">
+<meta property="og:description" content="{og_description}">
+<meta property="og:url" content="{target_attr}">
+<meta property="og:image" content="{og_image}">
 <meta property="og:image:width" content="1200">
 <meta property="og:image:height" content="630">
-<meta property="og:image:alt" content="{safe_og_image_alt}">
+<meta property="og:image:alt" content="{og_image_alt}">
 <meta name="twitter:card" content="summary_large_image">
-<meta name="twitter:title" content="{safe_display_title}">
-<meta name="twitter:description" content="{safe_twitter_description}">
-<meta name="twitter:image" content="{safe_og_image}">
-<!-- {MANAGED_MARKER} -->
-<!-- source-path: {html.escape(path, quote=False)} -->
-<style>
-  html, body {{
+<meta name="twitter:title" content="{display_title}">
+<meta name="twitter:description" content="{twitter_description}">
+<meta name="twitter:image" content="{og_image}">
+<!-- {managed_marker} -->
+<!-- source-path: {source_path} -->
+{style_block}<script>
+  location.replace({js_target});
+</script>
+</head>
+<body>
+  <div class="redirect-wrap">
+    <div class="brand">匯東華統計顧問</div>
+    <div class="spinner" aria-hidden="true"></div>
+    <p class="msg">頁面轉址中，請稍候...</p>
+    {note_html}
+    <noscript>
+      <p class="msg">請點擊以繼續：<a href="{target_attr}">{target_text}</a></p>
+    </noscript>
+  </div>
+</body>
+</html>
+"""
+
+# 轉址頁共用樣式（inline 時包在 <style> 內；--shared-stylesheet 時另存為
+# SHARED_STYLESHEET_PATH，各頁改以 <link> 引用）。
+REDIRECT_CSS = f"""  html, body {{
     margin: 0;
     padding: 0;
     height: 100%;
@@ -388,20 +664,158 @@ def render_redirect_html(path: str, target: str, note: str) -> str:
     color: {BRAND_RED};
     word-break: break-all;
   }}
-</style>
+"""
+
+# 共用樣式表在 repo 內的位置與頁面引用的 href。轉址頁都在網站根目錄下，
+# 以根目錄絕對路徑引用即可（網站以自訂網域 CNAME 部署在根路徑）。
+SHARED_STYLESHEET_PATH = "assets/redirect.css"
+SHARED_STYLESHEET_HREF = "/" + SHARED_STYLESHEET_PATH
+
+
+# 輸出模式（CSV mode 欄位 / --default-mode）
+MODE_PAGE = "page"
+MODE_ROUTER = "router"
+ROUTE_MODES = (MODE_PAGE, MODE_ROUTER)
+
+
+class CompiledTemplate(NamedTuple):
+    """
+    預先編譯的範本：segments 比 slots 多 1 個，輸出為
+    segments[0] + 值(slots[0]) + segments[1] + ... + segments[-1]。
+    """
+
+    segments: tuple[str, ...]
+    slots: tuple[str, ...]
+
+
+def compile_template(template: str, static_values: dict[str, str]) -> CompiledTemplate:
+    """
+    把 str.format 範本拆成「靜態片段 + 逐列欄位」：static_values 內的欄位
+    直接併入相鄰的靜態片段（值須已跳脫），其餘欄位保留為 slot。
+    """
+    segments: list[str] = []
+    slots: list[str] = []
+    current: list[str] = []
+    for literal, field, spec, conversion in Formatter().parse(template):
+        current.append(literal)
+        if field is None:
+            continue
+        if spec or conversion:
+            raise ValueError(f"範本欄位不支援格式指定：{field}")
+        if field in static_values:
+            current.append(static_values[field])
+            continue
+        segments.append("".join(current))
+        slots.append(field)
+        current = []
+    segments.append("".join(current))
+    return CompiledTemplate(tuple(segments), tuple(slots))
+
+
+def render_style_block(shared_stylesheet: bool) -> str:
+    """轉址頁與 router 404.html 共用的樣式區塊：inline <style> 或共用樣式表 <link>。"""
+    if shared_stylesheet:
+        return f'<link rel="stylesheet" href="{html.escape(SHARED_STYLESHEET_HREF, quote=True)}">\n'
+    return f"<style>\n{REDIRECT_CSS}</style>\n"
+
+
+@lru_cache(maxsize=None)
+def redirect_template(shared_stylesheet: bool) -> CompiledTemplate:
+    """
+    轉址頁範本的編譯結果，每個程序每種樣式模式只編譯一次。
+    公司自訂的靜態文案雖然不是使用者輸入，仍統一走 html.escape()，
+    避免日後這些常數被改成可參數化來源時忘記補上跳脫。
+    """
+    def esc(value: str) -> str:
+        return html.escape(value, quote=True)
+
+    return compile_template(
+        REDIRECT_TEMPLATE,
+        {
+            "og_site_name": esc(OG_SITE_NAME),
+            "og_description": esc(OG_DESCRIPTION),
+            "twitter_description": esc(TWITTER_DESCRIPTION),
+            "og_image": esc(OG_IMAGE_URL),
+            "og_image_alt": esc(OG_IMAGE_ALT),
+            "managed_marker": MANAGED_MARKER,
+            "style_block": render_style_block(shared_stylesheet),
+        },
+    )
+
+
+def render_redirect_html(path: str, target: str, note: str, shared_stylesheet: bool = False) -> str:
+    # 屬性值一律用 html.escape(quote=True)：target / note 都是 CSV 提供、
+    # 不受信任的輸入，quote=True 才會把 `"` 也跳脫成 &quot;，避免在
+    # content="..." / href="..." 這類屬性中提早結束引號、插入額外屬性
+    # 或跑出屬性範圍（attribute breakout）。
+    safe_target_attr = html.escape(target, quote=True)
+    safe_note = html.escape(note, quote=False) if note else ""
+
+    # 社群預覽（OG / Twitter Card）：title 用 note（CSV 第 3 欄）當頁面
+    # 名稱，note 留空則回退公司名稱（compute_display_title，與
+    # test_redirects.py 共用同一份邏輯，見 _common.py）。
+    safe_display_title = html.escape(compute_display_title(note), quote=True)
+
+    values = {
+        "target_attr": safe_target_attr,
+        "target_text": html.escape(target, quote=False),
+        "display_title": safe_display_title,
+        "title_text": f"{safe_display_title} ｜ 匯東華統計顧問" if note and note.strip() else safe_display_title,
+        "source_path": html.escape(path, quote=False),
+        # H-1 修復：<script> 內嵌的 target 必須用 JS-safe 跳脫，避免 target
+        # 內含 </script> 之類字樣時提早關閉 script 區塊（context breakout）。
+        "js_target": js_escape_target(target),
+        "note_html": f'<p class="note">{safe_note}</p>' if safe_note else "",
+    }
+
+    template = redirect_template(shared_stylesheet)
+    parts = [template.segments[0]]
+    for slot, segment in zip(template.slots, template.segments[1:]):
+        parts.append(values[slot])
+        parts.append(segment)
+    return "".join(parts)
+
+
+# router 模式 404.html 內的查表程式：path 去掉開頭/結尾斜線與結尾的
+# /index.html、轉小寫後查表，找到就 location.replace()，找不到就留在 404 頁。
+ROUTER_RESOLVER_JS = r"""  (function () {
+    var table = JSON.parse(document.getElementById("%s").textContent);
+    var path = location.pathname;
+    try { path = decodeURIComponent(path); } catch (e) {}
+    path = path.replace(/\/index\.html$/, "").replace(/^\/+|\/+$/g, "").toLowerCase();
+    if (Object.prototype.hasOwnProperty.call(table, path)) {
+      location.replace(table[path]);
+    }
+  })();
+""" % ROUTER_TABLE_ID
+
+
+def render_router_html(table: dict[str, str], shared_stylesheet: bool = False) -> str:
+    """
+    router 模式的 404.html：對照表以 JSON 內嵌在 <script type="application/json">，
+    key 為小寫 path、依字典序排序（輸出穩定，CSV 順序變動不會產生 diff）。
+    JSON 與 js_escape_target() 相同，把 < > & 換成 \\u 跳脫，target 內含
+    </script> 也無法提早關閉 script 區塊。
+    """
+    table_json = json.dumps(dict(sorted(table.items())), ensure_ascii=False, separators=(",", ":"))
+    table_json = table_json.replace("<", "\\u003c").replace(">", "\\u003e").replace("&", "\\u0026")
+    return f"""<!DOCTYPE html>
+<html lang="zh-Hant-TW">
+<head>
+<meta charset="UTF-8">
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<meta name="robots" content="noindex">
+<title>找不到頁面 ｜ 匯東華統計顧問</title>
+<!-- {MANAGED_MARKER} -->
+{render_style_block(shared_stylesheet)}<script type="application/json" id="{ROUTER_TABLE_ID}">{table_json}</script>
 <script>
-  location.replace({js_target});
-</script>
+{ROUTER_RESOLVER_JS}</script>
 </head>
 <body>
   <div class="redirect-wrap">
     <div class="brand">匯東華統計顧問</div>
-    <div class="spinner" aria-hidden="true"></div>
-    <p class="msg">頁面轉址中，請稍候...</p>
-    {note_html}
-    <noscript>
-      <p class="msg">請點擊以繼續：<a href="{safe_target_attr}">{safe_target_text}</a></p>
-    </noscript>
+    <p class="msg">找不到這個頁面（短網址需要啟用 JavaScript 才能轉址）。</p>
+    <p class="msg"><a href="/">回到首頁</a></p>
   </div>
 </body>
 </html>
@@ -425,36 +839,135 @@ def has_managed_marker(dir_path: Path) -> bool:
         content = index_path.read_text(encoding="utf-8", errors="replace")
     except OSError:
         return False
+    count("managed_marker_reads")
+    add_bytes(read=len(content.encode("utf-8")))
     return MANAGED_MARKER in content
 
 
-def write_redirect_page(repo_root: Path, path: str, target: str, note: str, dry_run: bool) -> bool:
+def compute_digest(data: bytes) -> str:
+    """增量建置帳本用的內容雜湊（SHA-256 hexdigest）。"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def write_redirect_page(
+    repo_root: Path,
+    path: str,
+    target: str,
+    note: str,
+    dry_run: bool,
+    previous_digest: str | None = None,
+    writer: AtomicBatchWriter | None = None,
+    shared_stylesheet: bool = False,
+) -> tuple[str, str]:
     """
-    回傳是否實際（或模擬）寫入成功；False 代表因覆寫保護而跳過。
+    shared_stylesheet 為 True 時頁面以 <link> 引用共用樣式表，不 inline CSS。
+    writer 有給時只把內容 stage 進交易式批次寫入（由呼叫端統一 commit，
+    見 _common.AtomicBatchWriter）；未給時立即以單檔交易寫入。
+
+    回傳 (狀態, 本輪產出內容的 digest)，狀態為下列之一：
+        WRITE_WRITTEN   實際（或模擬）寫入
+        WRITE_UNCHANGED previous_digest（manifest 帳本）與本輪 digest 相同，
+                        且磁碟上 index.html 的位元組雜湊也相同，跳過不重寫
+        WRITE_SKIPPED   因覆寫保護而跳過
     """
     target_dir = repo_root / path
     index_path = target_dir / "index.html"
 
+    # 既有 index.html 只讀一次：管理標記檢查與位元組雜湊比對共用同一份內容。
+    existing: bytes | None = None
+    if index_path.exists():
+        try:
+            existing = index_path.read_bytes()
+        except OSError:
+            existing = b""
+        count("managed_marker_reads")
+        add_bytes(read=len(existing))
+
     # M-1 修復：若資料夾已存在且已有 index.html，覆寫前必須確認帶有管理
     # 標記；若標記缺失（可能被人工接手改成別的用途），一律跳過、不得
     # 靜默覆寫，交由人工確認處理。資料夾/檔案不存在則視為全新建立，
     # 沒有既有內容需要保護，直接放行。
-    if index_path.exists() and not has_managed_marker(target_dir):
+    if existing is not None and MANAGED_MARKER.encode("utf-8") not in existing:
         print(
             f"  [SKIP-WRITE] {index_path} 已存在但缺少管理標記，"
             "判斷可能已被人工接手修改，為安全起見不予覆寫，請手動確認後處理。"
         )
-        return False
+        return WRITE_SKIPPED, ""
 
-    content = render_redirect_html(path, target, note)
+    with phase("render"):
+        data = render_redirect_html(path, target, note, shared_stylesheet).encode("utf-8")
+        digest = compute_digest(data)
+
+    # 帳本與磁碟兩邊都要吻合才跳過：只看帳本會漏掉被手動改壞的檔案，
+    # 只看磁碟則無法在範本版本變動時強制重寫（見 TEMPLATE_VERSION）。
+    if previous_digest == digest and existing is not None and compute_digest(existing) == digest:
+        print(f"  [UNCHANGED] {index_path}")
+        return WRITE_UNCHANGED, digest
 
     if dry_run:
         print(f"  [DRY-RUN] 將寫入：{index_path}")
-        return True
-
-    target_dir.mkdir(parents=True, exist_ok=True)
-    index_path.write_text(content, encoding="utf-8", newline="\n")
+        return WRITE_WRITTEN, digest
+
+    # render_redirect_html() 一律以 \n 換行，直接寫位元組即等同 newline="\n"
+    if writer is not None:
+        writer.stage(index_path, data)
+    else:
+        with AtomicBatchWriter() as single:
+            single.stage(index_path, data)
     print(f"  [WRITE] {index_path}")
+    return WRITE_WRITTEN, digest
+
+
+def write_managed_file(file_path: Path, data: bytes, dry_run: bool, writer: AtomicBatchWriter) -> str:
+    """
+    寫出本工具管理的單一檔案（共用樣式表、router 對照表頁）。內容必須
+    帶管理標記；既有檔案缺少標記時視為人工維護的檔案，不予覆寫。內容
+    完全相同時不重寫。回傳狀態同 write_redirect_page()。
+    """
+    existing: bytes | None = None
+    if file_path.exists():
+        try:
+            existing = file_path.read_bytes()
+        except OSError:
+            existing = b""
+    if existing is not None and MANAGED_MARKER.encode("utf-8") not in existing:
+        print(f"  [SKIP-WRITE] {file_path} 已存在但缺少管理標記，不予覆寫，請手動確認後處理。")
+        return WRITE_SKIPPED
+    if existing == data:
+        print(f"  [UNCHANGED] {file_path}")
+        return WRITE_UNCHANGED
+
+    if dry_run:
+        print(f"  [DRY-RUN] 將寫入：{file_path}")
+        return WRITE_WRITTEN
+    writer.stage(file_path, data)
+    print(f"  [WRITE] {file_path}")
+    return WRITE_WRITTEN
+
+
+def write_shared_stylesheet(repo_root: Path, dry_run: bool, writer: AtomicBatchWriter) -> str:
+    """--shared-stylesheet 用：寫出共用樣式表 SHARED_STYLESHEET_PATH（開頭帶管理標記註解）。"""
+    data = f"/* {MANAGED_MARKER} */\n{REDIRECT_CSS}".encode("utf-8")
+    return write_managed_file(repo_root / SHARED_STYLESHEET_PATH, data, dry_run, writer)
+
+
+def remove_router_page(repo_root: Path, dry_run: bool) -> bool:
+    """
+    已沒有任何 router 列時，刪除本工具產生的 404.html；缺少管理標記
+    （人工維護的 404 頁）一律不動。回傳是否實際（或模擬）刪除。
+    """
+    router_path = repo_root / ROUTER_PAGE_NAME
+    try:
+        content = router_path.read_bytes()
+    except OSError:
+        return False
+    if MANAGED_MARKER.encode("utf-8") not in content:
+        return False
+    if dry_run:
+        print(f"  [DRY-RUN] 將刪除：{router_path}")
+        return True
+    router_path.unlink()
+    print(f"  [DELETE] {router_path}")
     return True
 
 
@@ -472,29 +985,145 @@ def remove_stale_dir(repo_root: Path, path: str, dry_run: bool) -> bool:
         )
         return False
 
+    # 巢狀 path：資料夾底下若還有子資料夾（其他轉址頁或其上層），只刪
+    # index.html，不連同子資料夾一起刪除
+    has_subdirs = any(entry.is_dir() for entry in target_dir.iterdir())
+
     if dry_run:
-        print(f"  [DRY-RUN] 將刪除：{target_dir}")
+        print(f"  [DRY-RUN] 將刪除：{target_dir / 'index.html' if has_subdirs else target_dir}")
         return True
 
-    shutil.rmtree(target_dir)
-    print(f"  [DELETE] {target_dir}")
+    if has_subdirs:
+        (target_dir / "index.html").unlink()
+        print(f"  [DELETE] {target_dir / 'index.html'}")
+    else:
+        shutil.rmtree(target_dir)
+        print(f"  [DELETE] {target_dir}")
+        prune_empty_parents(repo_root, target_dir.parent)
     return True
 
 
+def prune_empty_parents(repo_root: Path, dir_path: Path) -> None:
+    """刪除巢狀 path 後，由下往上移除變成空的上層資料夾（不含 repo root）。"""
+    while dir_path != repo_root and repo_root in dir_path.parents:
+        try:
+            dir_path.rmdir()
+        except OSError:
+            # 非空（或無法刪除）就停止，上層一定也不是空的
+            return
+        print(f"  [DELETE] {dir_path}（已清空的上層資料夾）")
+        dir_path = dir_path.parent
+
+
+# iter_json() 的純量編碼：json.dumps(ensure_ascii=False) 每次呼叫都會重建
+# 一個 encoder，大量逐值編碼時改用同一個
+_json_scalar = json.JSONEncoder(ensure_ascii=False).encode
+_JSON_SCALARS = (str, int, float, bool, type(None))
+_JSON_RECORD_MAX = 16
+
+
+def iter_json(value, indent: int | None = None, level: int = 0) -> Iterator[str]:
+    """
+    逐段產生 JSON 文字，串接起來與 json.dumps(value, ensure_ascii=False,
+    indent=indent) 逐位元組相同，不必先組出整份字串。level 為 value 所在
+    的縮排層級（JsonArrayWriter 逐筆輸出陣列元素時用）。
+    """
+    if isinstance(value, _JSON_SCALARS):
+        yield _json_scalar(value)
+        return
+    if isinstance(value, dict):
+        items = ((_json_scalar(key) + ": ", item) for key, item in value.items())
+        open_, close = "{", "}"
+    else:
+        items = (("", item) for item in value)
+        open_, close = "[", "]"
+
+    if indent is None:
+        inner = outer = ""
+        separator = ", "
+    else:
+        inner = "\n" + " " * (indent * (level + 1))
+        outer = "\n" + " " * (indent * level)
+        separator = "," + inner
+    # 只含純量的小型紀錄（redirects.json 的每一列）一次組成一段
+    if (
+        isinstance(value, (dict, list, tuple))
+        and 0 < len(value) <= _JSON_RECORD_MAX
+        and all(isinstance(item, _JSON_SCALARS) for item in (value.values() if isinstance(value, dict) else value))
+    ):
+        yield open_ + inner + separator.join(prefix + _json_scalar(item) for prefix, item in items) + outer + close
+        return
+    empty = True
+    for prefix, item in items:
+        yield open_ + inner + prefix if empty else separator + prefix
+        empty = False
+        if isinstance(item, _JSON_SCALARS):
+            yield _json_scalar(item)
+        else:
+            yield from iter_json(item, indent, level + 1)
+    yield open_ + close if empty else outer + close
+
+
+def join_chunks(chunks: Iterable[str], block_size: int = 1 << 16) -> Iterator[str]:
+    """把 iter_json() 的小片段併成約 block_size 字元的區塊再寫出。"""
+    buffer: list[str] = []
+    size = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= block_size:
+            yield "".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer)
+
+
+class JsonArrayWriter:
+    """
+    逐筆寫出 JSON 陣列：append() 每筆即寫出，close() 補上結尾。輸出與
+    json.dumps(整份清單, ensure_ascii=False, indent=indent) 逐位元組相同，
+    但不需要先組出整份清單（redirects.json 於第二趟邊讀 CSV 邊寫）。
+    """
+
+    def __init__(self, write: Callable[[str], object], indent: int | None = None) -> None:
+        self._write = write
+        self._indent = indent
+        self._empty = True
+        if indent is None:
+            self._open, self._separator, self._close = "[", ", ", "]"
+        else:
+            self._open = "[\n" + " " * indent
+            self._separator = ",\n" + " " * indent
+            self._close = "\n]"
+
+    def append(self, item) -> None:
+        self._write(self._open if self._empty else self._separator)
+        self._empty = False
+        for chunk in iter_json(item, self._indent, 1):
+            self._write(chunk)
+
+    def close(self) -> None:
+        self._write("[]" if self._empty else self._close)
+
+
 def write_json_artifact(path: Path, data, dry_run: bool, label: str) -> None:
     """
-    共用的 JSON 產出邏輯（manifest.json / redirects.json / touched_paths.json
-    都是同樣的「dry-run 只印計畫，否則寫檔並印 [WRITE]」模式，抽出來避免
-    三段幾乎相同的程式碼各自重複）。
+    共用的 JSON 產出邏輯（manifest.json / touched_paths.json 都是同樣的
+    「dry-run 只印計畫，否則寫檔並印 [WRITE]」模式，抽出來避免幾乎相同
+    的程式碼各自重複）。內容經 iter_json() 逐段寫出（見
+    AtomicBatchWriter.stage_chunks）。redirects.json 與轉址頁同批寫入，
+    見 main() 第 1 步。
     """
     if dry_run:
-        print(f"[DRY-RUN] 將寫入 {label}：{json.dumps(data, ensure_ascii=False)}")
+        sys.stdout.write(f"[DRY-RUN] 將寫入 {label}：")
+        for block in join_chunks(iter_json(data)):
+            sys.stdout.write(block)
+        sys.stdout.write("\n")
         return
-    path.write_text(
-        json.dumps(data, ensure_ascii=False, indent=2) + "\n",
-        encoding="utf-8",
-        newline="\n",
-    )
+    with phase("write_artifacts"), AtomicBatchWriter() as writer:
+        blocks = join_chunks(chain(iter_json(data, indent=2), ("\n",)))
+        writer.stage_chunks(path, (block.encode("utf-8") for block in blocks))
     print(f"[WRITE] {path}")
 
 
@@ -541,7 +1170,20 @@ def main() -> int:
         action="store_true",
         help="允許單次刪除超過已管理路徑 50%% 的大量刪除（預設會中止並要求確認）",
     )
+    parser.add_argument(
+        "--shared-stylesheet",
+        action="store_true",
+        help=f"轉址頁改引用共用樣式表 {SHARED_STYLESHEET_PATH}，不在每頁 inline 相同的 CSS",
+    )
+    parser.add_argument(
+        "--default-mode",
+        choices=ROUTE_MODES,
+        default=MODE_PAGE,
+        help="CSV mode 欄位留空（或沒有此欄）時的輸出模式：page 每列一個資料夾，router 合併進 404.html 對照表",
+    )
+    add_profiling_arguments(parser)
     args = parser.parse_args()
+    enable_profiling(args)
 
     repo_root: Path = args.repo_root.resolve()
     csv_path: Path = args.csv.resolve()
@@ -551,17 +1193,34 @@ def main() -> int:
         print(f"[ERROR] repo-root 不存在或不是資料夾：{repo_root}", file=sys.stderr)
         return 1
 
+    # 串流建置：CSV 逐列讀取、不整份載入。第一趟只做驗證與碰撞檢查，
+    # 第二趟邊讀邊產出轉址頁與 redirects.json（同一批寫入）；兩趟都比對
+    # csv_stamp()，中途 CSV 被改過就中止，不會寫出任何檔案。
     try:
-        rows = load_csv_rows(csv_path)
-        validate_rows(rows)
-
-        manifest = load_manifest(manifest_path)
+        stamp = csv_stamp(csv_path) if csv_path.exists() else None
+        with phase("load_manifest"):
+            manifest = load_manifest(manifest_path)
         previously_managed: set[str] = set(manifest["managed_paths"])
 
-        protected = build_protected_names(repo_root, previously_managed)
-        check_collisions(rows, protected)
-
-        new_paths = [row["path"] for row in rows]
+        # router 列同樣要過碰撞檢查：路徑若已有實體檔案/資料夾，GitHub Pages
+        # 會直接回傳該內容，根本不會走到 404.html
+        checker = RowChecker(CollisionIndex(repo_root, previously_managed))
+        rows = iter_csv_rows(csv_path, args.default_mode, stamp)
+        while True:
+            with phase("load_csv"):
+                batch = list(islice(rows, CHECK_BATCH_ROWS))
+            if not batch:
+                break
+            count("csv_rows", len(batch))
+            with phase("validate"):
+                valid = checker.validate(batch)
+            with phase("collisions"):
+                checker.check_collisions(valid)
+        checker.raise_errors()
+
+        # managed_paths 只記 page 模式的資料夾；改成 router 的 path 其舊資料夾
+        # 視為 stale 刪除，否則資料夾會擋在 404.html 前面
+        new_paths = checker.page_paths
         new_paths_set = {p.lower() for p in new_paths}
         stale_original = [p for p in previously_managed if p.lower() not in new_paths_set]
 
@@ -574,43 +1233,130 @@ def main() -> int:
     print(f"csv       : {csv_path}")
     print(f"manifest  : {manifest_path}")
     print(f"dry-run   : {args.dry_run}")
-    print(f"共 {len(rows)} 筆轉址設定，先前管理 {len(previously_managed)} 筆")
+    print(
+        f"共 {checker.row_count} 筆轉址設定（page {len(new_paths)} / router {checker.router_count}），"
+        f"先前管理 {len(previously_managed)} 筆"
+    )
     print()
 
     touched: set[str] = set()
-
-    # 1) 建立 / 更新
+    previous_digests: dict[str, str] = manifest["page_digests"]
+    page_digests: dict[str, str] = {}
+    written_count = 0
+    unchanged_count = 0
+
+    # 1) 建立 / 更新（帳本與磁碟內容皆未變者跳過，不列入 touched）。
+    #    所有頁面先 stage 到同目錄暫存檔，全部成功後才一次 fsync + 原子
+    #    換上；中途任何錯誤或 Ctrl-C 整批還原，不會留下半套轉址頁。
+    #    redirects.json 鏡像在同一趟逐列寫出、與轉址頁同批換上，兩者一定
+    #    出自同一份 CSV（dry-run 先寫進暫存檔，第 4 步再印出）。
     print("== 建立/更新轉址頁 ==")
-    for row in rows:
-        written = write_redirect_page(repo_root, row["path"], row["target"], row["note"], args.dry_run)
-        if written:
-            touched.add(row["path"])
+    mirror_preview = tempfile.TemporaryFile() if args.dry_run else None
+    try:
+        with phase("write_pages"), AtomicBatchWriter() as writer, (
+            nullcontext(mirror_preview) if args.dry_run else writer.stage_file(args.mirror_json)
+        ) as mirror_file:
+            # 共用樣式表與轉址頁同一批換上，不會出現頁面已改引用、樣式表卻還沒寫入的狀態
+            if args.shared_stylesheet:
+                css_status = write_shared_stylesheet(repo_root, args.dry_run, writer)
+                if css_status == WRITE_SKIPPED:
+                    raise BatchWriteError(f"共用樣式表 {SHARED_STYLESHEET_PATH} 無法寫入，已中止建置")
+                if css_status == WRITE_WRITTEN:
+                    touched.add(SHARED_STYLESHEET_PATH)
+            mirror = JsonArrayWriter(
+                lambda text: mirror_file.write(text.encode("utf-8")), None if args.dry_run else 2
+            )
+            router_table: dict[str, str] = {}
+            for row in iter_csv_rows(csv_path, args.default_mode, stamp):
+                mirror.append({"path": row.path, "target": row.target, "note": row.note})
+                if row.mode == MODE_ROUTER:
+                    router_table[row.path.lower()] = row.target
+                    continue
+                status, digest = write_redirect_page(
+                    repo_root,
+                    row.path,
+                    row.target,
+                    row.note,
+                    args.dry_run,
+                    previous_digests.get(row.path),
+                    writer,
+                    args.shared_stylesheet,
+                )
+                if status == WRITE_SKIPPED:
+                    continue
+                page_digests[row.path] = digest
+                if status == WRITE_WRITTEN:
+                    touched.add(row.path)
+                    written_count += 1
+                else:
+                    unchanged_count += 1
+            mirror.close()
+            mirror_file.write(b"\n")
+            # router 對照表與轉址頁同一批換上：path 在 page / router 間切換時
+            # 不會出現兩邊都沒有（或兩邊都有）的中間狀態
+            if router_table:
+                data = render_router_html(router_table, args.shared_stylesheet).encode("utf-8")
+                router_status = write_managed_file(repo_root / ROUTER_PAGE_NAME, data, args.dry_run, writer)
+                if router_status == WRITE_SKIPPED:
+                    raise BatchWriteError(f"{ROUTER_PAGE_NAME} 不是本工具產生的頁面，無法寫入 router 對照表，已中止建置")
+                if router_status == WRITE_WRITTEN:
+                    touched.add(ROUTER_PAGE_NAME)
+    except (BatchWriteError, ValidationError) as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        if mirror_preview is not None:
+            mirror_preview.close()
+        return 1
+    print(f"  寫入 {written_count} 筆，未變動跳過 {unchanged_count} 筆")
 
     # 2) 刪除已不在 CSV 內、且確認是本工具管理的舊資料夾
     print()
     print("== 清理已移除的轉址頁 ==")
     if not stale_original:
         print("  （無）")
-    for path in stale_original:
-        removed = remove_stale_dir(repo_root, path, args.dry_run)
-        if removed:
-            touched.add(path)
-
-    # 3) 寫入 manifest.json（白名單）
+    with phase("cleanup"):
+        for path in stale_original:
+            removed = remove_stale_dir(repo_root, path, args.dry_run)
+            if removed:
+                touched.add(path)
+        if not checker.router_count and remove_router_page(repo_root, args.dry_run):
+            touched.add(ROUTER_PAGE_NAME)
+
+    # 3) 寫入 manifest.json（白名單 + 增量建置帳本）
+    managed_sorted = sorted(new_paths, key=str.lower)
+    router_sorted = sorted(router_table, key=str.lower)
+    digests_sorted = {p: page_digests[p] for p in sorted(page_digests, key=str.lower)}
+    generated_at = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    # 內容完全沒變時沿用上一輪的 generated_at，避免 manifest.json 每次
+    # build 都因時間戳記產生無意義的 diff。
+    if (
+        not touched
+        and manifest.get("managed_paths") == managed_sorted
+        and manifest["router_paths"] == router_sorted
+        and manifest["page_digests"] == digests_sorted
+        and isinstance(manifest.get("generated_at"), str)
+    ):
+        generated_at = manifest["generated_at"]
     manifest_out = {
-        "generated_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "generated_at": generated_at,
         "source_csv": str(csv_path.relative_to(repo_root)) if csv_path.is_relative_to(repo_root) else str(csv_path),
-        "managed_paths": sorted(new_paths, key=str.lower),
+        "managed_paths": managed_sorted,
+        "router_paths": router_sorted,
+        "template_version": TEMPLATE_VERSION,
+        "page_digests": digests_sorted,
     }
     print()
     write_json_artifact(manifest_path, manifest_out, args.dry_run, "manifest")
 
-    # 4) 鏡像輸出 redirects.json
-    mirror = [
-        {"path": row["path"], "target": row["target"], "note": row["note"]}
-        for row in rows
-    ]
-    write_json_artifact(args.mirror_json, mirror, args.dry_run, "鏡像 JSON")
+    # 4) 鏡像輸出 redirects.json（已於第 1 步與轉址頁同批寫入）
+    if mirror_preview is not None:
+        sys.stdout.write("[DRY-RUN] 將寫入 鏡像 JSON：")
+        with mirror_preview:
+            mirror_preview.seek(0)
+            preview = io.TextIOWrapper(mirror_preview, encoding="utf-8")
+            for block in iter(lambda: preview.read(1 << 16), ""):
+                sys.stdout.write(block)
+    else:
+        print(f"[WRITE] {args.mirror_json}")
 
     # 5) 寫入本次異動清單（供 CI 精準 git add）
     touched_sorted = sorted(touched, key=str.lower)
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+build_sitemap.py — 產生 sitemap.xml，lastmod 依頁面內容雜湊增量維護
+
+用途：
+    sitemap 是 RESERVED_NAMES 之一，但一直沒有工具產生；repo 裡的
+    sitemap.xml 是很久以前手動產生的（網址前綴錯誤、所有 lastmod 同一天、
+    新頁面不在裡面），爬蟲只能每次把全站重頁面都重抓一遍。
+
+    本腳本列出全站可索引的頁面，排除：
+        - 本工具產生的轉址頁（manifest.json 的 managed_paths）與 router
+          模式的 404.html
+        - 帶 <meta name="robots" content="noindex"> 的頁面（轉址頁由
+          render_redirect_html 寫入；人工標記的頁面也一樣排除）
+        - 檔名或資料夾以 _ 開頭的頁面（_demo_*、_preview 等）
+
+lastmod：
+    每頁內容的 sha256 與 lastmod 記在 sitemap_state.json（與 manifest.json
+    一樣提交進版控，CI 與本機共用同一份紀錄）。內容雜湊沒變的頁面沿用
+    上次的 lastmod，只有真的改過的頁面才換成今天；第一次出現的頁面以
+    git 最後一次提交日期為準（工作區有未提交修改或不在 git 內者用今天）。
+
+用法：
+    python build_sitemap.py [--repo-root PATH] [--base-url URL] [--today YYYY-MM-DD]
+                            [--force] [--dry-run]
+
+    --base-url 預設取 repo root 的 CNAME（https://<CNAME>/）。
+    既有的 sitemap.xml 若沒有管理標記（人工維護的檔案），預設不覆寫；
+    確認要改由本工具接手時加 --force。
+
+寫入：
+    sitemap.xml 與 sitemap_state.json 經 _common.AtomicBatchWriter 同一批
+    交易式寫入；內容完全相同時不重寫。
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import re
+import subprocess
+import sys
+from datetime import date
+from pathlib import Path
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+
+from _common import (
+    MANAGED_MARKER,
+    PAGES_SITE,
+    ROUTER_PAGE_NAME,
+    AtomicBatchWriter,
+    BatchWriteError,
+    add_bytes,
+    add_profiling_arguments,
+    count,
+    enable_profiling,
+    list_pages,
+    phase,
+    reconfigure_utf8_streams,
+)
+from build_redirects import ValidationError, load_manifest
+
+reconfigure_utf8_streams()
+
+STATE_VERSION = 1
+SITEMAP_NAME = "sitemap.xml"
+
+NOINDEX_PATTERN = re.compile(
+    r"""<meta\s+(?:name=["']robots["']\s+content=["'][^"']*noindex|content=["'][^"']*noindex[^"']*["']\s+name=["']robots["'])""",
+    re.IGNORECASE,
+)
+
+
+def page_url(base_url: str, page: str) -> str:
+    """頁面 repo 相對路徑 → 網址（index.html 以資料夾網址表示）。"""
+    if page == "index.html":
+        path = ""
+    elif page.endswith("/index.html"):
+        path = page[: -len("index.html")]
+    else:
+        path = page
+    return base_url + quote(path, safe="/")
+
+
+def default_base_url(repo_root: Path) -> str | None:
+    try:
+        cname = (repo_root / "CNAME").read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return None
+    return f"https://{cname}/" if cname else None
+
+
+def git_last_commit_dates(repo_root: Path) -> tuple[dict[str, str], set[str]]:
+    """
+    回傳 (檔案 → 最後一次提交日期 YYYY-MM-DD, 工作區有未提交修改的檔案)。
+    只跑一次 git log，不是每頁各跑一次；不在 git repo 內時兩者皆空。
+    """
+    try:
+        log = subprocess.run(
+            ["git", "-c", "core.quotepath=off", "log", "--format=@@%cs", "--name-only", "--", "*.html"],
+            cwd=repo_root, capture_output=True, text=True, encoding="utf-8", check=True,
+        ).stdout
+        status = subprocess.run(
+            ["git", "-c", "core.quotepath=off", "status", "--porcelain", "-z", "--", "*.html"],
+            cwd=repo_root, capture_output=True, text=True, encoding="utf-8", check=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return {}, set()
+
+    dates: dict[str, str] = {}
+    current = ""
+    for line in log.splitlines():
+        if line.startswith("@@"):
+            current = line[2:]
+        elif line and line not in dates:
+            dates[line] = current
+    dirty = {entry[3:] for entry in status.split("\0") if len(entry) > 3}
+    return dates, dirty
+
+
+def load_state(state_path: Path) -> dict[str, dict]:
+    try:
+        data = json.loads(state_path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        raise ValidationError(f"{state_path.name} 讀取失敗（可能損毀）：{e}")
+    if data.get("version") != STATE_VERSION or not isinstance(data.get("pages"), dict):
+        return {}
+    return {
+        page: entry
+        for page, entry in data["pages"].items()
+        if isinstance(entry, dict) and isinstance(entry.get("sha256"), str) and isinstance(entry.get("lastmod"), str)
+    }
+
+
+def render_sitemap(base_url: str, pages: dict[str, dict]) -> str:
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        f"<!-- {MANAGED_MARKER}：由 _redirect_tooling/build_sitemap.py 產生，請勿手動修改 -->",
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">',
+    ]
+    for page, entry in sorted(pages.items()):
+        lines += [
+            "  <url>",
+            f"    <loc>{escape(page_url(base_url, page))}</loc>",
+            f"    <lastmod>{entry['lastmod']}</lastmod>",
+            "  </url>",
+        ]
+    lines.append("</urlset>")
+    return "\n".join(lines) + "\n"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="產生 sitemap.xml（lastmod 依內容雜湊增量維護）")
+    default_script_dir = Path(__file__).resolve().parent
+    parser.add_argument(
+        "--repo-root",
+        type=Path,
+        default=default_script_dir.parent,
+        help="repo 根目錄（預設為本腳本所在目錄的上一層）",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=Path,
+        default=default_script_dir / "manifest.json",
+        help="build_redirects.py 的 manifest.json（排除其中的轉址頁）",
+    )
+    parser.add_argument(
+        "--state",
+        type=Path,
+        default=default_script_dir / "sitemap_state.json",
+        help="各頁內容雜湊與 lastmod 紀錄檔",
+    )
+    parser.add_argument("--base-url", help="網站網址前綴（預設 https://<CNAME>/）")
+    parser.add_argument(
+        "--today",
+        type=date.fromisoformat,
+        default=date.today(),
+        help="內容有變動的頁面使用的 lastmod（YYYY-MM-DD，預設今天）",
+    )
+    parser.add_argument("--force", action="store_true", help="接手覆寫沒有管理標記的既有 sitemap.xml")
+    parser.add_argument("--dry-run", action="store_true", help="只列出變動，不寫入任何檔案")
+    add_profiling_arguments(parser)
+    args = parser.parse_args()
+    enable_profiling(args)
+
+    repo_root: Path = args.repo_root.resolve()
+    base_url = args.base_url or default_base_url(repo_root)
+    if not base_url:
+        print("[ERROR] 找不到 CNAME，請以 --base-url 指定網站網址", file=sys.stderr)
+        return 2
+    base_url = base_url.rstrip("/") + "/"
+
+    try:
+        manifest = load_manifest(args.manifest.resolve())
+        state = load_state(args.state.resolve())
+    except ValidationError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return 1
+
+    redirect_pages = {f"{p}/index.html" for p in manifest["managed_paths"]}
+    excluded = {"manifest": 0, "noindex": 0, "underscore": 0}
+    git_dates: dict[str, str] | None = None
+    dirty: set[str] = set()
+    pages: dict[str, dict] = {}
+    changed: list[str] = []
+    added: list[str] = []
+
+    with phase("scan"):
+        for page in list_pages(repo_root, PAGES_SITE):
+            if page in redirect_pages or page == ROUTER_PAGE_NAME:
+                excluded["manifest"] += 1
+                continue
+            if any(part.startswith("_") for part in page.split("/")):
+                excluded["underscore"] += 1
+                continue
+            data = (repo_root / page).read_bytes()
+            count("pages_read")
+            add_bytes(read=len(data))
+            if NOINDEX_PATTERN.search(data.decode("utf-8", errors="replace")):
+                excluded["noindex"] += 1
+                continue
+
+            digest = hashlib.sha256(data).hexdigest()
+            previous = state.get(page)
+            if previous is not None and previous["sha256"] == digest:
+                lastmod = previous["lastmod"]
+            elif previous is not None:
+                lastmod = args.today.isoformat()
+                changed.append(page)
+            else:
+                if git_dates is None:
+                    with phase("git_dates"):
+                        git_dates, dirty = git_last_commit_dates(repo_root)
+                lastmod = args.today.isoformat() if page in dirty else git_dates.get(page, args.today.isoformat())
+                added.append(page)
+            pages[page] = {"sha256": digest, "lastmod": lastmod}
+
+    removed = sorted(set(state) - set(pages))
+    print(f"可索引頁面 {len(pages)} 個；排除 轉址/router {excluded['manifest']}、"
+          f"noindex {excluded['noindex']}、_ 開頭 {excluded['underscore']}")
+    print(f"內容有變動 {len(changed)} 頁、新增 {len(added)} 頁、移除 {len(removed)} 頁")
+    for page in changed:
+        print(f"  [CHANGED] {page} → {args.today}")
+    for page in removed:
+        print(f"  [REMOVED] {page}")
+
+    sitemap_path = repo_root / SITEMAP_NAME
+    sitemap = render_sitemap(base_url, pages).encode("utf-8")
+    state_data = (
+        json.dumps({"version": STATE_VERSION, "pages": dict(sorted(pages.items()))}, ensure_ascii=False, indent=2) + "\n"
+    ).encode("utf-8")
+
+    existing = sitemap_path.read_bytes() if sitemap_path.exists() else None
+    if existing is not None and MANAGED_MARKER.encode("utf-8") not in existing and not args.force:
+        print(f"[ERROR] {sitemap_path} 已存在但缺少管理標記（人工維護的檔案），確認要改由本工具產生請加 --force",
+              file=sys.stderr)
+        return 1
+
+    if args.dry_run:
+        print("[DRY-RUN] 未寫入任何檔案")
+        return 0
+
+    state_path = args.state.resolve()
+    try:
+        with phase("write"), AtomicBatchWriter() as writer:
+            for path, data in ((sitemap_path, sitemap), (state_path, state_data)):
+                if path.exists() and path.read_bytes() == data:
+                    print(f"  [UNCHANGED] {path}")
+                    continue
+                writer.stage(path, data)
+                print(f"  [WRITE] {path}")
+    except BatchWriteError as e:
+        print(f"[ERROR] {e}（整批未寫入）", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+check_targets.py — redirects.csv 轉址目標健康檢查（asyncio 並行 + 連線池 + 結果快取）
+
+用途：
+    build_redirects.py 的 is_valid_target() 只檢查網址格式，目標頁面下架、
+    變慢或被多次轉址，都要等使用者反映才會發現。本腳本實際連線到每個
+    target（同一 target 只查一次），記錄：
+
+        - 轉址鏈：每一跳的網址、HTTP 狀態碼與耗時（最多 MAX_REDIRECTS 跳，
+          偵測迴圈）
+        - 總耗時與最終狀態碼
+
+    並列出三類需要處理的目標：
+        DEAD   連線失敗、逾時或最終狀態碼 >= 400
+        SLOW   總耗時超過 --slow-ms
+        HOPS   轉址次數 >= --hop-threshold，建議把 CSV 的 target 直接改成
+               最終網址
+
+連線：
+    只用標準函式庫（asyncio.open_connection + ssl），以 HTTP/1.1 HEAD
+    請求為主；HEAD 回傳 >= 400 時（不少伺服器不支援 HEAD）該跳改用 GET
+    重試，GET 只讀回應標頭、不下載內容。
+    - 每個 (scheme, host, port) 一個連線池，HEAD 回應後保留 keep-alive
+      連線給同主機的下一個請求重用；池中連線已被對方關閉時自動換新連線
+      重試一次
+    - --concurrency 限制全體同時進行的請求數，--per-host 限制單一主機的
+      同時連線數，避免對同一網站（例如 www.medatatw.com）瞬間灌入大量請求
+
+結果快取（.cache/target_health.json，已列入 .gitignore）：
+    以 target 為鍵保存上次的檢查結果與時間；--ttl 小時內檢查成功的結果
+    直接沿用，重跑只會探測過期或上次失敗的項目。--refresh 忽略快取。
+
+用法：
+    python check_targets.py [--csv PATH] [--concurrency N] [--per-host N]
+                            [--timeout SEC] [--ttl HOURS] [--refresh]
+                            [--slow-ms MS] [--hop-threshold N] [--json PATH]
+                            [URL ...]
+
+    指定 URL 時只檢查這些網址（例如對本機測試伺服器
+    http://127.0.0.1:8000/... 驗證檢查邏輯），不讀 CSV。
+
+    任何 target 為 DEAD 時以 exit code 1 結束。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import ssl
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import quote, urljoin, urlsplit
+
+from _common import add_profiling_arguments, count, enable_profiling, phase, reconfigure_utf8_streams
+from build_redirects import ValidationError, load_csv_rows
+
+reconfigure_utf8_streams()
+
+CACHE_VERSION = 1
+MAX_REDIRECTS = 10
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+USER_AGENT = "hdh-redirect-tooling-healthcheck/1.0"
+
+# 組 request-target 時保留的字元：已是 %XX 編碼的網址原樣送出，
+# 只有非 ASCII 或空白等字元才補做百分比編碼
+_URL_SAFE = "!#$%&'()*+,/:;=?@[]~"
+
+STATUS_OK = "OK"
+STATUS_DEAD = "DEAD"
+STATUS_SLOW = "SLOW"
+STATUS_HOPS = "HOPS"
+
+
+class ProbeError(Exception):
+    """單一請求失敗（連線、TLS、逾時、回應格式錯誤）。"""
+
+
+class HostPool:
+    """
+    單一 (scheme, host, port) 的 keep-alive 連線池。semaphore 限制同時
+    借出的連線數；歸還的連線放回 idle，供下一個請求重用。
+    """
+
+    def __init__(self, scheme: str, host: str, port: int, limit: int) -> None:
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.semaphore = asyncio.Semaphore(limit)
+        self.idle: list[tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self.opened = 0
+
+    async def open(self, ssl_context: ssl.SSLContext) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        self.opened += 1
+        if self.scheme == "https":
+            return await asyncio.open_connection(self.host, self.port, ssl=ssl_context, server_hostname=self.host)
+        return await asyncio.open_connection(self.host, self.port)
+
+    def release(self, conn: tuple[asyncio.StreamReader, asyncio.StreamWriter], reusable: bool) -> None:
+        if reusable:
+            self.idle.append(conn)
+        else:
+            conn[1].close()
+
+    def close(self) -> None:
+        for _, writer in self.idle:
+            writer.close()
+        self.idle = []
+
+
+class HealthChecker:
+    """以共用連線池並行檢查多個 target。"""
+
+    def __init__(self, concurrency: int, per_host: int, timeout: float) -> None:
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.per_host = per_host
+        self.timeout = timeout
+        self.ssl_context = ssl.create_default_context()
+        self.pools: dict[tuple[str, str, int], HostPool] = {}
+
+    def pool_for(self, scheme: str, host: str, port: int) -> HostPool:
+        key = (scheme, host, port)
+        pool = self.pools.get(key)
+        if pool is None:
+            pool = self.pools[key] = HostPool(scheme, host, port, self.per_host)
+        return pool
+
+    def close(self) -> None:
+        for pool in self.pools.values():
+            pool.close()
+
+    async def request(self, method: str, url: str) -> tuple[int, dict[str, str]]:
+        """送出單一請求，回傳 (狀態碼, 小寫標頭)。不跟隨轉址。"""
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ProbeError(f"不支援的網址：{url}")
+        host = parts.hostname.encode("idna").decode("ascii")
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        target = quote(parts.path or "/", safe=_URL_SAFE)
+        if parts.query:
+            target += "?" + quote(parts.query, safe=_URL_SAFE)
+        host_header = host if parts.port is None else f"{host}:{port}"
+        request = (
+            f"{method} {target} HTTP/1.1\r\n"
+            f"Host: {host_header}\r\n"
+            f"User-Agent: {USER_AGENT}\r\n"
+            "Accept: */*\r\n"
+            "Connection: keep-alive\r\n"
+            "\r\n"
+        ).encode("ascii")
+
+        pool = self.pool_for(parts.scheme, host, port)
+        async with pool.semaphore:
+            # 池中連線可能已被對方關閉（keep-alive 逾時），失敗時換新連線重試一次
+            for attempt in (0, 1):
+                reused = bool(pool.idle) and attempt == 0
+                try:
+                    conn = pool.idle.pop() if reused else await asyncio.wait_for(pool.open(self.ssl_context), self.timeout)
+                except (OSError, asyncio.TimeoutError, ssl.SSLError) as e:
+                    raise ProbeError(f"連線失敗：{e or type(e).__name__}") from e
+                try:
+                    status, headers, reusable = await asyncio.wait_for(
+                        self._exchange(conn, request, method), self.timeout
+                    )
+                except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ProbeError) as e:
+                    conn[1].close()
+                    if reused:
+                        continue
+                    if isinstance(e, ProbeError):
+                        raise
+                    raise ProbeError(f"請求失敗：{e or type(e).__name__}") from e
+                pool.release(conn, reusable)
+                return status, headers
+        raise ProbeError("請求失敗")
+
+    @staticmethod
+    async def _exchange(conn, request: bytes, method: str) -> tuple[int, dict[str, str], bool]:
+        reader, writer = conn
+        writer.write(request)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise asyncio.IncompleteReadError(b"", None)
+        fields = status_line.decode("latin-1").split(None, 2)
+        if len(fields) < 2 or not fields[0].startswith("HTTP/") or not fields[1].isdigit():
+            raise ProbeError(f"回應格式錯誤：{status_line[:80]!r}")
+        version, status = fields[0], int(fields[1])
+
+        headers: dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n"):
+                break
+            if not line:
+                raise asyncio.IncompleteReadError(b"", None)
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        # HEAD 沒有 body，HTTP/1.1 且對方沒要求關閉就能重用；GET 不讀 body，
+        # 連線直接丟棄
+        reusable = (
+            method == "HEAD"
+            and version == "HTTP/1.1"
+            and headers.get("connection", "").lower() != "close"
+        )
+        return status, headers, reusable
+
+    async def probe(self, url: str) -> dict:
+        """跟隨轉址鏈檢查單一 target，回傳結果 dict（可直接寫入快取）。"""
+        hops: list[dict] = []
+        seen: set[str] = set()
+        error: str | None = None
+        current = url
+        t_start = time.perf_counter()
+        async with self.semaphore:
+            while True:
+                if current in seen:
+                    error = "轉址迴圈"
+                    break
+                if len(hops) > MAX_REDIRECTS:
+                    error = f"轉址超過 {MAX_REDIRECTS} 次"
+                    break
+                seen.add(current)
+                t0 = time.perf_counter()
+                try:
+                    status, headers = await self.request("HEAD", current)
+                    if status >= 400:
+                        status, headers = await self.request("GET", current)
+                except ProbeError as e:
+                    error = str(e)
+                    hops.append({"url": current, "status": None, "ms": round((time.perf_counter() - t0) * 1000)})
+                    break
+                hops.append({"url": current, "status": status, "ms": round((time.perf_counter() - t0) * 1000)})
+                location = headers.get("location")
+                if status not in REDIRECT_STATUSES or not location:
+                    break
+                # Location 可能是未編碼的 UTF-8，標頭以 latin-1 讀入後還原
+                location = location.encode("latin-1").decode("utf-8", errors="replace")
+                current = urljoin(current, location)
+
+        final = hops[-1] if hops else {"url": url, "status": None}
+        return {
+            "target": url,
+            "final_url": final["url"],
+            "status": final["status"],
+            "redirects": max(len(hops) - 1, 0),
+            "latency_ms": round((time.perf_counter() - t_start) * 1000),
+            "hops": hops,
+            "error": error,
+            "checked_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }
+
+
+def classify(result: dict, slow_ms: int, hop_threshold: int) -> list[str]:
+    flags: list[str] = []
+    if result["error"] or result["status"] is None or result["status"] >= 400:
+        flags.append(STATUS_DEAD)
+    if result["latency_ms"] > slow_ms:
+        flags.append(STATUS_SLOW)
+    if result["redirects"] >= hop_threshold:
+        flags.append(STATUS_HOPS)
+    return flags or [STATUS_OK]
+
+
+def load_cache(cache_path: Path) -> dict:
+    try:
+        with cache_path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get("version") != CACHE_VERSION or not isinstance(data.get("entries"), dict):
+        return {}
+    return data["entries"]
+
+
+def save_cache(cache_path: Path, entries: dict) -> None:
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+    tmp_path.write_text(
+        json.dumps({"version": CACHE_VERSION, "entries": entries}, ensure_ascii=False) + "\n",
+        encoding="utf-8",
+        newline="\n",
+    )
+    tmp_path.replace(cache_path)
+
+
+def is_fresh(entry: dict, ttl_hours: float, now: datetime) -> bool:
+    """快取項目是否仍可沿用：TTL 內且上次檢查成功（失敗的每次都重查）。"""
+    if entry.get("error") or not isinstance(entry.get("status"), int) or entry["status"] >= 400:
+        return False
+    try:
+        checked = datetime.strptime(entry["checked_at"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+    except (KeyError, TypeError, ValueError):
+        return False
+    return (now - checked).total_seconds() < ttl_hours * 3600
+
+
+async def check_all(targets: list[str], args: argparse.Namespace) -> list[dict]:
+    checker = HealthChecker(args.concurrency, args.per_host, args.timeout)
+    try:
+        return await asyncio.gather(*(checker.probe(t) for t in targets))
+    finally:
+        checker.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="redirects.csv 轉址目標健康檢查")
+    default_script_dir = Path(__file__).resolve().parent
+    parser.add_argument("urls", nargs="*", help="只檢查指定網址（不讀 CSV）")
+    parser.add_argument(
+        "--csv",
+        type=Path,
+        default=default_script_dir / "redirects.csv",
+        help="redirects.csv 路徑",
+    )
+    parser.add_argument(
+        "--cache",
+        type=Path,
+        default=default_script_dir.parent / ".cache" / "target_health.json",
+        help="結果快取路徑",
+    )
+    parser.add_argument("--concurrency", type=int, default=16, help="全體同時進行的檢查數（預設 16）")
+    parser.add_argument("--per-host", type=int, default=4, help="單一主機同時連線數上限（預設 4）")
+    parser.add_argument("--timeout", type=float, default=10.0, help="單一請求逾時秒數（預設 10）")
+    parser.add_argument("--ttl", type=float, default=24.0, help="快取有效時數（預設 24）")
+    parser.add_argument("--refresh", action="store_true", help="忽略快取，全部重新檢查")
+    parser.add_argument("--slow-ms", type=int, default=2000, help="總耗時超過此毫秒數標為 SLOW（預設 2000）")
+    parser.add_argument("--hop-threshold", type=int, default=2, help="轉址次數達此值標為 HOPS（預設 2）")
+    parser.add_argument("--json", type=Path, help="另存完整結果（含轉址鏈）為 JSON")
+    add_profiling_arguments(parser)
+    args = parser.parse_args()
+    enable_profiling(args)
+
+    if args.urls:
+        targets = list(dict.fromkeys(args.urls))
+        paths_by_target: dict[str, list[str]] = {}
+    else:
+        try:
+            with phase("load_csv"):
+                rows = load_csv_rows(args.csv.resolve())
+        except ValidationError as e:
+            print(f"[ERROR] {e}", file=sys.stderr)
+            return 1
+        paths_by_target = defaultdict(list)
+        for row in rows:
+            paths_by_target[row.target].append(row.path)
+        targets = list(paths_by_target)
+
+    cache_path: Path = args.cache.resolve()
+    with phase("cache_load"):
+        entries = {} if args.refresh else load_cache(cache_path)
+    now = datetime.now(timezone.utc)
+    stale = [t for t in targets if not (t in entries and is_fresh(entries[t], args.ttl, now))]
+
+    print(f"共 {len(targets)} 個 target，快取沿用 {len(targets) - len(stale)} 個，本次檢查 {len(stale)} 個")
+    count("targets", len(targets))
+    count("cache_hits", len(targets) - len(stale))
+    t0 = time.perf_counter()
+    with phase("check"):
+        for result in asyncio.run(check_all(stale, args)) if stale else []:
+            entries[result["target"]] = result
+    if stale:
+        print(f"檢查耗時 {time.perf_counter() - t0:.2f}s")
+        with phase("cache_save"):
+            save_cache(cache_path, entries)
+    print()
+
+    report = []
+    dead = 0
+    print(f"{'狀態':<12}{'ms':>7} {'跳':>2}  TARGET")
+    print("-" * 70)
+    for target in targets:
+        result = entries[target]
+        flags = classify(result, args.slow_ms, args.hop_threshold)
+        dead += STATUS_DEAD in flags
+        label = "/".join(flags)
+        line = f"{label:<12}{result['latency_ms']:>7} {result['redirects']:>2}  {target}"
+        if paths_by_target.get(target):
+            line += f"  (path: {', '.join(paths_by_target[target])})"
+        print(line)
+        if result["error"]:
+            print(f"{'':<24}錯誤：{result['error']}")
+        elif STATUS_HOPS in flags:
+            print(f"{'':<24}建議改指向最終網址：{result['final_url']}")
+        report.append(dict(result, flags=flags, paths=paths_by_target.get(target, [])))
+    print("-" * 70)
+    counts = {flag: sum(flag in r["flags"] for r in report) for flag in (STATUS_OK, STATUS_DEAD, STATUS_SLOW, STATUS_HOPS)}
+    print("總結：" + " / ".join(f"{n} {flag}" for flag, n in counts.items()))
+
+    if args.json is not None:
+        args.json.write_text(json.dumps(report, ensure_ascii=False, indent=2) + "\n", encoding="utf-8", newline="\n")
+        print(f"[WRITE] {args.json}")
+
+    return 1 if dead else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+expire_index.py — 全站 @hdh-expire 標記索引（增量維護）
+
+用途：
+    把「哪些頁面帶有哪些限時片段/標記」預先整理成索引檔
+    expire_index.json（已列入 .gitignore，屬於本機快取），之後的
+    「這週有什麼要到期」「某個 item 在哪些頁」查詢，以及
+    sweep_expired.py --use-index 的過期清理，都只需查索引，不必每次
+    重新讀全站 300 多個大型 HTML。
+
+    索引以每頁 (mtime_ns, size, sha256) 為鍵增量更新：mtime/size 未變
+    直接沿用；有變時才讀檔比對內容雜湊，雜湊也相同就只更新 mtime，
+    真正變動的頁面才重新解析（解析規則與 sweep_expired.py 共用
+    _fragments.find_expire_markers）。
+
+索引格式（pages 以頁面檔名為鍵）：
+    {
+      "version": 1,
+      "pages": {
+        "週報-w50.html": {
+          "mtime_ns": ..., "size": ..., "sha256": "...",
+          "markers": [
+            {"item": "aug-enroll", "date": "2026-08-16", "type": "...",
+             "onexpire": "...", "offset": 183000,
+             "block": [183000, 196000], "root": "annc", "warning": null}
+          ]
+        }
+      }
+    }
+    offset / block 均為 UTF-8 位元組位移；block 為 null 表示不是可整塊
+    移除的片段（需人工處理）。頁面不是合法 UTF-8 時不解析標記（換成
+    替代字元後位移會全部錯開），該頁改記 "error": "說明"、"markers": []，
+    由本工具與 sweep_expired.py --use-index 列出。
+
+用法：
+    python expire_index.py                       # 更新索引並列出摘要
+    python expire_index.py --expiring-within 7   # 7 天內（含今天）到期
+    python expire_index.py --expired             # 已過期
+    python expire_index.py --item aug-enroll     # 指定 item 所在頁面
+    [--today YYYY-MM-DD] [--repo-root PATH] [--index PATH]
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import sys
+from collections import defaultdict
+from datetime import date, timedelta
+from pathlib import Path
+
+from _common import (
+    PAGES_ROOT,
+    add_bytes,
+    add_profiling_arguments,
+    count,
+    enable_profiling,
+    list_pages,
+    phase,
+    reconfigure_utf8_streams,
+)
+from _fragments import EXPIRE_TAG, find_expire_markers, parse_expire_date
+
+reconfigure_utf8_streams()
+
+INDEX_VERSION = 2
+
+
+def _byte_offsets(text: str, char_offsets: list[int]) -> dict[int, int]:
+    """把字元位移換算成 UTF-8 位元組位移；依序逐段編碼，全文只編碼一次。"""
+    result: dict[int, int] = {}
+    pos = 0
+    nbytes = 0
+    for off in sorted(set(char_offsets)):
+        nbytes += len(text[pos:off].encode("utf-8"))
+        pos = off
+        result[off] = nbytes
+    return result
+
+
+def index_page_markers(text: str) -> list[dict]:
+    markers = find_expire_markers(text) if EXPIRE_TAG in text else []
+    offsets = [m.offset for m in markers]
+    offsets += [pos for m in markers if m.block for pos in (m.block.start, m.block.end)]
+    to_bytes = _byte_offsets(text, offsets)
+    return [
+        {
+            "item": m.item,
+            "date": m.attrs.get("date"),
+            "type": m.attrs.get("type"),
+            "onexpire": m.attrs.get("onexpire"),
+            "offset": to_bytes[m.offset],
+            "block": [to_bytes[m.block.start], to_bytes[m.block.end]] if m.block else None,
+            "root": m.block.root if m.block else None,
+            "warning": m.warning,
+        }
+        for m in markers
+    ]
+
+
+def load_index(index_path: Path) -> dict:
+    try:
+        with index_path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {"version": INDEX_VERSION, "pages": {}}
+    if not isinstance(data, dict) or data.get("version") != INDEX_VERSION or not isinstance(data.get("pages"), dict):
+        return {"version": INDEX_VERSION, "pages": {}}
+    return data
+
+
+def update_index(repo_root: Path, index_path: Path) -> tuple[dict, int]:
+    """
+    增量更新索引並寫回，回傳 (索引, 重新解析的頁數)。
+    已不存在的頁面會從索引剔除。
+    """
+    index = load_index(index_path)
+    old_pages: dict = index["pages"]
+    pages: dict = {}
+    reparsed = 0
+    dirty = False
+
+    # 與 sweep_expired.py 相同範圍（PAGES_ROOT）
+    for name in list_pages(repo_root, PAGES_ROOT):
+        page = repo_root / name
+        st = page.stat()
+        entry = old_pages.get(page.name)
+        if entry and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+            pages[page.name] = entry
+            count("index_stat_hits")
+            continue
+
+        data = page.read_bytes()
+        add_bytes(read=len(data))
+        digest = hashlib.sha256(data).hexdigest()
+        dirty = True
+        if entry and entry["sha256"] == digest:
+            entry["mtime_ns"] = st.st_mtime_ns
+            pages[page.name] = entry
+            continue
+
+        reparsed += 1
+        count("index_reparsed")
+        entry = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "sha256": digest}
+        # 與 sweep_expired.py 一樣嚴格解碼：errors="replace" 會讓之後的位元組
+        # 位移全部錯開，寧可不收錄這頁的標記也不寫入錯誤的 offset / block
+        try:
+            entry["markers"] = index_page_markers(data.decode("utf-8"))
+        except UnicodeDecodeError as e:
+            entry["markers"] = []
+            entry["error"] = f"無法以 UTF-8 解碼（位元組 {e.start}）"
+            count("index_decode_errors")
+        pages[page.name] = entry
+
+    if dirty or set(pages) != set(old_pages):
+        index = {"version": INDEX_VERSION, "pages": pages}
+        tmp_path = index_path.with_name(index_path.name + ".tmp")
+        data = (json.dumps(index, ensure_ascii=False) + "\n").encode("utf-8")
+        tmp_path.write_bytes(data)
+        add_bytes(written=len(data))
+        tmp_path.replace(index_path)
+    return {"version": INDEX_VERSION, "pages": pages}, reparsed
+
+
+def iter_markers(index: dict):
+    """依 (頁面, 標記) 逐一產出，頁面依檔名排序。"""
+    for name in sorted(index["pages"]):
+        for marker in index["pages"][name]["markers"]:
+            yield name, marker
+
+
+def index_errors(index: dict) -> list[tuple[str, str]]:
+    """索引中無法解析的頁面與原因（頁面依檔名排序）。"""
+    return [(name, entry["error"]) for name, entry in sorted(index["pages"].items()) if entry.get("error")]
+
+
+def pages_with_expired(index: dict, today: date, items: set[str] | None = None) -> list[str]:
+    """有任何已過期標記（可選限定 item）的頁面檔名清單，供 sweep_expired.py 使用。"""
+    names: set[str] = set()
+    for name, marker in iter_markers(index):
+        if items is not None and marker["item"] not in items:
+            continue
+        expires = parse_expire_date(marker["date"])
+        if expires is None or expires < today:
+            names.add(name)
+    return sorted(names)
+
+
+def marker_matches(args: argparse.Namespace, marker: dict) -> bool:
+    """依查詢參數判斷標記是否列出；沒有指定查詢時全部列出。"""
+    expires = parse_expire_date(marker["date"])
+    if args.expiring_within is not None:
+        until = args.today + timedelta(days=args.expiring_within - 1)
+        return expires is not None and args.today <= expires <= until
+    if args.expired:
+        return expires is not None and expires < args.today
+    if args.item:
+        return marker["item"] == args.item
+    return True
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="全站 @hdh-expire 標記索引")
+    default_script_dir = Path(__file__).resolve().parent
+    parser.add_argument(
+        "--repo-root",
+        type=Path,
+        default=default_script_dir.parent,
+        help="repo 根目錄（預設為本腳本所在目錄的上一層）",
+    )
+    parser.add_argument(
+        "--index",
+        type=Path,
+        default=default_script_dir / "expire_index.json",
+        help="索引檔路徑",
+    )
+    parser.add_argument(
+        "--today",
+        type=date.fromisoformat,
+        default=date.today(),
+        help="視為今天的日期（YYYY-MM-DD）",
+    )
+    query = parser.add_mutually_exclusive_group()
+    query.add_argument("--expiring-within", type=int, metavar="DAYS", help="列出 DAYS 天內（含今天）到期的標記")
+    query.add_argument("--expired", action="store_true", help="列出已過期的標記")
+    query.add_argument("--item", help="列出指定 item 所在的頁面")
+    add_profiling_arguments(parser)
+    args = parser.parse_args()
+    enable_profiling(args)
+
+    repo_root: Path = args.repo_root.resolve()
+    with phase("update_index"):
+        index, reparsed = update_index(repo_root, args.index.resolve())
+    print(f"索引：{len(index['pages'])} 頁，本次重新解析 {reparsed} 頁")
+    errors = index_errors(index)
+    for name, error in errors:
+        print(f"[WARN] {name}：{error}，未收錄此頁的標記", file=sys.stderr)
+
+    is_query = args.expiring_within is not None or args.expired or bool(args.item)
+    by_item: dict[tuple[str, str], list[str]] = defaultdict(list)
+    for name, marker in iter_markers(index):
+        if marker_matches(args, marker):
+            by_item[(marker["date"] or "", marker["item"])].append(name)
+
+    for (expires, item), names in sorted(by_item.items()):
+        print(f"  {expires} item={item} pages={len(names)}")
+        if is_query:
+            for name in names:
+                print(f"    {name}")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
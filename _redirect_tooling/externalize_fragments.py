@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+externalize_fragments.py — 把全站注入片段內重複的 <style> / <script> 抽成共用快取檔
+
+用途：
+    公告彈窗、訂閱彈窗、頁尾、吉祥物四個 hdh-*-root 片段（見 _fragments.py）
+    每頁都內嵌一份完全相同的 CSS 與 JS（合計約 40 KB），每換一頁就重新
+    下載一次。本腳本在每個片段的雙錨點範圍內找出內嵌的 <style> 與
+    <script>（不含 src），內容逐位元組相同、出現在至少 --min-pages 頁者
+    寫成共用檔，頁面改為引用：
+
+        <style>...</style>    → <link rel="stylesheet" href="__system/__css/h_<md5>/hdh-<名稱>.css">
+        <script>...</script>  → <script src="__system/__js/h_<md5>/hdh-<名稱>.js"></script>
+
+    引用標籤留在原位置（仍在 <div id="hdh-XXX-root"> 與片段結束 marker
+    之間）：同步 <script src> 與原本的內嵌 script 執行時機相同；
+    sweep_expired.py / 一次性移除腳本移除片段時會連同引用一起拿掉。
+    檔名含內容 md5，片段改版（inject_fragment.py）後重跑會產生新檔，
+    不會被瀏覽器舊快取擋住。
+
+    CSS 內的相對 url() 改寫成網站根目錄絕對路徑（頁面都在根目錄）。
+    type 不是 JavaScript / CSS 的區塊（例如 JSON-LD）不處理。
+
+用法：
+    python externalize_fragments.py [--repo-root PATH] [--min-pages N]
+                                    [--jobs N] [--dry-run]
+
+寫入：
+    共用檔與改寫過的頁面經 _common.AtomicBatchWriter 同一批交易式寫入；
+    頁面需通過 _fragments.check_page_intact，任一頁失敗整批還原。重跑時
+    已外部化的頁面沒有內嵌區塊可抽，不會再有任何改動。
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+
+from _common import (
+    PAGES_ROOT,
+    AtomicBatchWriter,
+    BatchWriteError,
+    add_bytes,
+    add_profiling_arguments,
+    count,
+    enable_profiling,
+    list_pages,
+    phase,
+    rebase_urls,
+    reconfigure_utf8_streams,
+)
+from _fragments import check_page_intact, find_fragment_roots, locate_fragment
+
+reconfigure_utf8_streams()
+
+CSS_ROOT = "__system/__css"
+JS_ROOT = "__system/__js"
+
+CHUNK_SIZE = 4
+
+INLINE_BLOCK_PATTERN = re.compile(
+    r"""<(?P<tag>style|script)(?P<attrs>(?:\s+type=["']text/(?:css|javascript)["'])?)\s*>(?P<body>.*?)</(?P=tag)>""",
+    re.DOTALL | re.IGNORECASE,
+)
+ROOT_NAME_PATTERN = re.compile(r'id="hdh-([a-z0-9]+)-root"')
+
+
+class InlineBlock(NamedTuple):
+    """片段內的一個內嵌區塊：text[start:end] 為整個 <style>/<script> 標籤。"""
+
+    root: str
+    kind: str  # "css" / "js"
+    digest: str
+    start: int
+    end: int
+    nbytes: int  # 整個標籤的 UTF-8 位元組數
+
+
+def find_inline_blocks(text: str) -> tuple[list[InlineBlock], dict[str, str], list[str]]:
+    """
+    回傳 (內嵌區塊, digest → 內容, 略過說明)。只看各 hdh-*-root 片段
+    範圍內的區塊；無法安全定位的 root（例如沒有自己結束 marker 的頁面
+    內容區塊 hdh-faq-root）整個略過。
+    """
+    blocks: list[InlineBlock] = []
+    bodies: dict[str, str] = {}
+    warnings: list[str] = []
+    roots = {ROOT_NAME_PATTERN.search(text, pos).group(1) for pos in find_fragment_roots(text)}
+    for root in sorted(roots):
+        found = locate_fragment(text, root)
+        if isinstance(found, str):
+            warnings.append(f"hdh-{root}-root：{found}")
+            continue
+        start, end, _ = found
+        for m in INLINE_BLOCK_PATTERN.finditer(text, start, end):
+            body = m.group("body")
+            if not body.strip():
+                continue
+            kind = "css" if m.group("tag").lower() == "style" else "js"
+            digest = hashlib.md5(body.encode("utf-8")).hexdigest()
+            nbytes = len(m.group(0).encode("utf-8"))
+            blocks.append(InlineBlock(root, kind, digest, m.start(), m.end(), nbytes))
+            bodies[digest] = body
+    return blocks, bodies, warnings
+
+
+def scan_page(page_path: str) -> tuple[str, list[InlineBlock], dict[str, str], list[str], int]:
+    """單頁掃描（在 worker process 內執行）。"""
+    data = Path(page_path).read_bytes()
+    blocks, bodies, warnings = find_inline_blocks(data.decode("utf-8"))
+    return page_path, blocks, bodies, warnings, len(data)
+
+
+def shared_asset(block: InlineBlock, body: str) -> tuple[str, bytes, str]:
+    """共用檔 (repo 相對路徑, 內容, 取代原區塊的引用標籤)。"""
+    if block.kind == "css":
+        data = rebase_urls(body, "").encode("utf-8")
+        path = f"{CSS_ROOT}/h_{hashlib.md5(data).hexdigest()}/hdh-{block.root}.css"
+        return path, data, f'<link rel="stylesheet" href="{path}">'
+    data = body.encode("utf-8")
+    path = f"{JS_ROOT}/h_{hashlib.md5(data).hexdigest()}/hdh-{block.root}.js"
+    return path, data, f'<script src="{path}"></script>'
+
+
+def replace_blocks(text: str, blocks: list[InlineBlock], tags: dict[str, str]) -> str:
+    parts: list[str] = []
+    pos = 0
+    for block in sorted(blocks, key=lambda b: b.start):
+        parts.append(text[pos:block.start])
+        parts.append(tags[block.digest])
+        pos = block.end
+    parts.append(text[pos:])
+    return "".join(parts)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="把全站注入片段內重複的 <style>/<script> 抽成共用快取檔")
+    default_script_dir = Path(__file__).resolve().parent
+    parser.add_argument(
+        "--repo-root",
+        type=Path,
+        default=default_script_dir.parent,
+        help="repo 根目錄（預設為本腳本所在目錄的上一層）",
+    )
+    parser.add_argument(
+        "--min-pages",
+        type=int,
+        default=5,
+        help="同一區塊至少出現在幾頁才抽成共用檔（預設 5）",
+    )
+    parser.add_argument("--jobs", "-j", type=int, default=0, help="平行 process 數（0 = CPU 核心數）")
+    parser.add_argument("--dry-run", action="store_true", help="只輸出報告，不寫入任何檔案")
+    add_profiling_arguments(parser)
+    args = parser.parse_args()
+    enable_profiling(args)
+
+    repo_root: Path = args.repo_root.resolve()
+    pages = [str(repo_root / name) for name in list_pages(repo_root, PAGES_ROOT)]
+
+    page_blocks: dict[str, list[InlineBlock]] = {}
+    bodies: dict[str, str] = {}
+    pages_by_digest: dict[str, set[str]] = {}
+    warnings: list[tuple[str, str]] = []
+    with phase("scan"), ProcessPoolExecutor(max_workers=args.jobs if args.jobs > 0 else None) as executor:
+        for page_path, blocks, page_bodies, page_warnings, size in executor.map(scan_page, pages, chunksize=CHUNK_SIZE):
+            add_bytes(read=size)
+            count("pages_scanned")
+            warnings.extend((Path(page_path).name, w) for w in page_warnings)
+            if not blocks:
+                continue
+            page_blocks[page_path] = blocks
+            for digest, body in page_bodies.items():
+                bodies.setdefault(digest, body)
+            for block in blocks:
+                pages_by_digest.setdefault(block.digest, set()).add(page_path)
+
+    shared = {d for d, p in pages_by_digest.items() if len(p) >= args.min_pages}
+    assets: dict[str, tuple[str, bytes, str]] = {}
+    for blocks in page_blocks.values():
+        for block in blocks:
+            if block.digest in shared and block.digest not in assets:
+                assets[block.digest] = shared_asset(block, bodies[block.digest])
+    tags = {digest: tag for digest, (_, _, tag) in assets.items()}
+
+    print(f"頁面 {len(pages)} 個，片段內嵌區塊 {sum(len(b) for b in page_blocks.values())} 個"
+          f"（相異內容 {len(pages_by_digest)} 種）")
+    print()
+    print(f"{'共用檔':<64}{'頁數':>6}{'大小':>10}")
+    print("-" * 82)
+    for digest, (path, data, _) in sorted(assets.items(), key=lambda kv: kv[1][0]):
+        print(f"{path:<66}{len(pages_by_digest[digest]):>6}{len(data) / 1024:>8.1f} KB")
+
+    saved: dict[str, int] = {}
+    for page_path, blocks in page_blocks.items():
+        moved = [b for b in blocks if b.digest in shared]
+        if moved:
+            saved[page_path] = sum(b.nbytes - len(tags[b.digest].encode("utf-8")) for b in moved)
+    print()
+    if saved:
+        total = sum(saved.values())
+        print(f"改寫頁面 {len(saved)} 個；每頁 HTML 平均少 {total / len(saved) / 1024:.1f} KB"
+              f"（全站合計 {total / 1048576:.1f} MB），共用檔一次下載 "
+              f"{sum(len(d) for _, d, _ in assets.values()) / 1024:.1f} KB 後由瀏覽器快取")
+    else:
+        print("沒有需要外部化的內嵌區塊")
+    for name, note in warnings:
+        print(f"  [SKIP] {name}：{note}")
+
+    if args.dry_run or not saved:
+        if args.dry_run:
+            print("[DRY-RUN] 未寫入任何檔案")
+        return 0
+
+    try:
+        with phase("write"), AtomicBatchWriter() as writer:
+            for path, data, _ in assets.values():
+                target = repo_root / path
+                if not (target.exists() and target.read_bytes() == data):
+                    writer.stage(target, data)
+            for page_path in sorted(saved):
+                path = Path(page_path)
+                raw = path.read_bytes()
+                add_bytes(read=len(raw))
+                text = raw.decode("utf-8")
+                # 重新定位（不沿用掃描時的位移），確保改寫的是目前檔案內容
+                blocks, _, _ = find_inline_blocks(text)
+                moved = [b for b in blocks if b.digest in shared]
+                data = replace_blocks(text, moved, tags).encode("utf-8")
+                error = check_page_intact(path, data)
+                if error:
+                    raise BatchWriteError(f"{path.name}：{error}")
+                writer.stage(path, data)
+    except BatchWriteError as e:
+        print(f"[ERROR] {e}（整批未寫入）", file=sys.stderr)
+        return 1
+
+    print(f"[APPLIED] 共用檔 {len(assets)} 個，改寫頁面 {len(saved)} 個")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
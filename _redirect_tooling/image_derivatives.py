@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+image_derivatives.py — 為頁面引用的 _imagecache 圖片產生縮圖並改寫引用
+
+背景：
+    網站產生器的縮圖慣例是把圖片放在同一個 _imagecache 底下的
+    P=MW800,MH800,F,BFFFFFF/ 子資料夾（最大寬高 800、等比縮放、透明處
+    以白色 FFFFFF 填底），頁面以百分比編碼的
+    _imagecache/P%3DMW800%2CMH800%2CF%2CBFFFFFF/<檔名> 引用
+    （scripts/check_html_quality.py 的 F26 輪播圖規則即檢查此前綴）。
+    目前這類縮圖都是手動產生，大部分頁面仍直接引用原始解析度的圖片。
+
+做法：
+    1. 掃描全站頁面的 src / data-lazy，收集指向任一 _imagecache 底下
+       .jpg / .jpeg / .png 的引用。已改引用本規格縮圖者對應回來源圖片，
+       頁面不再改寫，但來源換過圖時縮圖會重新產生（見下方快取）。
+    2. 以 ProcessPoolExecutor 平行產生縮圖：依 EXIF 方向轉正、等比縮到
+       --max-size 以內（只縮不放）、透明處以白色填底；--webp 時改存
+       <原檔名>.webp。縮圖不比原圖小者不採用。
+    3. 縮圖寫到 <...>/_imagecache/P=MW<n>,MH<n>,F,BFFFFFF/<原相對路徑>，
+       頁面引用改指向縮圖（原本有百分比編碼者，新增的資料夾名稱也一樣
+       編碼）。
+
+快取（.cache/image_derivatives.json，已列入 .gitignore）：
+    記錄每個縮圖的來源內容 sha256、縮圖 sha256 與參數；來源與參數都沒變、
+    縮圖檔也還在且內容相符者不重新編碼。「不比原圖小」的結果也會記錄，
+    下次同樣略過。頁面已引用的縮圖沒有快取紀錄時（快取被清掉），重新
+    編碼結果相同才接手；不同者視為手動產生的縮圖，記為 manual、不覆寫。
+
+相依套件：
+    需要 Pillow（pip install Pillow）；本 repo 其他工具都不需要，所以
+    Pillow 只在執行本腳本時才載入，未安裝時會提示後結束。
+
+用法：
+    python image_derivatives.py [--repo-root PATH] [--max-size N] [--webp]
+                                [--jobs N] [--dry-run]
+
+寫入：
+    縮圖與改寫後的頁面經 _common.AtomicBatchWriter 同一批交易式寫入
+    （頁面以 _fragments.check_page_intact 驗證），任一步失敗整批還原；
+    快取檔在整批寫入成功後才更新。
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import html
+import io
+import json
+import posixpath
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+from urllib.parse import quote, unquote
+
+from _common import (
+    PAGES_SITE,
+    AtomicBatchWriter,
+    BatchWriteError,
+    add_bytes,
+    add_profiling_arguments,
+    count,
+    enable_profiling,
+    list_pages,
+    phase,
+    reconfigure_utf8_streams,
+)
+from _fragments import check_page_intact
+
+reconfigure_utf8_streams()
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow 為選用相依，main() 再提示
+    Image = ImageOps = None
+
+CACHE_VERSION = 1
+IMAGE_CACHE_DIR = "_imagecache"
+SOURCE_SUFFIXES = (".jpg", ".jpeg", ".png")
+BACKGROUND = "FFFFFF"
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+
+REF_ATTR_PATTERN = re.compile(r'(\s(?:src|data-lazy)=")([^"]+)(")')
+
+CHUNK_SIZE = 4
+
+
+class DerivativeSpec(NamedTuple):
+    max_size: int
+    webp: bool
+
+    @property
+    def dir_name(self) -> str:
+        return f"P=MW{self.max_size},MH{self.max_size},F,B{BACKGROUND}"
+
+    @property
+    def key(self) -> str:
+        return self.dir_name + (",WEBP" if self.webp else "")
+
+
+def derivative_rel(source_rel: str, spec: DerivativeSpec) -> str | None:
+    """來源的 repo 相對路徑 → 縮圖路徑；不在 _imagecache 底下或已是縮圖者回傳 None。"""
+    parts = source_rel.split("/")
+    if IMAGE_CACHE_DIR not in parts:
+        return None
+    i = len(parts) - 1 - parts[::-1].index(IMAGE_CACHE_DIR)
+    if i + 1 < len(parts) and parts[i + 1].startswith("P="):
+        return None
+    name = "/".join(parts[i + 1:]) + (".webp" if spec.webp else "")
+    return "/".join(parts[: i + 1] + [spec.dir_name, name])
+
+
+def derivative_source(rel: str, spec: DerivativeSpec) -> str | None:
+    """derivative_rel() 的反函式：本規格的縮圖路徑 → 來源路徑；其他路徑回傳 None。"""
+    parts = rel.split("/")
+    if IMAGE_CACHE_DIR not in parts:
+        return None
+    i = len(parts) - 1 - parts[::-1].index(IMAGE_CACHE_DIR)
+    if i + 2 >= len(parts) or parts[i + 1] != spec.dir_name:
+        return None
+    name = "/".join(parts[i + 2:])
+    if spec.webp:
+        if not name.endswith(".webp"):
+            return None
+        name = name[: -len(".webp")]
+    if not name.lower().endswith(SOURCE_SUFFIXES):
+        return None
+    return "/".join(parts[: i + 1] + [name])
+
+
+def rewrite_ref(ref: str, spec: DerivativeSpec) -> str:
+    """在引用字串的最後一個 _imagecache/ 之後插入縮圖資料夾（沿用原本的編碼方式）。"""
+    marker = IMAGE_CACHE_DIR + "/"
+    i = ref.rfind(marker) + len(marker)
+    dir_name = quote(spec.dir_name, safe="") if "%" in ref else spec.dir_name
+    path, sep, tail = ref[i:].partition("?")
+    new = f"{ref[:i]}{dir_name}/{path}{'.webp' if spec.webp else ''}"
+    return new + sep + tail
+
+
+def resolve_ref(ref: str, page: str) -> str | None:
+    """頁面上的 src / data-lazy 值 → 來源圖片的 repo 相對路徑（非本站圖片回傳 None）。"""
+    ref = html.unescape(ref)
+    if re.match(r"[a-z]+:|//", ref, re.IGNORECASE):
+        return None
+    path = unquote(ref.split("?", 1)[0].split("#", 1)[0])
+    if not path.lower().endswith(SOURCE_SUFFIXES + (".webp",)) or f"{IMAGE_CACHE_DIR}/" not in path:
+        return None
+    if path.startswith("/"):
+        return posixpath.normpath(path.lstrip("/"))
+    return posixpath.normpath(posixpath.join(posixpath.dirname(page), path))
+
+
+def collect_refs(repo_root: Path, spec: DerivativeSpec) -> tuple[dict[str, set[str]], set[str]]:
+    """
+    回傳 (來源圖片 → 直接引用它的頁面, 頁面已改引用本規格縮圖的來源圖片)。
+    後者不需要再改寫頁面，但來源換過圖時縮圖仍要跟著重新產生。
+    """
+    refs: dict[str, set[str]] = {}
+    derived: set[str] = set()
+    for page in list_pages(repo_root, PAGES_SITE):
+        text = (repo_root / page).read_text(encoding="utf-8", errors="replace")
+        for m in REF_ATTR_PATTERN.finditer(text):
+            path = resolve_ref(m.group(2), page)
+            if not path:
+                continue
+            source = derivative_source(path, spec)
+            if source is not None:
+                if (repo_root / source).is_file():
+                    derived.add(source)
+            elif path.lower().endswith(SOURCE_SUFFIXES) and derivative_rel(path, spec) and (repo_root / path).is_file():
+                refs.setdefault(path, set()).add(page)
+    return refs, derived
+
+
+def make_derivative(args: tuple[str, str, DerivativeSpec]) -> tuple[str, bytes | None, str | None]:
+    """ProcessPoolExecutor 的工作單位：回傳 (來源, 縮圖內容, 錯誤)。"""
+    repo_root, source_rel, spec = args
+    try:
+        with Image.open(Path(repo_root) / source_rel) as im:
+            im = ImageOps.exif_transpose(im)
+            im.thumbnail((spec.max_size, spec.max_size), Image.LANCZOS)
+            if im.mode in ("RGBA", "LA", "P"):
+                im = im.convert("RGBA")
+                background = Image.new("RGB", im.size, f"#{BACKGROUND}")
+                background.paste(im, mask=im.getchannel("A"))
+                im = background
+            elif im.mode != "RGB":
+                im = im.convert("RGB")
+            out = io.BytesIO()
+            if spec.webp:
+                im.save(out, "WEBP", quality=WEBP_QUALITY, method=6)
+            elif source_rel.lower().endswith(".png"):
+                im.save(out, "PNG", optimize=True)
+            else:
+                im.save(out, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    except (OSError, ValueError) as e:
+        return source_rel, None, str(e)
+    return source_rel, out.getvalue(), None
+
+
+def sha256_file(path: Path) -> str | None:
+    try:
+        return hashlib.sha256(path.read_bytes()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def load_cache(path: Path, spec: DerivativeSpec) -> dict:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return {}
+    if data.get("version") != CACHE_VERSION or data.get("spec") != spec.key:
+        return {}
+    return data.get("entries", {})
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="為頁面引用的 _imagecache 圖片產生縮圖並改寫引用")
+    default_script_dir = Path(__file__).resolve().parent
+    parser.add_argument(
+        "--repo-root",
+        type=Path,
+        default=default_script_dir.parent,
+        help="repo 根目錄（預設為本腳本所在目錄的上一層）",
+    )
+    parser.add_argument("--max-size", type=int, default=800, help="縮圖最大寬高（預設 800，即 P=MW800,MH800）")
+    parser.add_argument("--webp", action="store_true", help="縮圖改存 WebP（<原檔名>.webp）")
+    parser.add_argument(
+        "--cache",
+        type=Path,
+        default=None,
+        help="縮圖快取檔（預設 <repo-root>/.cache/image_derivatives.json）",
+    )
+    parser.add_argument("--jobs", "-j", type=int, default=0, help="平行 process 數（0 = CPU 核心數）")
+    parser.add_argument("--dry-run", action="store_true", help="只產生縮圖並報告大小，不寫入任何檔案")
+    add_profiling_arguments(parser)
+    args = parser.parse_args()
+    enable_profiling(args)
+
+    if Image is None:
+        print("[ERROR] 需要 Pillow：pip install Pillow", file=sys.stderr)
+        return 2
+
+    repo_root: Path = args.repo_root.resolve()
+    spec = DerivativeSpec(args.max_size, args.webp)
+    cache_path = (args.cache or repo_root / ".cache" / "image_derivatives.json").resolve()
+    with phase("cache_load"):
+        cache = load_cache(cache_path, spec)
+
+    with phase("collect_refs"):
+        refs, derived = collect_refs(repo_root, spec)
+    sources = sorted(set(refs) | derived)
+    with phase("hash_sources"):
+        source_hashes = {s: sha256_file(repo_root / s) for s in sources}
+
+    current: dict[str, bytes | None] = {}  # 來源 → None 表示不採用縮圖
+    work: list[tuple[str, str, DerivativeSpec]] = []
+    # 頁面已引用縮圖、但快取沒有紀錄者（快取被清掉，或是手動產生的縮圖）：
+    # 重新編碼結果與磁碟上的縮圖相同才接手，不同則不覆寫，並在快取記為
+    # manual（來源與縮圖都沒變時下次直接略過）
+    unrecorded: set[str] = set()
+    for source in sources:
+        target = derivative_rel(source, spec)
+        entry = cache.get(target)
+        if entry and entry.get("source_sha256") == source_hashes[source]:
+            if entry.get("derivative_sha256") is None and source not in derived:
+                current[source] = None
+                continue
+            if sha256_file(repo_root / target) == entry["derivative_sha256"]:
+                current[source] = b""  # 縮圖已是最新，不需要重寫
+                count("cache_hits")
+                continue
+        if source in derived and (not entry or entry.get("manual")):
+            unrecorded.add(source)
+        work.append((str(repo_root), source, spec))
+
+    generated: dict[str, bytes | None] = {}
+    errors: list[tuple[str, str]] = []
+    foreign: list[str] = []
+    if work:
+        with phase("encode"), ProcessPoolExecutor(max_workers=args.jobs if args.jobs > 0 else None) as executor:
+            for source, data, error in executor.map(make_derivative, work, chunksize=CHUNK_SIZE):
+                if error:
+                    errors.append((source, error))
+                    continue
+                original_size = (repo_root / source).stat().st_size
+                count("images_encoded")
+                add_bytes(read=original_size)
+                if source in derived:
+                    # 頁面已引用縮圖：不論大小都要與來源保持一致
+                    target = repo_root / derivative_rel(source, spec)
+                    if source in unrecorded and sha256_file(target) != hashlib.sha256(data).hexdigest():
+                        foreign.append(source)
+                        continue
+                    generated[source] = data
+                else:
+                    generated[source] = data if len(data) < original_size else None
+
+    adopted = {s for s, d in {**current, **generated}.items() if d is not None}
+    before = sum((repo_root / s).stat().st_size for s in adopted)
+    after = sum(
+        len(generated[s]) if s in generated else (repo_root / derivative_rel(s, spec)).stat().st_size
+        for s in adopted
+    )
+    print(f"引用中的 _imagecache 圖片 {len(sources)} 張；本次編碼 {len(work)} 張，快取沿用 {len(current)} 張")
+    print(f"採用縮圖 {len(adopted)} 張：{before / 1048576:.1f} MB → {after / 1048576:.1f} MB"
+          f"；不比原圖小而略過 {sum(1 for d in {**current, **generated}.values() if d is None)} 張")
+    print(f"頁面已引用縮圖 {len(derived)} 張，其中來源有變動而重新產生 "
+          f"{sum(1 for s in generated if s in derived and s not in unrecorded)} 張")
+    for source, error in errors:
+        print(f"  [SKIP] {source}：{error}")
+    for source in foreign:
+        print(f"  [SKIP] {derivative_rel(source, spec)}：沒有快取紀錄且與重新編碼結果不同（可能是手動產生），不覆寫")
+
+    pages = sorted({p for s in adopted for p in refs.get(s, ())})
+    if args.dry_run:
+        print(f"[DRY-RUN] 將改寫頁面 {len(pages)} 個，未寫入任何檔案")
+        return 0
+
+    written = 0
+    try:
+        with phase("write"), AtomicBatchWriter() as writer:
+            for source, data in sorted(generated.items()):
+                target = repo_root / derivative_rel(source, spec)
+                if data is not None and not (target.is_file() and target.read_bytes() == data):
+                    writer.stage(target, data)
+                    written += 1
+            for page in pages:
+                path = repo_root / page
+                raw = path.read_bytes()
+                add_bytes(read=len(raw))
+                text = raw.decode("utf-8")
+
+                def repl(m: re.Match) -> str:
+                    source = resolve_ref(m.group(2), page)
+                    if source not in adopted:
+                        return m.group(0)
+                    return m.group(1) + rewrite_ref(m.group(2), spec) + m.group(3)
+
+                data = REF_ATTR_PATTERN.sub(repl, text).encode("utf-8")
+                error = check_page_intact(path, data)
+                if error:
+                    raise BatchWriteError(f"{page}：{error}")
+                writer.stage(path, data)
+    except BatchWriteError as e:
+        print(f"[ERROR] {e}（整批未寫入）", file=sys.stderr)
+        return 1
+
+    for source, data in generated.items():
+        cache[derivative_rel(source, spec)] = {
+            "source": source,
+            "source_sha256": source_hashes[source],
+            "derivative_sha256": hashlib.sha256(data).hexdigest() if data is not None else None,
+        }
+    for source in foreign:
+        target = derivative_rel(source, spec)
+        cache[target] = {
+            "source": source,
+            "source_sha256": source_hashes[source],
+            "derivative_sha256": sha256_file(repo_root / target),
+            "manual": True,
+        }
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    cache_path.write_text(
+        json.dumps({"version": CACHE_VERSION, "spec": spec.key, "entries": cache}, ensure_ascii=False, indent=2) + "\n",
+        encoding="utf-8",
+        newline="\n",
+    )
+
+    print(f"[APPLIED] 縮圖 {written} 張，改寫頁面 {len(pages)} 個")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
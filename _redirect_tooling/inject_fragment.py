@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+inject_fragment.py — 全站注入片段（hdh-*-root）的批次注入 / 改版
+
+用途：
+    sweep_expired.py 與一次性腳本的 process() 只會「移除」片段；公告、
+    頁尾、吉祥物等片段要改版時，過去只能逐頁手改 332 個大檔。本腳本
+    以一份片段檔為準，一次平行處理全站頁面：
+
+        - 頁面已有同一片段且內容相同 → 不動（不重寫檔案，mtime 不變）
+        - 頁面已有舊版片段 → 整段換成新版
+        - 頁面沒有這個片段 → 預設只列出；加 --insert 才插在 </body> 之前
+
+    定位規則見 _fragments.locate_fragment()：範圍是真正的
+    <div id="hdh-XXX-root"> 到「片段結束」marker 註解結尾（雙錨點），
+    root 或結束 marker 不唯一、範圍內含其他 hdh-*-root 時一律 SKIP-WARN
+    不動。片段上方的說明註解不在範圍內，不會被改動。
+
+片段檔：
+    內容必須從 <div id="hdh-XXX-root"> 開始、以片段結束 marker 註解結束
+    （片段名稱由此判定）。第一次可從現有頁面取出目前版本再修改：
+
+        python inject_fragment.py hdh-footer.html --extract-from 某頁.html --root footer
+
+    CRLF 頁面寫入時自動換成 CRLF，片段檔本身一律以 LF 比對。
+
+用法：
+    python inject_fragment.py FRAGMENT [--repo-root PATH] [--insert]
+                              [--page NAME ...] [--jobs N] [--dry-run]
+
+寫入：
+    改寫過的頁面經 _common.AtomicBatchWriter 交易式寫入（驗證頁面仍以
+    </html> 結尾），任一頁失敗整批還原。重跑同一份片段檔不會再改動任何
+    頁面（冪等）。任一頁出現 SKIP-WARN 時以 exit code 1 結束。
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from _common import (
+    PAGES_ROOT,
+    AtomicBatchWriter,
+    BatchWriteError,
+    add_bytes,
+    add_profiling_arguments,
+    count,
+    enable_profiling,
+    list_pages,
+    phase,
+    reconfigure_utf8_streams,
+)
+from _fragments import check_page_intact, find_fragment_roots, locate_fragment
+
+reconfigure_utf8_streams()
+
+CHUNK_SIZE = 4
+
+UNCHANGED = "unchanged"
+UPDATED = "updated"
+INSERTED = "inserted"
+MISSING = "missing"
+
+
+def load_fragment(path: Path) -> tuple[str, str]:
+    """讀取片段檔，回傳 (片段名稱, 以 LF 換行的片段內容)；格式不符時拋 ValueError。"""
+    text = path.read_text(encoding="utf-8").replace("\r\n", "\n").strip()
+    starts = find_fragment_roots(text)
+    if starts != [0]:
+        raise ValueError(f'{path}：片段檔必須以 <div id="hdh-XXX-root"> 開始，且只含一個 hdh-*-root')
+    root = text[: text.index(">")].split('id="hdh-', 1)[1].split("-root", 1)[0]
+    found = locate_fragment(text, root)
+    if isinstance(found, str) or found is None:
+        raise ValueError(f"{path}：{found}")
+    if found[1] != len(text):
+        raise ValueError(f"{path}：片段檔必須以「片段結束」marker 註解結尾")
+    return root, text
+
+
+def inject_page(task: tuple[str, str, str, bool]) -> tuple[str, str, bytes | None, int]:
+    """
+    單頁處理（在 worker process 內執行），回傳 (頁面路徑, 狀態, 新內容, 讀取位元組)。
+    狀態為 UNCHANGED / UPDATED / INSERTED / MISSING 或 SKIP-WARN 說明；
+    只有 UPDATED / INSERTED 會帶新內容。
+    """
+    page_path, root, fragment, insert = task
+    data = Path(page_path).read_bytes()
+    text = data.decode("utf-8")
+    crlf = text.count("\r\n") * 2 > text.count("\n")
+    if crlf:
+        fragment = fragment.replace("\n", "\r\n")
+
+    found = locate_fragment(text, root)
+    if isinstance(found, str):
+        return page_path, found, None, len(data)
+    if found is not None:
+        start, end, _ = found
+        if text[start:end] == fragment:
+            return page_path, UNCHANGED, None, len(data)
+        return page_path, UPDATED, (text[:start] + fragment + text[end:]).encode("utf-8"), len(data)
+
+    if not insert:
+        return page_path, MISSING, None, len(data)
+    idx = text.rfind("</body>")
+    if idx == -1:
+        return page_path, "SKIP-WARN: 找不到 </body>，無法插入", None, len(data)
+    newline = "\r\n" if crlf else "\n"
+    return page_path, INSERTED, (text[:idx] + fragment + newline + text[idx:]).encode("utf-8"), len(data)
+
+
+def extract_fragment(page: Path, root: str) -> str:
+    """取出頁面中目前版本的片段（LF 換行），供建立片段檔。"""
+    text = page.read_text(encoding="utf-8")
+    found = locate_fragment(text, root)
+    if found is None:
+        raise ValueError(f"{page.name}：沒有 hdh-{root}-root 片段")
+    if isinstance(found, str):
+        raise ValueError(f"{page.name}：{found}")
+    return text[found[0]:found[1]].replace("\r\n", "\n") + "\n"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="以片段檔批次注入 / 改版全站 hdh-*-root 片段")
+    default_script_dir = Path(__file__).resolve().parent
+    parser.add_argument("fragment", type=Path, help="片段檔（<div id=\"hdh-XXX-root\"> ... 片段結束 marker 註解）")
+    parser.add_argument(
+        "--repo-root",
+        type=Path,
+        default=default_script_dir.parent,
+        help="repo 根目錄（預設為本腳本所在目錄的上一層）",
+    )
+    parser.add_argument("--insert", action="store_true", help="沒有這個片段的頁面也插入（放在 </body> 之前）")
+    parser.add_argument(
+        "--page",
+        action="append",
+        dest="pages",
+        metavar="NAME",
+        help="只處理指定頁面（根目錄檔名，可重複指定）",
+    )
+    parser.add_argument("--extract-from", type=Path, metavar="PAGE", help="從此頁取出目前版本寫成片段檔後結束")
+    parser.add_argument("--root", help="--extract-from 要取出的片段名稱（例如 footer）")
+    parser.add_argument("--jobs", "-j", type=int, default=0, help="平行 process 數（0 = CPU 核心數）")
+    parser.add_argument("--dry-run", action="store_true", help="只列出會改動的頁面，不寫入任何檔案")
+    add_profiling_arguments(parser)
+    args = parser.parse_args()
+    enable_profiling(args)
+
+    repo_root: Path = args.repo_root.resolve()
+
+    if args.extract_from is not None:
+        if not args.root:
+            parser.error("--extract-from 需要同時指定 --root")
+        try:
+            text = extract_fragment(args.extract_from, args.root)
+        except ValueError as e:
+            print(f"[ERROR] {e}", file=sys.stderr)
+            return 1
+        args.fragment.write_text(text, encoding="utf-8", newline="\n")
+        print(f"[WRITE] {args.fragment}（hdh-{args.root}-root，{len(text.encode('utf-8'))} bytes）")
+        return 0
+
+    try:
+        root, fragment = load_fragment(args.fragment)
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return 1
+    digest = hashlib.sha256(fragment.encode("utf-8")).hexdigest()
+    print(f"片段 hdh-{root}-root，版本 sha256={digest[:12]}")
+
+    pages = [repo_root / name for name in list_pages(repo_root, PAGES_ROOT)]
+    if args.pages:
+        wanted = set(args.pages)
+        pages = [p for p in pages if p.name in wanted]
+    tasks = [(str(p), root, fragment, args.insert) for p in pages]
+
+    by_status: dict[str, list[str]] = {UNCHANGED: [], UPDATED: [], INSERTED: [], MISSING: []}
+    warnings: list[tuple[str, str]] = []
+    try:
+        with phase("inject"), AtomicBatchWriter(validate=check_page_intact) as writer, \
+                ProcessPoolExecutor(max_workers=args.jobs if args.jobs > 0 else None) as executor:
+            for page_path, status, data, size in executor.map(inject_page, tasks, chunksize=CHUNK_SIZE):
+                add_bytes(read=size)
+                count(status if status in by_status else "warned")
+                name = Path(page_path).name
+                if status not in by_status:
+                    warnings.append((name, status))
+                    continue
+                by_status[status].append(name)
+                if data is not None and not args.dry_run:
+                    writer.stage(Path(page_path), data)
+    except BatchWriteError as e:
+        print(f"[ERROR] {e}（整批未寫入）", file=sys.stderr)
+        return 1
+
+    prefix = "[DRY-RUN] " if args.dry_run else "[APPLIED] "
+    print(f"{prefix}pages={len(pages)} unchanged={len(by_status[UNCHANGED])} updated={len(by_status[UPDATED])} "
+          f"inserted={len(by_status[INSERTED])} missing={len(by_status[MISSING])} warned={len(warnings)}")
+    for status in (UPDATED, INSERTED):
+        for name in by_status[status]:
+            print(f"  [{status.upper()}] {name}")
+    if by_status[MISSING]:
+        print(f"沒有 hdh-{root}-root 的頁面（未插入；需要時加 --insert）：")
+        for name in by_status[MISSING]:
+            print(f"  {name}")
+    for name, note in warnings:
+        print(f"  WARN {name}: {note}")
+    return 1 if warnings else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+pagefind_ignore.py — 全站注入片段與導覽選單標記 data-pagefind-ignore
+
+用途：
+    pagefind/ 索引沒有排除任何區塊：頁尾、訂閱彈窗、公告
+    彈窗、吉祥物四個 hdh-*-root 片段與頂部選單在每一頁都重複出現，
+    同樣的文字被索引了 332 次，撐大訪客搜尋時下載的分片，搜尋結果也
+    常被頁尾文字命中。本腳本在這些區塊的開始標籤加上
+    data-pagefind-ignore（Pagefind 建索引時略過該元素與其子孫）：
+
+        - 注入片段：以 _fragments.locate_fragment() 定位（雙錨點），只有
+          確實是片段的 root 才標記；頁面內容區塊（例如常見問題頁的
+          hdh-faq-root，沒有自己的片段結束 marker）照常索引
+        - 導覽選單：網站編輯器輸出的 <div ... block_type="menu">
+
+    屬性加在開始標籤尾端（<div id="hdh-footer-root" data-pagefind-ignore>），
+    所有以 id="hdh-XXX-root" 定位片段的工具照常運作。已標記的標籤不會
+    重複加（冪等）。
+
+用法：
+    python pagefind_ignore.py [--repo-root PATH] [--jobs N] [--dry-run]
+                              [--pagefind-cmd CMD]
+
+報告：
+    每頁可索引文字量（body 內去掉 script / style / 註解與已忽略區塊後的
+    文字）標記前後的合計，以及 pagefind/ 目前的大小。索引本身要重建才
+    會變小：給 --pagefind-cmd（例如 "npx pagefind"）時，寫入後以
+    `CMD --site <repo-root>` 重建並列出重建後的大小。
+
+寫入：
+    改寫過的頁面經 _common.AtomicBatchWriter 交易式寫入（驗證頁面仍以
+    </html> 結尾），任一頁失敗整批還原。
+
+檢查：
+    scripts/check_html_quality.py 的 pagefind-ignore-* 規則：頁面已有
+    data-pagefind-ignore（已遷移）但某個片段 root 又是未標記版本時報錯
+    （例如用舊的片段檔重新注入），未遷移的頁面不受影響。
+"""
+
+from __future__ import annotations
+
+import argparse
+import html
+import re
+import shlex
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from _common import (
+    PAGES_SITE,
+    AtomicBatchWriter,
+    BatchWriteError,
+    add_bytes,
+    add_profiling_arguments,
+    count,
+    enable_profiling,
+    format_bytes,
+    list_pages,
+    phase,
+    reconfigure_utf8_streams,
+)
+from _fragments import check_page_intact, find_fragment_roots, locate_fragment
+
+reconfigure_utf8_streams()
+
+IGNORE_ATTR = "data-pagefind-ignore"
+INDEX_DIR = "pagefind"
+
+CHUNK_SIZE = 4
+
+ROOT_NAME_PATTERN = re.compile(r'id="hdh-([a-z0-9]+)-root"')
+NAV_TAG_PATTERN = re.compile(r'<div\b[^>]*\bblock_type="menu"[^>]*>')
+
+# 可索引文字估算用
+NON_TEXT_PATTERN = re.compile(r"<!--.*?-->|<(script|style|noscript|template)\b.*?</\1\s*>", re.DOTALL | re.IGNORECASE)
+IGNORED_OPEN_PATTERN = re.compile(rf"<([a-zA-Z][\w-]*)\b[^>]*\s{IGNORE_ATTR}\b[^>]*>")
+TAG_PATTERN = re.compile(r"<[^>]+>")
+
+
+def find_targets(text: str) -> tuple[list[tuple[int, str]], list[str]]:
+    """
+    回傳 (要標記的開始標籤起點與種類, 略過說明)。種類為 hdh-XXX-root 或 nav。
+    """
+    targets: list[tuple[int, str]] = []
+    notes: list[str] = []
+    roots = {ROOT_NAME_PATTERN.search(text, pos).group(1) for pos in find_fragment_roots(text)}
+    for root in sorted(roots):
+        found = locate_fragment(text, root)
+        if isinstance(found, tuple):
+            targets.append((found[0], f"hdh-{root}-root"))
+        else:
+            notes.append(f"hdh-{root}-root：{found}")
+    for m in NAV_TAG_PATTERN.finditer(text):
+        if text.rfind("<!--", 0, m.start()) <= text.rfind("-->", 0, m.start()):
+            targets.append((m.start(), "nav"))
+    return sorted(targets), notes
+
+
+def mark_ignored(text: str, targets: list[tuple[int, str]]) -> tuple[str, dict[str, int]]:
+    """
+    在各開始標籤尾端加上 data-pagefind-ignore（已有者略過）；回傳
+    (新內容, {"fragment": 片段新標記數, "nav": 選單新標記數})。
+    """
+    parts: list[str] = []
+    marked: dict[str, int] = {}
+    pos = 0
+    for start, kind in targets:
+        end = text.index(">", start)
+        if IGNORE_ATTR in text[start:end]:
+            continue
+        parts.append(text[pos:end])
+        parts.append(f" {IGNORE_ATTR}")
+        pos = end
+        key = "nav" if kind == "nav" else "fragment"
+        marked[key] = marked.get(key, 0) + 1
+    parts.append(text[pos:])
+    return "".join(parts), marked
+
+
+def _element_end(text: str, m: re.Match) -> int:
+    """從開始標籤 m 找到對應結束標籤的結尾（同名標籤巢狀計數）；找不到時到文末。"""
+    tag_pattern = re.compile(rf"<(/?){re.escape(m.group(1))}\b[^>]*>", re.IGNORECASE)
+    depth = 1
+    for t in tag_pattern.finditer(text, m.end()):
+        depth += -1 if t.group(1) else 1
+        if depth == 0:
+            return t.end()
+    return len(text)
+
+
+def indexable_text_bytes(text: str) -> int:
+    """估算 Pagefind 會索引的文字量（UTF-8 位元組）。"""
+    body_at = text.find("<body")
+    text = NON_TEXT_PATTERN.sub(" ", text[body_at if body_at != -1 else 0:])
+    parts: list[str] = []
+    pos = 0
+    while True:
+        m = IGNORED_OPEN_PATTERN.search(text, pos)
+        if m is None:
+            break
+        parts.append(text[pos:m.start()])
+        pos = _element_end(text, m)
+    parts.append(text[pos:])
+    words = html.unescape(TAG_PATTERN.sub(" ", "".join(parts))).split()
+    return len(" ".join(words).encode("utf-8"))
+
+
+def process_page(task: tuple[str, str]) -> tuple[str, bytes | None, dict[str, int], int, int, list[str], int]:
+    """
+    單頁處理（在 worker process 內執行），回傳
+    (頁面, 新內容或 None, 各種類新標記數, 標記前文字量, 標記後文字量, 略過說明, 讀取位元組)。
+    """
+    repo_root, page = task
+    data = (Path(repo_root) / page).read_bytes()
+    text = data.decode("utf-8")
+    targets, notes = find_targets(text)
+    new_text, marked = mark_ignored(text, targets)
+
+    before = indexable_text_bytes(text)
+    if not marked:
+        return page, None, marked, before, before, notes, len(data)
+    return page, new_text.encode("utf-8"), marked, before, indexable_text_bytes(new_text), notes, len(data)
+
+
+def dir_size(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="全站注入片段與導覽選單標記 data-pagefind-ignore")
+    default_script_dir = Path(__file__).resolve().parent
+    parser.add_argument(
+        "--repo-root",
+        type=Path,
+        default=default_script_dir.parent,
+        help="repo 根目錄（預設為本腳本所在目錄的上一層）",
+    )
+    parser.add_argument("--jobs", "-j", type=int, default=0, help="平行 process 數（0 = CPU 核心數）")
+    parser.add_argument(
+        "--pagefind-cmd",
+        help='寫入後重建索引的指令（例如 "npx pagefind"，會加上 --site <repo-root>）',
+    )
+    parser.add_argument("--dry-run", action="store_true", help="只輸出報告，不寫入任何檔案")
+    add_profiling_arguments(parser)
+    args = parser.parse_args()
+    enable_profiling(args)
+
+    repo_root: Path = args.repo_root.resolve()
+    tasks = [(str(repo_root), page) for page in list_pages(repo_root, PAGES_SITE)]
+
+    changes: dict[str, bytes] = {}
+    marked_total: dict[str, int] = {"fragment": 0, "nav": 0}
+    text_before = text_after = 0
+    notes: list[tuple[str, str]] = []
+    with phase("scan"), ProcessPoolExecutor(max_workers=args.jobs if args.jobs > 0 else None) as executor:
+        for page, data, marked, before, after, page_notes, size in executor.map(
+            process_page, tasks, chunksize=CHUNK_SIZE
+        ):
+            add_bytes(read=size)
+            count("pages_scanned")
+            text_before += before
+            text_after += after
+            notes.extend((page, n) for n in page_notes)
+            for key, n in marked.items():
+                marked_total[key] += n
+            if data is not None:
+                changes[page] = data
+
+    index_dir = repo_root / INDEX_DIR
+    index_before = dir_size(index_dir) if index_dir.is_dir() else None
+
+    print(f"頁面 {len(tasks)} 個；本次標記 {len(changes)} 頁："
+          f"注入片段 {marked_total['fragment']} 處、導覽選單 {marked_total['nav']} 處")
+    if text_before:
+        print(f"可索引文字量：{format_bytes(text_before)} → {format_bytes(text_after)}"
+              f"（-{(1 - text_after / text_before) * 100:.0f}%）")
+    if index_before is not None:
+        print(f"{INDEX_DIR}/ 目前大小：{format_bytes(index_before)}")
+    for page, note in notes:
+        print(f"  [SKIP] {page}：{note}")
+
+    if args.dry_run or not changes:
+        print("[DRY-RUN] 未寫入任何檔案" if args.dry_run else "所有頁面都已標記，沒有需要改寫的頁面")
+        return 0
+
+    try:
+        with phase("write"), AtomicBatchWriter(validate=check_page_intact) as writer:
+            for page, data in sorted(changes.items()):
+                writer.stage(repo_root / page, data)
+    except BatchWriteError as e:
+        print(f"[ERROR] {e}（整批未寫入）", file=sys.stderr)
+        return 1
+    print(f"[APPLIED] 改寫頁面 {len(changes)} 個")
+
+    if not args.pagefind_cmd:
+        print(f"索引需重建才會變小（例如 npx pagefind --site {repo_root}）")
+        return 0
+    cmd = shlex.split(args.pagefind_cmd) + ["--site", str(repo_root)]
+    try:
+        with phase("pagefind"):
+            subprocess.run(cmd, cwd=repo_root, check=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"[ERROR] 索引重建失敗：{e}", file=sys.stderr)
+        return 1
+    index_after = dir_size(index_dir) if index_dir.is_dir() else 0
+    before_text = format_bytes(index_before) if index_before is not None else "（無）"
+    print(f"{INDEX_DIR}/ 重建後：{before_text} → {format_bytes(index_after)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
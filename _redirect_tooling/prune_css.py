@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+prune_css.py — 依各頁實際 DOM 刪除 combined 樣式表中用不到的規則
+
+背景：
+    每頁 <head> 都以 render-blocking 方式載入自己的
+    __system/__css/h_<hash>/<id>_combined.min.css（平均約 56 KB），內容
+    大多是舊網站產生器帶進來的整套佈景樣式，單一頁面實際用到的只有
+    一小部分。
+
+做法：
+    1. 把樣式表解析成規則樹（@media / @supports 會遞迴處理；@font-face、
+       @keyframes、@import、@charset 等一律原樣保留）。
+    2. 從頁面收集「可能出現」的 token：
+         - HTML 內所有標籤名、class、id
+         - 頁面 inline <script> 與頁面引用的本站 .js 內出現的所有字詞
+           （JS 動態加上的 class，例如 addClass("active")，一定會以字串
+           出現在 JS 裡）
+         - 安全名單（--safelist，預設含 hdh-annc / hdh-nlpop / hdh-mascot
+           片段，彈窗開關時才出現的 class 也算在內）
+    3. 逐一檢查選擇器：去掉 :hover / ::before / :not(...) / [attr] 等後，
+       選擇器要求的每個標籤名、class、id 都在 token 裡才保留。這是
+       「保守」的判斷 —— 只看 token 在不在頁面上，不看 DOM 結構，寧可
+       多留也不誤刪；選擇器清單只剩被保留的那幾個，整條都不要的規則與
+       清空的 @media 一併刪除。
+    4. 精簡後的樣式表寫成 __system/__css/h_<md5>/<id>_pruned.min.css
+       （與原檔同層，樣式表內 ../../../ 的相對 url() 不受影響；內容相同
+       的頁面共用同一個檔），頁面的 <link> 改指向它。
+
+    --critical-kb N：另外以 <body> 開頭 N KB 的 HTML（頁首、導覽列等
+    首屏區塊）為準挑出 critical CSS，內嵌成 <style data-hdh-critical>，
+    並把精簡後的樣式表改成非阻塞載入（media="print" + onload，附
+    <noscript> 後備）。內嵌時相對 url() 會改寫成以網站根目錄為基準的
+    絕對路徑。
+
+用法：
+    python prune_css.py [--repo-root PATH] [--safelist PREFIX ...]
+                        [--critical-kb N] [--jobs N] [--dry-run]
+
+    --dry-run 只輸出精簡前後大小，不寫入任何檔案。已改寫的頁面不再
+    引用 _combined.min.css，重跑不會重複處理。
+
+寫入：
+    精簡後的樣式表與改寫後的頁面經 _common.AtomicBatchWriter 同一批交易式
+    寫入（頁面以 _fragments.check_page_intact 驗證），任一步失敗整批還原。
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import posixpath
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, NamedTuple, Union
+
+from _common import (
+    PAGES_SITE,
+    AtomicBatchWriter,
+    BatchWriteError,
+    add_bytes,
+    add_profiling_arguments,
+    count,
+    enable_profiling,
+    list_pages,
+    phase,
+    rebase_urls,
+    reconfigure_utf8_streams,
+)
+from _fragments import check_page_intact
+
+reconfigure_utf8_streams()
+
+PRUNED_SUFFIX = "_pruned.min.css"
+
+# 由 JS 在執行時才加上 / 開啟的片段，class 與 id 以這些前綴開頭者一律保留
+DEFAULT_SAFELIST = ("hdh-annc", "hdh-nlpop", "hdh-mascot")
+
+LINK_TAG_PATTERN = re.compile(
+    r'<link type="text/css" rel="stylesheet" href="(?P<prefix>(?:\.\./|/)*)'
+    r'(?P<path>__system/__css/h_[0-9a-f]+/[^"/]+)_combined\.min\.css" />'
+)
+LOCAL_SCRIPT_PATTERN = re.compile(r'<script[^>]*\ssrc="(?![a-z]+:|//)([^"?#]+\.js)[^"]*"', re.IGNORECASE)
+INLINE_SCRIPT_PATTERN = re.compile(r"<script\b[^>]*>(.*?)</script>", re.IGNORECASE | re.DOTALL)
+TAG_NAME_PATTERN = re.compile(r"<([a-zA-Z][\w-]*)")
+CLASS_ATTR_PATTERN = re.compile(r"""\sclass\s*=\s*(["'])(.*?)\1""", re.IGNORECASE | re.DOTALL)
+ID_ATTR_PATTERN = re.compile(r"""\sid\s*=\s*(["'])(.*?)\1""", re.IGNORECASE | re.DOTALL)
+WORD_PATTERN = re.compile(r"[A-Za-z_][\w-]*")
+
+CHUNK_SIZE = 4
+
+# ---------------------------------------------------------------------------
+# CSS 解析（只處理規則邊界，不解析宣告內容）
+# ---------------------------------------------------------------------------
+
+_CSS_TOKEN = re.compile(r"""/\*.*?\*/|"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|[{};]""", re.DOTALL)
+# 內含規則、需要遞迴處理的 at-rule；其他 at-rule（@font-face 等）整塊保留
+_NESTING_AT_RULES = ("@media", "@supports", "@document", "@-moz-document")
+
+
+class Rule(NamedTuple):
+    selectors: list[str]
+    body: str
+
+
+class AtBlock(NamedTuple):
+    prelude: str
+    children: list
+
+
+class Raw(NamedTuple):
+    text: str
+
+
+Node = Union[Rule, AtBlock, Raw]
+
+
+def _find_block_end(css: str, pos: int) -> int:
+    """pos 為 { 之後的位置，回傳對應 } 的位置（略過字串與註解）。"""
+    depth = 1
+    for m in _CSS_TOKEN.finditer(css, pos):
+        token = m.group()
+        if token == "{":
+            depth += 1
+        elif token == "}":
+            depth -= 1
+            if depth == 0:
+                return m.start()
+    raise ValueError("CSS 大括號不平衡")
+
+
+def split_selectors(prelude: str) -> list[str]:
+    """以最上層逗號切開選擇器清單（:not(a, b) 與 [x="a,b"] 內的逗號不切）。"""
+    selectors: list[str] = []
+    depth = 0
+    quote = ""
+    start = 0
+    for i, ch in enumerate(prelude):
+        if quote:
+            if ch == quote:
+                quote = ""
+        elif ch in "\"'":
+            quote = ch
+        elif ch in "([":
+            depth += 1
+        elif ch in ")]":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            selectors.append(prelude[start:i].strip())
+            start = i + 1
+    selectors.append(prelude[start:].strip())
+    return [s for s in selectors if s]
+
+
+def parse_css(css: str, pos: int = 0, end: int | None = None) -> list[Node]:
+    """把 css[pos:end] 解析成規則樹；/*! 授權註解保留，其他註解丟棄。"""
+    end = len(css) if end is None else end
+    nodes: list[Node] = []
+    prelude: list[str] = []
+    while True:
+        m = _CSS_TOKEN.search(css, pos, end)
+        if m is None:
+            break
+        token = m.group()
+        if token.startswith("/*"):
+            prelude.append(css[pos:m.start()])
+            if token.startswith("/*!"):
+                nodes.append(Raw(token))
+            pos = m.end()
+            continue
+        if token[0] in "\"'":
+            prelude.append(css[pos:m.end()])
+            pos = m.end()
+            continue
+
+        text = ("".join(prelude) + css[pos:m.start()]).strip()
+        prelude = []
+        if token == ";":
+            if text:
+                nodes.append(Raw(text + ";"))
+            pos = m.end()
+        elif token == "{":
+            close = _find_block_end(css, m.end())
+            if text.lower().startswith(_NESTING_AT_RULES):
+                nodes.append(AtBlock(text, parse_css(css, m.end(), close)))
+            elif text.startswith("@"):
+                nodes.append(Raw(f"{text}{{{css[m.end():close]}}}"))
+            else:
+                nodes.append(Rule(split_selectors(text), css[m.end():close]))
+            pos = close + 1
+        else:
+            raise ValueError("CSS 大括號不平衡")
+    return nodes
+
+
+def serialize(nodes: list[Node]) -> str:
+    parts: list[str] = []
+    for node in nodes:
+        if isinstance(node, Rule):
+            parts.append(f"{','.join(node.selectors)}{{{node.body}}}")
+        elif isinstance(node, AtBlock):
+            parts.append(f"{node.prelude}{{{serialize(node.children)}}}")
+        else:
+            parts.append(node.text)
+    return "".join(parts)
+
+
+# ---------------------------------------------------------------------------
+# 選擇器比對
+# ---------------------------------------------------------------------------
+
+_PSEUDO = re.compile(r"::?[\w-]+(?:\((?:[^()]|\([^()]*\))*\))?")
+_ATTRIBUTE = re.compile(r"\[[^\]]*\]")
+_CLASS_OR_ID = re.compile(r"[.#]((?:[\w-]|\\.)+)")
+_TAG = re.compile(r"(?:^|[\s>+~])([a-zA-Z][\w-]*)")
+_ESCAPE = re.compile(r"\\(.)")
+
+
+class PageTokens(NamedTuple):
+    tags: frozenset
+    names: frozenset  # class、id 與 JS 字詞
+    safelist: tuple
+
+
+@lru_cache(maxsize=None)
+def selector_requirements(selector: str) -> tuple[tuple[str, ...], tuple[str, ...]]:
+    """選擇器要求存在的 (標籤名, class/id)；pseudo 與屬性選擇器不列入要求。"""
+    stripped = _ATTRIBUTE.sub("", _PSEUDO.sub("", selector))
+    names = tuple(_ESCAPE.sub(r"\1", n) for n in _CLASS_OR_ID.findall(stripped))
+    tags = tuple(t.lower() for t in _TAG.findall(_CLASS_OR_ID.sub("", stripped)))
+    return tags, names
+
+
+def selector_may_match(selector: str, tokens: PageTokens) -> bool:
+    tags, names = selector_requirements(selector)
+    if any(tag not in tokens.tags for tag in tags):
+        return False
+    return all(name in tokens.names or name.startswith(tokens.safelist) for name in names)
+
+
+def prune_nodes(nodes: list[Node], tokens: PageTokens, keep_raw: Callable[[Raw], bool]) -> list[Node]:
+    kept: list[Node] = []
+    for node in nodes:
+        if isinstance(node, Rule):
+            selectors = [s for s in node.selectors if selector_may_match(s, tokens)]
+            if selectors:
+                kept.append(node._replace(selectors=selectors))
+        elif isinstance(node, AtBlock):
+            children = prune_nodes(node.children, tokens, keep_raw)
+            if children:
+                kept.append(node._replace(children=children))
+        elif keep_raw(node):
+            kept.append(node)
+    return kept
+
+
+def html_tokens(html: str) -> tuple[set[str], set[str]]:
+    """HTML 內的 (標籤名, class 與 id)。"""
+    tags = {t.lower() for t in TAG_NAME_PATTERN.findall(html)}
+    names: set[str] = set()
+    for _, value in CLASS_ATTR_PATTERN.findall(html):
+        names.update(value.split())
+    names.update(value.strip() for _, value in ID_ATTR_PATTERN.findall(html))
+    return tags, names
+
+
+@lru_cache(maxsize=None)
+def js_words(path: str) -> frozenset:
+    try:
+        text = Path(path).read_text(encoding="utf-8", errors="replace")
+    except OSError:
+        return frozenset()
+    return frozenset(WORD_PATTERN.findall(text))
+
+
+def page_tokens(repo_root: Path, page: str, html: str, safelist: tuple) -> PageTokens:
+    tags, names = html_tokens(html)
+    words: set[str] = set()
+    for script in INLINE_SCRIPT_PATTERN.findall(html):
+        words.update(WORD_PATTERN.findall(script))
+    for src in LOCAL_SCRIPT_PATTERN.findall(html):
+        rel = src.lstrip("/") if src.startswith("/") else posixpath.join(posixpath.dirname(page), src)
+        words |= js_words(str(repo_root / posixpath.normpath(rel)))
+    # JS 可能動態建立元素（createElement / $("<iframe>")），字詞也視為可能的標籤名
+    return PageTokens(frozenset(tags | {w.lower() for w in words}), frozenset(names | words), safelist)
+
+
+# ---------------------------------------------------------------------------
+# 每頁處理（ProcessPoolExecutor 工作單位）
+# ---------------------------------------------------------------------------
+
+
+class PageResult(NamedTuple):
+    page: str
+    css_path: str
+    before: int
+    pruned: str | None
+    critical: str | None
+    error: str | None
+
+
+@lru_cache(maxsize=64)
+def load_css_tree(path: str) -> tuple[int, list[Node]]:
+    data = Path(path).read_bytes()
+    return len(data), parse_css(data.decode("utf-8"))
+
+
+def process_page(args: tuple[str, str, tuple, int]) -> list[PageResult]:
+    repo_root_str, page, safelist, critical_kb = args
+    repo_root = Path(repo_root_str)
+    html = (repo_root / page).read_text(encoding="utf-8", errors="replace")
+    links = list(LINK_TAG_PATTERN.finditer(html))
+    if not links:
+        return []
+    tokens = page_tokens(repo_root, page, html, safelist)
+
+    critical_tokens = None
+    if critical_kb > 0:
+        body = html.find("<body")
+        if body != -1:
+            tags, names = html_tokens(html[body:body + critical_kb * 1024])
+            critical_tokens = PageTokens(frozenset(tags | {"html", "body"}), frozenset(names), ())
+
+    results: list[PageResult] = []
+    for link in links:
+        prefix, stem = link.group("prefix"), link.group("path")
+        rel = stem + "_combined.min.css" if prefix.startswith("/") else posixpath.normpath(
+            posixpath.join(posixpath.dirname(page), prefix + stem + "_combined.min.css")
+        )
+        css_path = str(repo_root / rel)
+        try:
+            before, tree = load_css_tree(css_path)
+        except (OSError, UnicodeDecodeError, ValueError) as e:
+            results.append(PageResult(page, rel, 0, None, None, str(e)))
+            continue
+        pruned = serialize(prune_nodes(tree, tokens, lambda raw: True))
+        critical = None
+        if critical_tokens is not None:
+            critical = serialize(
+                prune_nodes(tree, critical_tokens, lambda raw: raw.text.lower().startswith("@font-face"))
+            )
+            critical = rebase_urls(critical, posixpath.dirname(rel))
+            if "</style" in critical.lower():
+                critical = None
+        results.append(PageResult(page, rel, before, pruned, critical, None))
+    return results
+
+
+def pruned_path(css_path: str, pruned: bytes) -> str:
+    """__system/__css/h_<原雜湊>/<id>_combined.min.css → 同層 h_<md5>/<id>_pruned.min.css"""
+    css_dir, name = posixpath.split(css_path)
+    file_id = name[: -len("_combined.min.css")]
+    return f"{posixpath.dirname(css_dir)}/h_{hashlib.md5(pruned).hexdigest()}/{file_id}{PRUNED_SUFFIX}"
+
+
+def rewrite_links(html: str, page: str, replacements: dict[str, tuple[str, str | None]]) -> str:
+    """把 combined 樣式表的 <link> 換成精簡版（有 critical 時改為內嵌 + 非阻塞載入）。"""
+
+    def repl(m: re.Match) -> str:
+        prefix, stem = m.group("prefix"), m.group("path")
+        key = stem + "_combined.min.css" if prefix.startswith("/") else posixpath.normpath(
+            posixpath.join(posixpath.dirname(page), prefix + stem + "_combined.min.css")
+        )
+        if key not in replacements:
+            return m.group(0)
+        new_path, critical = replacements[key]
+        href = prefix + new_path
+        if critical is None:
+            return f'<link type="text/css" rel="stylesheet" href="{href}" />'
+        return (
+            f"<style data-hdh-critical>{critical}</style>"
+            f'<link type="text/css" rel="stylesheet" href="{href}" media="print" onload="this.media=\'all\'" />'
+            f'<noscript><link type="text/css" rel="stylesheet" href="{href}" /></noscript>'
+        )
+
+    return LINK_TAG_PATTERN.sub(repl, html)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="依各頁 DOM 刪除 combined 樣式表中用不到的規則")
+    default_script_dir = Path(__file__).resolve().parent
+    parser.add_argument(
+        "--repo-root",
+        type=Path,
+        default=default_script_dir.parent,
+        help="repo 根目錄（預設為本腳本所在目錄的上一層）",
+    )
+    parser.add_argument(
+        "--safelist",
+        action="append",
+        default=[],
+        metavar="PREFIX",
+        help="額外一律保留的 class / id 前綴（可重複指定；預設已含 hdh-annc、hdh-nlpop、hdh-mascot）",
+    )
+    parser.add_argument(
+        "--critical-kb",
+        type=int,
+        default=0,
+        help="以 <body> 開頭 N KB 為首屏挑出 critical CSS 內嵌（預設 0 = 不內嵌）",
+    )
+    parser.add_argument("--jobs", "-j", type=int, default=0, help="平行 process 數（0 = CPU 核心數）")
+    parser.add_argument("--dry-run", action="store_true", help="只輸出精簡前後大小，不寫入任何檔案")
+    add_profiling_arguments(parser)
+    args = parser.parse_args()
+    enable_profiling(args)
+
+    repo_root: Path = args.repo_root.resolve()
+    safelist = DEFAULT_SAFELIST + tuple(args.safelist)
+    work = [(str(repo_root), page, safelist, args.critical_kb) for page in list_pages(repo_root, PAGES_SITE)]
+
+    results: list[PageResult] = []
+    with phase("prune"), ProcessPoolExecutor(max_workers=args.jobs if args.jobs > 0 else None) as executor:
+        for page_results in executor.map(process_page, work, chunksize=CHUNK_SIZE):
+            count("pages")
+            for r in page_results:
+                add_bytes(read=r.before)
+            results.extend(page_results)
+
+    errors = [r for r in results if r.error]
+    done = [r for r in results if not r.error]
+    before = sum(r.before for r in done)
+    after = sum(len(r.pruned.encode("utf-8")) for r in done)
+    print(f"頁面 {len(done)} 個（樣式表解析失敗 {len(errors)} 個）")
+    if done:
+        print(f"每頁 render-blocking CSS：平均 {before / len(done) / 1024:.1f} KB → {after / len(done) / 1024:.1f} KB"
+              f"（-{(1 - after / before) * 100:.0f}%）")
+    if args.critical_kb > 0:
+        inlined = [r for r in done if r.critical is not None]
+        if inlined:
+            avg = sum(len(r.critical.encode("utf-8")) for r in inlined) / len(inlined)
+            print(f"critical CSS 內嵌 {len(inlined)} 頁，平均 {avg / 1024:.1f} KB（其餘樣式改為非阻塞載入）")
+    for r in errors:
+        print(f"  [SKIP] {r.page}：{r.css_path}：{r.error}")
+
+    if args.dry_run or not done:
+        print("[DRY-RUN] 未寫入任何檔案" if args.dry_run else "沒有需要處理的頁面")
+        return 0
+
+    outputs: dict[str, bytes] = {}
+    page_replacements: dict[str, dict[str, tuple[str, str | None]]] = {}
+    for r in done:
+        data = r.pruned.encode("utf-8")
+        new_path = pruned_path(r.css_path, data)
+        outputs[new_path] = data
+        page_replacements.setdefault(r.page, {})[r.css_path] = (new_path, r.critical)
+
+    try:
+        with phase("write"), AtomicBatchWriter() as writer:
+            for rel, data in sorted(outputs.items()):
+                writer.stage(repo_root / rel, data)
+            for page, replacements in sorted(page_replacements.items()):
+                path = repo_root / page
+                raw = path.read_bytes()
+                add_bytes(read=len(raw))
+                new_html = rewrite_links(raw.decode("utf-8"), page, replacements)
+                data = new_html.encode("utf-8")
+                error = check_page_intact(path, data)
+                if error:
+                    raise BatchWriteError(f"{page}：{error}")
+                writer.stage(path, data)
+    except BatchWriteError as e:
+        print(f"[ERROR] {e}（整批未寫入）", file=sys.stderr)
+        return 1
+
+    print(f"[APPLIED] 精簡樣式表 {len(outputs)} 個，改寫頁面 {len(page_replacements)} 個")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
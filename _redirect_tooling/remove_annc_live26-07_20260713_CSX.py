@@ -6,85 +6,129 @@
 用法：
     python remove_annc.py --dry-run   # 預覽
     python remove_annc.py             # 正式套用
+頁面以 mmap 直接在 UTF-8 位元組上定位錨點，沒有 item 錨點的頁面完全不解碼；
+出現次數檢查找到第 2 次即停，只複製移除塊前後兩段。
+寫入走 _common.AtomicBatchWriter：全部頁面先寫暫存檔、驗證、批次 fsync
+後才原子換上，中途失敗或 Ctrl-C 整批還原。
 """
+import argparse
 import sys
 import glob
+import mmap
 import os
 
+from _common import AtomicBatchWriter, BatchWriteError, add_profiling_arguments, count, enable_profiling, phase
+from _fragments import check_page_intact
+
 REPO = r"C:\Users\cshow\Desktop\medatatw_github"
 ITEM_ANCHOR = "item=live-km0710"
 END_MARKER = "匯東華公告彈窗片段結束（Live26-07）"
 
-def process(text):
-    """回傳 (new_text, changed_bool, note)。找不到片段回傳原文 + skip。"""
-    idx_item = text.find(ITEM_ANCHOR)
+# 錨點一律以 UTF-8 位元組比對（頁面以 mmap 直接掃描，不解碼）
+ITEM_ANCHOR_B = ITEM_ANCHOR.encode("utf-8")
+END_MARKER_B = END_MARKER.encode("utf-8")
+ANNC_ROOT_B = b'id="hdh-annc-root"'
+
+
+def occurs_once(buf, needle):
+    """needle 是否恰好出現 1 次；找到第 2 次就停，不像 count() 一定掃完全文。"""
+    first = buf.find(needle)
+    return first != -1 and buf.find(needle, first + 1) == -1
+
+
+def process(buf):
+    """
+    buf 為 bytes 或 mmap（UTF-8 位元組）。
+    回傳 (new_bytes, changed_bool, note)；未變更時 new_bytes 為 None。
+    只複製移除塊前後兩段，不解碼、不產生整頁的 str 副本。
+    """
+    idx_item = buf.find(ITEM_ANCHOR_B)
     if idx_item == -1:
-        return text, False, "skip: 無 item=live-km0710"
+        return None, False, "skip: 無 item=live-km0710"
     # 以「真實公告塊」為準：annc-root 與結束 marker 必須各恰好 1 個
     # （item 註解行可能被重複注入，但只要塊本體唯一即安全）
-    if text.count('id="hdh-annc-root"') != 1:
-        return text, False, "SKIP-WARN: hdh-annc-root 出現次數 != 1"
-    if text.count(END_MARKER) != 1:
-        return text, False, "SKIP-WARN: 結束 marker 出現次數 != 1"
+    if not occurs_once(buf, ANNC_ROOT_B):
+        return None, False, "SKIP-WARN: hdh-annc-root 出現次數 != 1"
+    if not occurs_once(buf, END_MARKER_B):
+        return None, False, "SKIP-WARN: 結束 marker 出現次數 != 1"
 
     # 起點：從 item 位置往前找最近的 <!--（即 @hdh-expire 註解起點）
-    block_start = text.rfind("<!--", 0, idx_item)
+    block_start = buf.rfind(b"<!--", 0, idx_item)
     if block_start == -1:
-        return text, False, "SKIP-WARN: 找不到起點 <!--"
+        return None, False, "SKIP-WARN: 找不到起點 <!--"
     # 安全檢查：起點到 item 之間必須含 @hdh-expire（確認鎖定正確註解）
-    if "@hdh-expire" not in text[block_start:idx_item]:
-        return text, False, "SKIP-WARN: 起點註解非 @hdh-expire"
+    if buf.find(b"@hdh-expire", block_start, idx_item) == -1:
+        return None, False, "SKIP-WARN: 起點註解非 @hdh-expire"
 
     # 終點：item 之後找「片段結束」marker，再找其後第一個 -->
-    idx_end_marker = text.find(END_MARKER, idx_item)
+    idx_end_marker = buf.find(END_MARKER_B, idx_item)
     if idx_end_marker == -1:
-        return text, False, "SKIP-WARN: 找不到結束 marker"
-    idx_close = text.find("-->", idx_end_marker)
+        return None, False, "SKIP-WARN: 找不到結束 marker"
+    idx_close = buf.find(b"-->", idx_end_marker)
     if idx_close == -1:
-        return text, False, "SKIP-WARN: 結束 marker 後無 -->"
-    block_end = idx_close + len("-->")
+        return None, False, "SKIP-WARN: 結束 marker 後無 -->"
+    block_end = idx_close + len(b"-->")
 
     # 安全檢查：移除塊內不得含 nlpop-root / footer-root（防超刪）
-    block = text[block_start:block_end]
-    if "hdh-nlpop-root" in block or "hdh-footer-root" in block:
-        return text, False, "SKIP-WARN: 移除塊內含 nlpop/footer root，中止防超刪"
-    if "hdh-annc-root" not in block:
-        return text, False, "SKIP-WARN: 移除塊內無 hdh-annc-root"
+    if (buf.find(b"hdh-nlpop-root", block_start, block_end) != -1
+            or buf.find(b"hdh-footer-root", block_start, block_end) != -1):
+        return None, False, "SKIP-WARN: 移除塊內含 nlpop/footer root，中止防超刪"
+    if buf.find(b"hdh-annc-root", block_start, block_end) == -1:
+        return None, False, "SKIP-WARN: 移除塊內無 hdh-annc-root"
 
     # 吃掉緊接的一個換行（避免留白行）
     after = block_end
-    if text[after:after+2] == "\r\n":
+    if buf[after:after+2] == b"\r\n":
         after += 2
-    elif text[after:after+1] == "\n":
+    elif buf[after:after+1] == b"\n":
         after += 1
 
-    new_text = text[:block_start] + text[after:]
-    return new_text, True, "removed"
+    new_bytes = buf[:block_start] + buf[after:]
+    return new_bytes, True, "removed"
+
+
+def scan_file(path):
+    """以 mmap 掃描單一頁面，回傳 process() 的結果；空檔直接 skip。"""
+    with open(path, "rb") as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            return None, False, "skip: 空檔"
+        # mmap 關閉前就把結果複製成 bytes（process 內的切片），Windows 上
+        # 才能在之後覆寫同一檔案
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return process(mm)
 
 def main():
-    dry = "--dry-run" in sys.argv
+    parser = argparse.ArgumentParser(description="移除已過期的 Live26-07 公告彈窗片段")
+    parser.add_argument("--dry-run", action="store_true", help="只預覽，不寫入任何檔案")
+    add_profiling_arguments(parser)
+    args = parser.parse_args()
+    enable_profiling(args)
+    dry = args.dry_run
     files = sorted(glob.glob(os.path.join(REPO, "*.html")))
     changed = skipped = warned = 0
     warn_list = []
-    for f in files:
-        base = os.path.basename(f)
-        if base.startswith("_demo"):
-            # 未追蹤 demo 檔，out-of-scope，不動
-            continue
-        with open(f, "r", encoding="utf-8") as fh:
-            text = fh.read()
-        new_text, ch, note = process(text)
-        if ch:
-            changed += 1
-            if not dry:
-                with open(f, "w", encoding="utf-8", newline="") as fh:
-                    fh.write(new_text)
-        else:
-            if note.startswith("SKIP-WARN"):
-                warned += 1
-                warn_list.append((os.path.basename(f), note))
-            else:
-                skipped += 1
+    try:
+        with phase("sweep"), AtomicBatchWriter(validate=check_page_intact) as writer:
+            for f in files:
+                base = os.path.basename(f)
+                if base.startswith("_demo"):
+                    # 未追蹤 demo 檔，out-of-scope，不動
+                    continue
+                new_bytes, ch, note = scan_file(f)
+                count("pages_scanned")
+                if ch:
+                    changed += 1
+                    if not dry:
+                        writer.stage(f, new_bytes)
+                else:
+                    if note.startswith("SKIP-WARN"):
+                        warned += 1
+                        warn_list.append((os.path.basename(f), note))
+                    else:
+                        skipped += 1
+    except BatchWriteError as e:
+        print(f"[ERROR] {e}（整批未寫入）")
+        sys.exit(1)
     print(f"{'[DRY-RUN] ' if dry else '[APPLIED] '}changed={changed} skipped(no-fragment)={skipped} warned={warned}")
     for name, note in warn_list:
         print(f"  WARN {name}: {note}")
@@ -0,0 +1,492 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+split_js_bundles.py — 把各頁 __system/__js combined bundle 的共同開頭抽成共用檔
+
+背景：
+    幾乎每頁都各自引用一份 __system/__js/h_<hash>/<id>_combined.min.js
+    （約 200–400 KB，全站 300 多份、約 70 MB），內容絕大部分是同一批
+    函式庫，但每份是分別壓縮的（變數改名不同），逐位元組比對只有開頭
+    一段相同。瀏覽器換頁時每頁都要重新下載一整份。
+
+做法：
+    1. 掃描全站頁面的 <script src=".../_combined.min.js"></script>，
+       平行解析每份 bundle 的「最上層敘述」邊界（depth 0 的 ;，略過字串、
+       註解、template 與 regex 常值），每個敘述取 SHA-1。
+    2. 把各 bundle 的敘述序列建成字首樹（trie），以 tree DP 選出互不重疊
+       的切點：切點 = 某段「完全相同的開頭敘述序列」，節省量 =
+       (bundle 數 - 1) × 開頭位元組數（引用同一份 bundle 的頁面本來就共用
+       快取，只有跨 bundle 才省得到）；只有一份 bundle、引用頁數少於
+       --min-pages、或共用開頭小於 --min-shared-kb 者不切（多一個 request
+       不划算）。
+    3. 每個切點的開頭存成一份共用檔 __system/__js/h_<md5>/shared.min.js，
+       各 bundle 剩下的部分存成同目錄的 <id>_delta.min.js；頁面原本的
+       <script> 改寫成先後兩個 <script>（共用檔 → delta）。
+
+    只在最上層敘述邊界切開、且共用檔 + delta 逐位元組等於原檔，瀏覽器
+    依序執行兩個同步 <script> 與執行原檔的效果相同；以下情況例外，會
+    跳過該 bundle 不切：
+        - bundle 以 "use strict" 指示開頭（切開後 delta 不再是 strict mode）
+        - delta 內最上層宣告的 var / let / const / function / class 名稱
+          出現在共用開頭裡（原本會被 hoist，切開後可能變成 ReferenceError）
+        - 無法解析（括號不平衡、字串未結束等）
+
+    原本的 _combined.min.js 保留不刪（可能仍有快取中的舊頁面引用），
+    改寫後可用 asset_graph.py 確認已無頁面引用再手動清除。已改寫的頁面
+    不再引用 _combined.min.js，重跑本腳本不會重複切割。
+
+用法：
+    python split_js_bundles.py [--repo-root PATH] [--min-pages N]
+                               [--min-shared-kb N] [--jobs N] [--dry-run]
+
+    --dry-run 只輸出切割計畫與節省量報告，不寫入任何檔案。
+
+寫入：
+    共用檔、delta 與改寫後的頁面全部經 _common.AtomicBatchWriter 同一批
+    交易式寫入（頁面以 _fragments.check_page_intact 驗證），任一步失敗
+    整批還原。
+
+輸出：
+    每組共用檔的 bundle 數 / 頁數 / 共用位元組，以及瀏覽過該組所有
+    bundle 時（共用檔已在瀏覽器快取中）合計少下載的位元組數。
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import posixpath
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import NamedTuple
+
+from _common import (
+    PAGES_SITE,
+    AtomicBatchWriter,
+    BatchWriteError,
+    add_bytes,
+    add_profiling_arguments,
+    count,
+    enable_profiling,
+    list_pages,
+    phase,
+    reconfigure_utf8_streams,
+)
+from _fragments import check_page_intact
+
+reconfigure_utf8_streams()
+
+JS_ROOT = "__system/__js"
+SHARED_NAME = "shared.min.js"
+DELTA_SUFFIX = "_delta.min.js"
+
+SCRIPT_TAG_PATTERN = re.compile(
+    r'<script src="(?P<src>(?P<prefix>(?:\.\./|/)*)__system/__js/h_[0-9a-f]+/[^"/]+_combined\.min\.js)"></script>'
+)
+
+CHUNK_SIZE = 4
+
+# ---------------------------------------------------------------------------
+# 最上層敘述邊界解析（只求找對 depth 0 的 ;，不是完整的 JS parser）
+# ---------------------------------------------------------------------------
+
+_TOKEN = re.compile(
+    r"""
+     (?P<ws>\s+)
+    |(?P<comment>//[^\n]*|/\*.*?\*/)
+    |(?P<str>"(?:[^"\\\n]|\\.|\\\n)*"|'(?:[^'\\\n]|\\.|\\\n)*')
+    |(?P<tpl>`)
+    |(?P<open>[({\[])
+    |(?P<close>[)}\]])
+    |(?P<semi>;)
+    |(?P<comma>,)
+    |(?P<slash>/)
+    |(?P<word>[A-Za-z_$\u0080-\uffff][\w$\u0080-\uffff]*)
+    |(?P<other>[^\s"'`/(){}\[\];,A-Za-z_$\u0080-\uffff]+)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+_REGEX_LITERAL = re.compile(r"/(?:[^/\\\[\n]|\\.|\[(?:[^\]\\\n]|\\.)*\])+/[A-Za-z]*")
+_TEMPLATE_CHUNK = re.compile(r"(?:[^`\\$]|\\.|\$(?!\{))*", re.DOTALL)
+
+# 出現在這些符號或關鍵字之後的 / 是 regex 常值的開頭，其他情況是除號
+_REGEX_AFTER_PUNCT = set("(,=:[!&|?{};+-*%<>~^}")
+_REGEX_AFTER_WORDS = {
+    "return", "typeof", "case", "do", "else", "in", "of", "new", "delete",
+    "void", "throw", "instanceof", "yield", "await",
+}
+_DECLARATION_WORDS = {"var", "let", "const"}
+_USE_STRICT = re.compile(r"""\s*(?:/\*.*?\*/\s*)*(["'])use strict\1""", re.DOTALL)
+_IDENTIFIER = re.compile(r"[A-Za-z_$\u0080-\uffff][\w$\u0080-\uffff]*")
+
+
+class Statement(NamedTuple):
+    end: int
+    digest: str
+    declared: tuple[str, ...]
+
+
+def _scan_template(src: str, pos: int) -> tuple[int, bool]:
+    """從 template 內容的位置往後掃，回傳 (新位置, 是否停在 ${ 之後)。"""
+    pos = _TEMPLATE_CHUNK.match(src, pos).end()
+    if pos >= len(src):
+        raise ValueError("template 常值未結束")
+    if src[pos] == "`":
+        return pos + 1, False
+    return pos + 2, True
+
+
+def split_statements(src: str) -> list[Statement]:
+    """
+    回傳最上層敘述清單（每個敘述的結尾位置、內容 SHA-1、宣告的名稱）。
+    最後一段若沒有以 ; 結尾，也算一個敘述。無法解析時拋出 ValueError。
+    """
+    statements: list[Statement] = []
+    stack: list[str] = []  # 括號種類；"T" 表示 template 的 ${
+    prev = ""
+    start = pos = 0
+    declared: list[str] = []
+    in_declaration = expect_name = False
+    n = len(src)
+    match = _TOKEN.match
+
+    def close_statement(end: int) -> None:
+        nonlocal start, declared, in_declaration, expect_name
+        digest = hashlib.sha1(src[start:end].encode("utf-8")).hexdigest()
+        statements.append(Statement(end, digest, tuple(declared)))
+        start, declared, in_declaration, expect_name = end, [], False, False
+
+    while pos < n:
+        t = match(src, pos)
+        if t is None:
+            raise ValueError(f"無法解析的字元（位置 {pos}）")
+        kind, end = t.lastgroup, t.end()
+        if kind in ("ws", "comment"):
+            pos = end
+            continue
+
+        if kind == "slash":
+            if prev == "" or prev in _REGEX_AFTER_PUNCT or prev in _REGEX_AFTER_WORDS:
+                literal = _REGEX_LITERAL.match(src, pos)
+                if literal is None:
+                    raise ValueError(f"regex 常值無法解析（位置 {pos}）")
+                end, prev = literal.end(), "x"
+            else:
+                prev = "/"
+        elif kind == "tpl":
+            end, opened = _scan_template(src, pos + 1)
+            if opened:
+                stack.append("T")
+            prev = "{" if opened else "x"
+        elif kind == "open":
+            stack.append(src[pos])
+            prev = src[pos]
+        elif kind == "close":
+            if not stack:
+                raise ValueError(f"括號不平衡（位置 {pos}）")
+            if stack.pop() == "T":
+                end, opened = _scan_template(src, pos + 1)
+                if opened:
+                    stack.append("T")
+                prev = "{" if opened else "x"
+            else:
+                prev = src[pos]
+        elif kind == "semi":
+            prev = ";"
+            if not stack:
+                close_statement(end)
+        elif kind == "comma":
+            prev = ","
+            if not stack and in_declaration:
+                expect_name = True
+        elif kind == "word":
+            word = t.group()
+            if not stack:
+                if expect_name:
+                    declared.append(word)
+                    expect_name = False
+                elif word in _DECLARATION_WORDS:
+                    in_declaration = expect_name = True
+                elif word in ("function", "class") and prev in ("", ";", "}"):
+                    expect_name = True
+            prev = word if word in _REGEX_AFTER_WORDS else "x"
+        elif kind == "str":
+            prev = "x"
+        else:
+            prev = t.group()[-1]
+        pos = end
+
+    if stack:
+        raise ValueError("括號不平衡（檔尾仍有未關閉的括號）")
+    if src[start:].strip():
+        close_statement(n)
+    return statements
+
+
+@dataclass
+class Bundle:
+    path: str
+    size: int
+    statements: list[Statement]
+    pages: list[str] = field(default_factory=list)
+
+
+def analyze_bundle(args: tuple[str, str]) -> tuple[str, int, list[Statement] | None, str | None]:
+    """ProcessPoolExecutor 的工作單位：回傳 (路徑, 位元組數, 敘述清單, 錯誤)。"""
+    repo_root, rel_path = args
+    data = (Path(repo_root) / rel_path).read_bytes()
+    try:
+        src = data.decode("utf-8")
+    except UnicodeDecodeError as e:
+        return rel_path, len(data), None, f"不是合法 UTF-8（{e}）"
+    if _USE_STRICT.match(src):
+        return rel_path, len(data), None, '以 "use strict" 開頭，切開會改變 delta 的語意'
+    try:
+        statements = split_statements(src)
+    except ValueError as e:
+        return rel_path, len(data), None, str(e)
+    # 位元組位移（共用檔 / delta 以位元組切開）
+    byte_statements = []
+    for st in statements:
+        byte_statements.append(st._replace(end=len(src[: st.end].encode("utf-8"))))
+    return rel_path, len(data), byte_statements, None
+
+
+# ---------------------------------------------------------------------------
+# 切點選擇
+# ---------------------------------------------------------------------------
+
+
+class _TrieNode:
+    __slots__ = ("children", "bundles", "pages", "size", "best", "take")
+
+    def __init__(self, size: int) -> None:
+        self.children: dict[str, _TrieNode] = {}
+        self.bundles: list[Bundle] = []
+        self.pages = 0
+        self.size = size
+        self.best = 0
+        self.take = False
+
+
+class SharedChunk(NamedTuple):
+    size: int
+    bundles: list[Bundle]
+
+
+def choose_chunks(bundles: list[Bundle], min_pages: int, min_shared: int) -> list[SharedChunk]:
+    """
+    以 tree DP 在敘述字首樹上選出互不重疊的切點，使
+    Σ (bundle 數 - 1) × 共用位元組 最大。至少要有兩份 bundle 才算切點
+    （只有一份時切開只是多一個 request）；每個 bundle 至少留一個敘述給 delta。
+    """
+    root = _TrieNode(0)
+    for bundle in bundles:
+        node = root
+        for st in bundle.statements[:-1]:
+            child = node.children.get(st.digest)
+            if child is None:
+                child = node.children[st.digest] = _TrieNode(st.end)
+            child.bundles.append(bundle)
+            child.pages += len(bundle.pages)
+            node = child
+
+    # 後序走訪（不用遞迴，bundle 可能有上百個最上層敘述）
+    order: list[_TrieNode] = []
+    todo = [root]
+    while todo:
+        node = todo.pop()
+        order.append(node)
+        todo.extend(node.children.values())
+    for node in reversed(order):
+        children_best = sum(c.best for c in node.children.values())
+        eligible = (
+            node is not root and len(node.bundles) >= 2 and node.pages >= min_pages and node.size >= min_shared
+        )
+        own = (len(node.bundles) - 1) * node.size if eligible else 0
+        node.take = own > children_best
+        node.best = max(own, children_best)
+
+    chunks: list[SharedChunk] = []
+    todo = [root]
+    while todo:
+        node = todo.pop()
+        if node.take:
+            chunks.append(SharedChunk(node.size, node.bundles))
+        else:
+            todo.extend(node.children.values())
+    return sorted(chunks, key=lambda c: -c.size * len(c.bundles))
+
+
+def hoisting_conflicts(shared: bytes, bundle: Bundle, cut: int) -> set[str]:
+    """delta 內最上層宣告、但在共用開頭就出現的名稱（切開後可能失去 hoisting）。"""
+    declared = {name for st in bundle.statements if st.end > cut for name in st.declared}
+    if not declared:
+        return set()
+    words = set(_IDENTIFIER.findall(shared.decode("utf-8")))
+    return declared & words
+
+
+# ---------------------------------------------------------------------------
+# 主流程
+# ---------------------------------------------------------------------------
+
+
+def find_page_scripts(repo_root: Path) -> dict[str, list[tuple[str, str, str]]]:
+    """bundle 路徑 → [(頁面, 原 src, src 前綴)]，只收 repo 內存在的 bundle。"""
+    refs: dict[str, list[tuple[str, str, str]]] = {}
+    for page in list_pages(repo_root, PAGES_SITE):
+        text = (repo_root / page).read_text(encoding="utf-8", errors="replace")
+        for m in SCRIPT_TAG_PATTERN.finditer(text):
+            src, prefix = m.group("src"), m.group("prefix")
+            if prefix.startswith("/"):
+                rel = src.lstrip("/")
+            else:
+                rel = posixpath.normpath(posixpath.join(posixpath.dirname(page), src))
+            if rel.startswith(JS_ROOT + "/") and (repo_root / rel).is_file():
+                refs.setdefault(rel, []).append((page, src, prefix))
+    return refs
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="把各頁 combined JS bundle 的共同開頭抽成共用檔")
+    default_script_dir = Path(__file__).resolve().parent
+    parser.add_argument(
+        "--repo-root",
+        type=Path,
+        default=default_script_dir.parent,
+        help="repo 根目錄（預設為本腳本所在目錄的上一層）",
+    )
+    parser.add_argument(
+        "--min-pages",
+        type=int,
+        default=5,
+        help="共用檔至少要被幾頁引用才值得切出（預設 5）",
+    )
+    parser.add_argument(
+        "--min-shared-kb",
+        type=int,
+        default=16,
+        help="共用開頭至少要多大（KB）才值得多一個 request（預設 16）",
+    )
+    parser.add_argument("--jobs", "-j", type=int, default=0, help="平行 process 數（0 = CPU 核心數）")
+    parser.add_argument("--dry-run", action="store_true", help="只輸出計畫與報告，不寫入任何檔案")
+    add_profiling_arguments(parser)
+    args = parser.parse_args()
+    enable_profiling(args)
+
+    repo_root: Path = args.repo_root.resolve()
+    jobs = args.jobs if args.jobs > 0 else None
+
+    with phase("find_scripts"):
+        refs = find_page_scripts(repo_root)
+    work = [(str(repo_root), rel) for rel in sorted(refs)]
+    bundles: list[Bundle] = []
+    skipped: list[tuple[str, str]] = []
+    with phase("analyze"), ProcessPoolExecutor(max_workers=jobs) as executor:
+        for rel, size, statements, error in executor.map(analyze_bundle, work, chunksize=CHUNK_SIZE):
+            add_bytes(read=size)
+            if error:
+                skipped.append((rel, error))
+                continue
+            bundle = Bundle(rel, size, statements)
+            bundle.pages = [page for page, _, _ in refs[rel]]
+            bundles.append(bundle)
+
+    total_pages = sum(len(v) for v in refs.values())
+    # 每份 bundle 只下載一次（之後由瀏覽器快取）時，瀏覽過全部頁面的下載量
+    before_bytes = sum(b.size for b in bundles)
+    print(f"bundle {len(refs)} 份（{sum(b.size for b in bundles) / 1048576:.1f} MB），引用頁面 {total_pages} 個")
+
+    plan: list[tuple[str, bytes, list[tuple[Bundle, bytes]]]] = []
+    with phase("plan"):
+        for chunk in choose_chunks(bundles, args.min_pages, args.min_shared_kb * 1024):
+            shared: bytes | None = None
+            members: list[tuple[Bundle, bytes]] = []
+            for bundle in chunk.bundles:
+                data = (repo_root / bundle.path).read_bytes()
+                add_bytes(read=len(data))
+                if shared is None:
+                    shared = data[: chunk.size]
+                conflicts = hoisting_conflicts(shared, bundle, chunk.size)
+                if conflicts:
+                    skipped.append((bundle.path, f"delta 宣告的名稱在共用開頭中被引用：{', '.join(sorted(conflicts)[:5])}"))
+                    continue
+                if data[: chunk.size] != shared:
+                    skipped.append((bundle.path, "開頭與共用檔內容不一致（分析後檔案被改過？）"))
+                    continue
+                members.append((bundle, data[chunk.size:]))
+            if len(members) < 2 or sum(len(b.pages) for b, _ in members) < args.min_pages:
+                continue
+            shared_path = f"{JS_ROOT}/h_{hashlib.md5(shared).hexdigest()}/{SHARED_NAME}"
+            plan.append((shared_path, shared, members))
+
+    print()
+    print(f"{'共用檔':<58}{'bundle':>7}{'頁數':>6}{'共用大小':>11}{'合計省下':>12}")
+    print("-" * 100)
+    saved_total = split_pages = split_bundles = 0
+    for shared_path, shared, members in plan:
+        pages = sum(len(b.pages) for b, _ in members)
+        split_pages += pages
+        split_bundles += len(members)
+        # 共用檔已快取時，群組內第二份起的每份 bundle 少下載 len(shared)；
+        # 引用同一份 bundle 的頁面本來就共用快取，不另外計算
+        saved = (len(members) - 1) * len(shared)
+        saved_total += saved
+        print(f"{shared_path:<60}{len(members):>7}{pages:>6}{len(shared) / 1024:>9.1f} KB{saved / 1024:>10.1f} KB")
+
+    after_bytes = before_bytes - saved_total
+    print()
+    print(f"切割 {split_bundles} 份 bundle、改寫 {split_pages} 頁；跳過 {len(skipped)} 份")
+    if split_pages:
+        print(f"瀏覽過全部頁面的總下載量（每份 bundle 只下載一次）："
+              f"{before_bytes / 1048576:.1f} MB → {after_bytes / 1048576:.1f} MB")
+        print(f"換到另一份已切割 bundle 的頁面時，平均少下載："
+              f"{saved_total / max(split_bundles - len(plan), 1) / 1024:.1f} KB")
+    for rel, reason in skipped:
+        print(f"  [SKIP] {rel}：{reason}")
+
+    if args.dry_run or not plan:
+        print("[DRY-RUN] 未寫入任何檔案" if args.dry_run else "沒有可切割的 bundle")
+        return 0
+
+    page_rewrites: dict[str, dict[str, str]] = {}
+    try:
+        with phase("write"), AtomicBatchWriter() as writer:
+            for shared_path, shared, members in plan:
+                writer.stage(repo_root / shared_path, shared)
+                for bundle, delta in members:
+                    delta_path = bundle.path[: -len("_combined.min.js")] + DELTA_SUFFIX
+                    writer.stage(repo_root / delta_path, delta)
+                    for page, src, prefix in refs[bundle.path]:
+                        page_rewrites.setdefault(page, {})[src] = (
+                            f'<script src="{prefix}{shared_path}"></script>'
+                            f'<script src="{prefix}{delta_path}"></script>'
+                        )
+            for page, replacements in sorted(page_rewrites.items()):
+                path = repo_root / page
+                raw = path.read_bytes()
+                add_bytes(read=len(raw))
+                count("pages_rewritten")
+                text = raw.decode("utf-8")
+                new_text = SCRIPT_TAG_PATTERN.sub(
+                    lambda m: replacements.get(m.group("src"), m.group(0)), text
+                )
+                data = new_text.encode("utf-8")
+                error = check_page_intact(path, data)
+                if error:
+                    raise BatchWriteError(f"{page}：{error}")
+                writer.stage(path, data)
+    except BatchWriteError as e:
+        print(f"[ERROR] {e}（整批未寫入）", file=sys.stderr)
+        return 1
+
+    print(f"[APPLIED] 共用檔 {len(plan)} 個，改寫頁面 {len(page_rewrites)} 個")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+sweep_expired.py — 一次移除全站所有已過期的 @hdh-expire 片段
+
+用途：
+    取代「每個過期公告複製一支一次性移除腳本」的做法（例如
+    remove_annc_live26-07_20260713_CSX.py）。全站頁面只讀一次，解析
+    每頁所有 @hdh-expire 標記，凡 date 已過（date < 今天）且標記後緊接
+    hdh-*-root 片段者整塊移除；定位與安全檢查規則見 _fragments.py
+    （與 process() 相同的雙錨點 + 防超刪）。
+
+    @hdh-expire 也會標在一般內容上（例如最新消息卡片的 NEW 徽章），
+    這類標記不是整塊片段，過期時只會列在「需人工處理」清單，不會自動改動。
+
+用法：
+    python sweep_expired.py [--repo-root PATH] [--today YYYY-MM-DD]
+                            [--item ITEM ...] [--use-index] [--dry-run]
+
+    --today 預設為今天（本機日期），可指定日期預覽某天之後會被移除的內容；
+    --item 只處理指定的 item（可重複），未指定則處理所有已過期 item；
+    --use-index 先增量更新 expire_index.json，只讀取索引中帶有已過期
+    標記的頁面，其餘頁面完全不讀（見 expire_index.py）。索引中無法以
+    UTF-8 解碼的頁面會列出並以 exit code 1 結束。
+
+寫入：
+    所有改寫過的頁面經 _common.AtomicBatchWriter 交易式寫入：先全部寫到
+    同目錄暫存檔並驗證（頁面仍以 </html> 結尾），統一 fsync 後才原子換上；
+    任一頁驗證失敗、I/O 錯誤或 Ctrl-C，整批還原，網站不會停在半套狀態。
+
+輸出：
+    每個 item 的移除頁數 / 警告頁數，以及需人工處理的標記清單。
+    已過期的片段任一頁出現 SKIP-WARN 時以 exit code 1 結束，提醒人工
+    確認；尚未過期的標記不檢查，date 格式錯誤的標記另外列出、不影響
+    exit code（否則每天都會失敗）。
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from collections import Counter, defaultdict
+from datetime import date
+from pathlib import Path
+
+from _common import (
+    PAGES_ROOT,
+    AtomicBatchWriter,
+    BatchWriteError,
+    add_bytes,
+    add_profiling_arguments,
+    count,
+    enable_profiling,
+    list_pages,
+    phase,
+    reconfigure_utf8_streams,
+)
+from _fragments import EXPIRE_TAG, check_page_intact, find_expire_markers, remove_blocks
+from expire_index import index_errors, pages_with_expired, update_index
+
+reconfigure_utf8_streams()
+
+
+def sweep_page(text: str, today: date, items: set[str] | None):
+    """
+    回傳 (new_text, removed_items, warnings, manual, malformed)：
+        removed_items  本頁移除的 item 清單
+        warnings       已過期但無法安全移除的 [(item, SKIP-WARN 說明)]
+        manual         已過期但不是片段、需人工處理的 [(item, onexpire)]
+        malformed      date 格式錯誤、無法判斷是否過期的 [(item, 說明)]
+
+    先判斷是否過期再看警告：尚未過期的標記即使結構有問題也不算警告，
+    等真的過期時才會回報。
+    """
+    removed: list[str] = []
+    warnings: list[tuple[str, str]] = []
+    manual: list[tuple[str, str]] = []
+    malformed: list[tuple[str, str]] = []
+    blocks = []
+
+    for marker in find_expire_markers(text):
+        if items is not None and marker.item not in items:
+            continue
+        if marker.expires is None:
+            malformed.append((marker.item, marker.warning or ""))
+            continue
+        if marker.expires >= today:
+            continue
+        if marker.warning:
+            warnings.append((marker.item, marker.warning))
+            continue
+        if marker.block is None:
+            manual.append((marker.item, marker.attrs.get("onexpire", "")))
+            continue
+        blocks.append(marker.block)
+        removed.append(marker.item)
+
+    if not blocks:
+        return text, removed, warnings, manual, malformed
+    return remove_blocks(text, blocks), removed, warnings, manual, malformed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="移除全站已過期的 @hdh-expire 片段")
+    default_script_dir = Path(__file__).resolve().parent
+    parser.add_argument(
+        "--repo-root",
+        type=Path,
+        default=default_script_dir.parent,
+        help="repo 根目錄（預設為本腳本所在目錄的上一層）",
+    )
+    parser.add_argument(
+        "--today",
+        type=date.fromisoformat,
+        default=date.today(),
+        help="視為今天的日期（YYYY-MM-DD），date 早於此日者視為過期",
+    )
+    parser.add_argument(
+        "--item",
+        action="append",
+        dest="items",
+        help="只處理指定 item（可重複指定）",
+    )
+    parser.add_argument(
+        "--use-index",
+        action="store_true",
+        help="以 expire_index.json 篩選候選頁面，只讀取帶有已過期標記的頁面",
+    )
+    parser.add_argument(
+        "--index",
+        type=Path,
+        default=default_script_dir / "expire_index.json",
+        help="--use-index 使用的索引檔路徑",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="只預覽，不寫入任何檔案")
+    add_profiling_arguments(parser)
+    args = parser.parse_args()
+    enable_profiling(args)
+
+    repo_root: Path = args.repo_root.resolve()
+    items = set(args.items) if args.items else None
+
+    removed_count: Counter[str] = Counter()
+    warned: dict[str, list[str]] = defaultdict(list)
+    manual: dict[tuple[str, str], list[str]] = defaultdict(list)
+    malformed: list[str] = []
+    unreadable: list[str] = []
+    changed = scanned = 0
+
+    if args.use_index:
+        with phase("update_index"):
+            index, reparsed = update_index(repo_root, args.index.resolve())
+        print(f"索引：{len(index['pages'])} 頁，本次重新解析 {reparsed} 頁")
+        pages = [repo_root / name for name in pages_with_expired(index, args.today, items)]
+        unreadable = [f"{name}：{error}" for name, error in index_errors(index)]
+    else:
+        pages = [repo_root / name for name in list_pages(repo_root, PAGES_ROOT)]
+
+    try:
+        with phase("sweep"), AtomicBatchWriter(validate=check_page_intact) as writer:
+            for page in pages:
+                scanned += 1
+                # 以 bytes 讀入再解碼，保留原始換行（CRLF 頁面寫回仍是 CRLF）
+                data = page.read_bytes()
+                count("pages_read")
+                add_bytes(read=len(data))
+                text = data.decode("utf-8")
+                if EXPIRE_TAG not in text:
+                    continue
+
+                new_text, removed, warnings, page_manual, page_malformed = sweep_page(text, args.today, items)
+                for item in removed:
+                    removed_count[item] += 1
+                for item, note in warnings:
+                    warned[item].append(f"{page.name}: {note}")
+                for key in page_manual:
+                    manual[key].append(page.name)
+                for item, note in page_malformed:
+                    malformed.append(f"{page.name}: item={item} {note}")
+
+                if removed:
+                    changed += 1
+                    if not args.dry_run:
+                        writer.stage(page, new_text.encode("utf-8"))
+    except BatchWriteError as e:
+        print(f"[ERROR] {e}（整批未寫入）", file=sys.stderr)
+        return 1
+
+    prefix = "[DRY-RUN] " if args.dry_run else "[APPLIED] "
+    print(f"{prefix}today={args.today} scanned={scanned} changed={changed}")
+    for item in sorted(set(removed_count) | set(warned)):
+        print(f"  item={item} removed={removed_count[item]} warned={len(warned.get(item, []))}")
+        for line in warned.get(item, []):
+            print(f"    WARN {line}")
+    if manual:
+        print("需人工處理（已過期，但不是可整塊移除的片段）：")
+        for (item, onexpire), names in sorted(manual.items()):
+            print(f"  item={item} onexpire={onexpire} pages={', '.join(names)}")
+    if malformed:
+        print("date 格式錯誤、無法判斷是否過期的標記（不影響 exit code，請修正標記）：")
+        for line in malformed:
+            print(f"  {line}")
+    if unreadable:
+        print("無法以 UTF-8 解碼、索引未收錄標記的頁面（未清理，請修正編碼）：")
+        for line in unreadable:
+            print(f"  WARN {line}")
+
+    return 1 if any(warned.values()) or unreadable else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
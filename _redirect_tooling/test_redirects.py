@@ -10,7 +10,8 @@ test_redirects.py — 驗證 build_redirects.py 的產出是否正確
     1. {repo_root}/{path}/index.html 是否存在
     2. 內容是否含本工具管理標記（MANAGED_MARKER）
     3. 四種轉址機制是否都「在正確的標籤上下文內」指向 redirects.json 中
-       對應的 target：
+       對應的 target（頁面以 HTMLParser 單次 tokenize 成事實表，
+       見 RedirectPageFacts，所有檢查都對事實表查詢）：
          - <meta http-equiv="refresh" content="0; url=TARGET">
          - <link rel="canonical" href="TARGET">
          - <script> 區塊內的 location.replace(JS_ESCAPED_TARGET)
@@ -19,13 +20,23 @@ test_redirects.py — 驗證 build_redirects.py 的產出是否正確
            跳脫前的原始 target —— 否則含 </script> 的 target 會被
            build 正確跳脫，卻在這裡被誤判 FAIL）
          - <noscript> 區塊內 <a href="TARGET"> 可點擊連結
-    4. 社群預覽標籤是否正確帶入 note（<title> 與 og:title 是否為
-       compute_display_title(note) 的跳脫結果——與 build_redirects.py
+    4. 社群預覽標籤是否正確帶入 note（og:title 與 twitter:title 是否為
+       compute_display_title(note) 的結果——與 build_redirects.py
        共用同一份 fallback 邏輯，見 _common.py）、og:url 是否等於 target
     5. 全文只出現一次「</script」字面序列（H-1 script-breakout 迴歸測試：
        若 target 未正確跳脫，含 </script> 的惡意/特殊 target 會讓這個
        字面序列出現第二次）
 
+router 模式（manifest.json 的 router_paths）則改驗證根目錄 404.html：
+    1. 404.html 存在且含管理標記
+    2. 內嵌對照表（<script type="application/json" id="hdh-router-table">）
+       以小寫 path 查得的 target 與 redirects.json 相同，且對照表不多不少
+       恰好是 router_paths
+    3. 該 path 沒有實體資料夾或同名 .html（否則 GitHub Pages 直接回傳
+       該內容，不會走到 404.html）
+    4. 「</script」關閉標籤數與 <script> 區塊數相同（對照表 JSON 未正確
+       跳脫時會多出孤兒關閉標籤）
+
 輸出 PASS/FAIL 表與總結，全數 PASS 才會以 exit code 0 結束
 （供 CI 在自動 commit 前擋下有問題的產出）。
 """
@@ -37,17 +48,59 @@ import html
 import json
 import re
 import sys
+from html.parser import HTMLParser
 from pathlib import Path
+from typing import NamedTuple
 
 from _common import (
     MANAGED_MARKER,
+    ROUTER_PAGE_NAME,
+    ROUTER_TABLE_ID,
+    add_bytes,
+    add_profiling_arguments,
     compute_display_title,
+    count,
+    enable_profiling,
     js_escape_target,
+    phase,
     reconfigure_utf8_streams,
 )
 
 reconfigure_utf8_streams()
 
+# <meta http-equiv="refresh"> 的 content 格式：「0; url=TARGET」
+REFRESH_CONTENT_PATTERN = re.compile(r"0;\s*url=(.*)\Z", re.DOTALL)
+
+RAW_TAG_NAME_PATTERN = re.compile(r"<[^\s/>]+")
+# 開始標籤原文中的屬性：name="值" / name='值' / name=值 / 單獨的 name
+RAW_ATTR_PATTERN = re.compile(r"""([^\s"'<>/=]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'=<>`]+)))?""")
+
+
+class AttrValue(NamedTuple):
+    """屬性值：value 為解碼實體後的值，raw 為頁面原文（未解碼）。"""
+
+    value: str
+    raw: str
+
+
+def raw_attrs(starttag_text: str) -> dict[str, str]:
+    """開始標籤原文（get_starttag_text()）→ {小寫屬性名: 未解碼的原始值}。"""
+    tag_name = RAW_TAG_NAME_PATTERN.match(starttag_text)
+    raws: dict[str, str] = {}
+    for m in RAW_ATTR_PATTERN.finditer(starttag_text, tag_name.end() if tag_name else 0):
+        raws.setdefault(m.group(1).lower(), next((g for g in m.groups()[1:] if g is not None), ""))
+    return raws
+
+
+def has_attr_value(values: list[AttrValue], expected: str) -> bool:
+    """
+    是否有一個值等於 expected，且原文恰為 html.escape(expected, quote=True)：
+    解碼後相同還不夠，也要確認 build_redirects.py 確實做了 HTML 跳脫
+    （原文若是裸 & 或 "，瀏覽器多半仍能容錯，但那就是跳脫漏了）。
+    """
+    escaped = html.escape(expected, quote=True)
+    return any(v.value == expected and v.raw == escaped for v in values)
+
 
 def load_json(path: Path, label: str) -> object:
     if not path.exists():
@@ -61,6 +114,100 @@ def load_json(path: Path, label: str) -> object:
         sys.exit(1)
 
 
+class RedirectPageFacts(HTMLParser):
+    """
+    單次掃描轉址頁，把驗證需要的「事實」收集成一張表：
+
+        comments          所有 HTML 註解內容（管理標記檢查用）
+        meta_http_equiv   <meta http-equiv=... content=...>，key 小寫
+        meta_property     <meta property=... content=...>（og:*）
+        meta_name         <meta name=... content=...>（twitter:* 等）
+        link_rel          <link rel=... href=...>，key 小寫
+        script_texts      每個 <script> 區塊的原始內容（未經實體解碼，
+                          即瀏覽器 JS 引擎實際看到的字串）
+        script_by_id      帶 id 屬性的 <script> 區塊內容，key 為 id
+        noscript_hrefs    <noscript> 區塊內所有 <a href>
+        script_close_count  </script 關閉標籤出現次數
+
+    屬性值一律記成 AttrValue(解碼後的值, 頁面原文)：解碼由 HTMLParser
+    處理（&quot; → "），原文取自 get_starttag_text()，比對時兩者都要
+    相符（見 has_attr_value()），才驗得出 build_redirects.py 有沒有正確
+    html.escape()。
+
+    所有檢查都對這張表做字典查詢，不再對全文跑多次正則；頁面只被
+    tokenize 一次，之後新增檢查項目也不會多一次全文掃描。
+    """
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.comments: list[str] = []
+        self.meta_http_equiv: dict[str, list[AttrValue]] = {}
+        self.meta_property: dict[str, list[AttrValue]] = {}
+        self.meta_name: dict[str, list[AttrValue]] = {}
+        self.link_rel: dict[str, list[AttrValue]] = {}
+        self.script_texts: list[str] = []
+        self.script_by_id: dict[str, str] = {}
+        self.noscript_hrefs: list[AttrValue] = []
+        self.script_close_count = 0
+        self._script_buf: list[str] | None = None
+        self._script_id: str | None = None
+        self._noscript_depth = 0
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        a = {k: (v or "") for k, v in attrs}
+        if tag == "meta":
+            raws = raw_attrs(self.get_starttag_text() or "")
+            content = AttrValue(a.get("content", ""), raws.get("content", ""))
+            if "http-equiv" in a:
+                self.meta_http_equiv.setdefault(a["http-equiv"].lower(), []).append(content)
+            if "property" in a:
+                self.meta_property.setdefault(a["property"], []).append(content)
+            if "name" in a:
+                self.meta_name.setdefault(a["name"], []).append(content)
+        elif tag == "link":
+            raws = raw_attrs(self.get_starttag_text() or "")
+            href = AttrValue(a.get("href", ""), raws.get("href", ""))
+            self.link_rel.setdefault(a.get("rel", "").lower(), []).append(href)
+        elif tag == "script":
+            self._script_buf = []
+            self._script_id = a.get("id")
+        elif tag == "noscript":
+            self._noscript_depth += 1
+        elif tag == "a" and self._noscript_depth > 0 and "href" in a:
+            raws = raw_attrs(self.get_starttag_text() or "")
+            self.noscript_hrefs.append(AttrValue(a["href"], raws.get("href", "")))
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag == "script":
+            # 不論是否有對應的 <script> 開頭都要計數：target 未正確跳脫時，
+            # 提早關閉 script 後剩下的那個 </script> 會變成孤兒關閉標籤。
+            self.script_close_count += 1
+            if self._script_buf is not None:
+                text = "".join(self._script_buf)
+                self.script_texts.append(text)
+                if self._script_id:
+                    self.script_by_id[self._script_id] = text
+                self._script_buf = None
+        elif tag == "noscript" and self._noscript_depth > 0:
+            self._noscript_depth -= 1
+
+    def handle_data(self, data: str) -> None:
+        if self._script_buf is not None:
+            self._script_buf.append(data)
+
+    def handle_comment(self, data: str) -> None:
+        self.comments.append(data)
+        # 與舊版全文字面比對一致：註解內的 </script 字樣也列入計數
+        self.script_close_count += data.lower().count("</script")
+
+
+def parse_page(content: str) -> RedirectPageFacts:
+    facts = RedirectPageFacts()
+    facts.feed(content)
+    facts.close()
+    return facts
+
+
 def check_one(repo_root: Path, path: str, target: str, note: str) -> tuple[bool, str]:
     index_path = repo_root / path / "index.html"
 
@@ -71,78 +218,100 @@ def check_one(repo_root: Path, path: str, target: str, note: str) -> tuple[bool,
         content = index_path.read_text(encoding="utf-8", errors="replace")
     except OSError as e:
         return False, f"讀取失敗：{e}"
+    count("pages_checked")
+    add_bytes(read=len(content.encode("utf-8")))
+
+    facts = parse_page(content)
 
-    if MANAGED_MARKER not in content:
+    if not any(MANAGED_MARKER in c for c in facts.comments):
         return False, "缺少管理標記（MANAGED_MARKER），可能不是本工具產生的頁面"
 
-    safe_target_attr = html.escape(target, quote=True)
     js_target = js_escape_target(target)
-    safe_display_title = html.escape(compute_display_title(note), quote=True)
+    display_title = compute_display_title(note)
 
-    # 四種轉址機制 + 社群預覽標籤各自用「鎖定標籤上下文」的正則檢查，
+    # 四種轉址機制 + 社群預覽標籤各自對「該標籤的屬性值」做精確比對，
     # 而不是單純「字串是否出現在檔案某處」，避免誤判（例如 target 字串
     # 剛好出現在別的地方、或跳脫方式不對但恰好子字串相符）。
+    # 屬性值同時比對解碼後的值與頁面原文（原文須為 html.escape() 的結果）
+    refresh_urls = [
+        AttrValue(m.group(1), raw_m.group(1))
+        for c in facts.meta_http_equiv.get("refresh", [])
+        if (m := REFRESH_CONTENT_PATTERN.match(c.value)) and (raw_m := REFRESH_CONTENT_PATTERN.match(c.raw))
+    ]
     checks = {
-        "meta refresh": re.search(
-            r'<meta\s+http-equiv="refresh"\s+content="0;\s*url='
-            + re.escape(safe_target_attr)
-            + r'"\s*>',
-            content,
-        ),
-        "link canonical": re.search(
-            r'<link\s+rel="canonical"\s+href="' + re.escape(safe_target_attr) + r'"\s*>',
-            content,
-        ),
-        "script location.replace": re.search(
-            r"<script>.*?location\.replace\("
-            + re.escape(js_target)
-            + r"\).*?</script>",
-            content,
-            re.DOTALL,
-        ),
-        "noscript 連結": re.search(
-            r"<noscript>.*?<a\s+href=\""
-            + re.escape(safe_target_attr)
-            + r"\">.*?</a>.*?</noscript>",
-            content,
-            re.DOTALL,
-        ),
-        "og:title": re.search(
-            r'<meta\s+property="og:title"\s+content="'
-            + re.escape(safe_display_title)
-            + r'"\s*>',
-            content,
-        ),
-        "og:url": re.search(
-            r'<meta\s+property="og:url"\s+content="' + re.escape(safe_target_attr) + r'"\s*>',
-            content,
-        ),
-        "twitter:title": re.search(
-            r'<meta\s+name="twitter:title"\s+content="'
-            + re.escape(safe_display_title)
-            + r'"\s*>',
-            content,
+        "meta refresh": has_attr_value(refresh_urls, target),
+        "link canonical": has_attr_value(facts.link_rel.get("canonical", []), target),
+        "script location.replace": any(
+            f"location.replace({js_target})" in t for t in facts.script_texts
         ),
+        "noscript 連結": has_attr_value(facts.noscript_hrefs, target),
+        "og:title": has_attr_value(facts.meta_property.get("og:title", []), display_title),
+        "og:url": has_attr_value(facts.meta_property.get("og:url", []), target),
+        "twitter:title": has_attr_value(facts.meta_name.get("twitter:title", []), display_title),
     }
 
-    failed = [name for name, m in checks.items() if not m]
+    failed = [name for name, ok in checks.items() if not ok]
     if failed:
         return False, f"target/note 不一致（缺少：{', '.join(failed)}）"
 
     # 額外的 script-breakout 防護檢查（H-1 迴歸測試用）：
     # 確認整份文件中，「</script」這個會被 HTML 解析器辨識為關閉標籤的
-    # 字面序列，只出現一次（就是合法的關閉標籤本身）。如果 target 內含
-    # </script> 卻沒有正確跳脫，這裡會抓到第二次出現。
-    script_close_occurrences = len(re.findall(r"</script", content, re.IGNORECASE))
-    if script_close_occurrences != 1:
+    # 序列，只出現一次（就是合法的關閉標籤本身）。如果 target 內含
+    # </script> 卻沒有正確跳脫，script 會被提早關閉，原本的關閉標籤就
+    # 成為第二次出現。
+    if facts.script_close_count != 1:
         return False, (
-            f"偵測到 {script_close_occurrences} 次 '</script' 字樣"
+            f"偵測到 {facts.script_close_count} 次 '</script' 字樣"
             "（應恰好 1 次），疑似 target 未正確跳脫導致 script 標籤被提早關閉"
         )
 
     return True, "OK"
 
 
+def load_router_table(repo_root: Path) -> tuple[dict[str, str] | None, str]:
+    """
+    讀取並驗證 router 模式的 404.html，回傳 (對照表, 說明)；頁面本身
+    不合格時對照表為 None、說明為失敗原因。
+    """
+    router_path = repo_root / ROUTER_PAGE_NAME
+    if not router_path.exists():
+        return None, f"{ROUTER_PAGE_NAME} 不存在（{router_path}）"
+    try:
+        content = router_path.read_text(encoding="utf-8", errors="replace")
+    except OSError as e:
+        return None, f"讀取 {ROUTER_PAGE_NAME} 失敗：{e}"
+    add_bytes(read=len(content.encode("utf-8")))
+
+    facts = parse_page(content)
+    if not any(MANAGED_MARKER in c for c in facts.comments):
+        return None, f"{ROUTER_PAGE_NAME} 缺少管理標記（MANAGED_MARKER）"
+    if facts.script_close_count != len(facts.script_texts):
+        return None, (
+            f"{ROUTER_PAGE_NAME} 的 '</script' 出現 {facts.script_close_count} 次、"
+            f"<script> 區塊 {len(facts.script_texts)} 個，疑似對照表未正確跳脫"
+        )
+    raw = facts.script_by_id.get(ROUTER_TABLE_ID)
+    if raw is None:
+        return None, f"{ROUTER_PAGE_NAME} 找不到對照表（id={ROUTER_TABLE_ID}）"
+    try:
+        table = json.loads(raw)
+    except json.JSONDecodeError as e:
+        return None, f"{ROUTER_PAGE_NAME} 對照表不是合法 JSON：{e}"
+    if not isinstance(table, dict):
+        return None, f"{ROUTER_PAGE_NAME} 對照表格式不正確"
+    return table, "OK"
+
+
+def check_router_path(repo_root: Path, table: dict[str, str], path: str, target: str) -> tuple[bool, str]:
+    if (repo_root / path).exists() or (repo_root / f"{path}.html").exists():
+        return False, f"已有實體資料夾/檔案，GitHub Pages 不會回傳 {ROUTER_PAGE_NAME}"
+    if path.lower() not in table:
+        return False, f"{ROUTER_PAGE_NAME} 對照表中沒有此 path"
+    if table[path.lower()] != target:
+        return False, f"{ROUTER_PAGE_NAME} 對照表的 target 不一致"
+    return True, "OK（router）"
+
+
 def main() -> int:
     parser = argparse.ArgumentParser(description="驗證轉址頁產出")
     default_script_dir = Path(__file__).resolve().parent
@@ -164,21 +333,26 @@ def main() -> int:
         default=default_script_dir / "redirects.json",
         help="redirects.json 路徑（提供各 path 的 target 供比對）",
     )
+    add_profiling_arguments(parser)
     args = parser.parse_args()
+    enable_profiling(args)
 
     repo_root: Path = args.repo_root.resolve()
-    manifest = load_json(args.manifest, "manifest.json")
-    mirror = load_json(args.mirror_json, "redirects.json")
+    with phase("load"):
+        manifest = load_json(args.manifest, "manifest.json")
+        mirror = load_json(args.mirror_json, "redirects.json")
 
     row_by_path = {row["path"]: row for row in mirror}
 
     managed_paths = manifest.get("managed_paths", [])
-    if not managed_paths:
-        print("manifest.json 中沒有任何 managed_paths，無項目可驗證。")
+    router_paths = manifest.get("router_paths", [])
+    if not managed_paths and not router_paths:
+        print("manifest.json 中沒有任何 managed_paths / router_paths，無項目可驗證。")
         return 0
+    total = len(managed_paths) + len(router_paths)
 
     print(f"repo-root : {repo_root}")
-    print(f"共 {len(managed_paths)} 筆待驗證")
+    print(f"共 {total} 筆待驗證")
     print()
     print(f"{'狀態':<6}{'PATH':<24}說明")
     print("-" * 70)
@@ -186,23 +360,48 @@ def main() -> int:
     pass_count = 0
     fail_count = 0
 
-    for path in managed_paths:
-        row = row_by_path.get(path)
-        if row is None:
-            print(f"{'FAIL':<6}{path:<24}redirects.json 中找不到對應 target")
-            fail_count += 1
-            continue
-
-        ok, msg = check_one(repo_root, path, row["target"], row.get("note", ""))
-        status = "PASS" if ok else "FAIL"
-        print(f"{status:<6}{path:<24}{msg}")
-        if ok:
-            pass_count += 1
-        else:
-            fail_count += 1
+    with phase("check_pages"):
+        for path in managed_paths:
+            row = row_by_path.get(path)
+            if row is None:
+                print(f"{'FAIL':<6}{path:<24}redirects.json 中找不到對應 target")
+                fail_count += 1
+                continue
+
+            ok, msg = check_one(repo_root, path, row["target"], row.get("note", ""))
+            status = "PASS" if ok else "FAIL"
+            print(f"{status:<6}{path:<24}{msg}")
+            if ok:
+                pass_count += 1
+            else:
+                fail_count += 1
+
+    with phase("check_router"):
+        if router_paths:
+            table, msg = load_router_table(repo_root)
+            if table is None:
+                print(f"{'FAIL':<6}{ROUTER_PAGE_NAME:<24}{msg}")
+                fail_count += len(router_paths)
+            else:
+                extra = sorted(set(table) - {p.lower() for p in router_paths})
+                if extra:
+                    print(f"{'FAIL':<6}{ROUTER_PAGE_NAME:<24}對照表含 manifest 以外的 path：{', '.join(extra)}")
+                    fail_count += 1
+                    total += 1
+                for path in router_paths:
+                    row = row_by_path.get(path)
+                    if row is None:
+                        ok, msg = False, "redirects.json 中找不到對應 target"
+                    else:
+                        ok, msg = check_router_path(repo_root, table, path, row["target"])
+                    print(f"{'PASS' if ok else 'FAIL':<6}{path:<24}{msg}")
+                    if ok:
+                        pass_count += 1
+                    else:
+                        fail_count += 1
 
     print("-" * 70)
-    print(f"總結：{pass_count} PASS / {fail_count} FAIL / 共 {len(managed_paths)} 筆")
+    print(f"總結：{pass_count} PASS / {fail_count} FAIL / 共 {total} 筆")
 
     return 0 if fail_count == 0 else 1
 
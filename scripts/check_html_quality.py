@@ -9,77 +9,500 @@ medatatw_repo HTML 品質守門員
   手動全站掃描：python scripts/check_html_quality.py --all
   只掃 staged 檔：python scripts/check_html_quality.py --staged
   掃指定檔案：  python scripts/check_html_quality.py file1.html file2.html
+  平行掃描：    python scripts/check_html_quality.py --all --jobs 8
+  顯示耗時：    python scripts/check_html_quality.py --all --jobs 0 --timing
+
+  --jobs N：以 N 個 process 平行執行 check_file（0 = CPU 核心數，預設 1
+            即單一 process 依序執行）；輸出順序固定依檔名排序，與 N 無關。
+  --timing：額外列出最慢的檔案與總耗時（wall-clock），方便比較平行效益。
+  --no-cache：不讀寫結果快取，強制重新檢查每個檔案。
+  --staged：檢查的是 index 裡「即將提交」的版本，不是工作區檔案（兩者可能
+            不同，例如 stage 後又改了檔案）。所有 staged blob 經由同一支
+            git cat-file --batch 管線依序讀出，不逐檔開檔；結果快取以工作區
+            檔案為準，staged 模式不讀寫快取。
+  --timings-json PATH / --profile PATH：輸出各階段耗時、計數器與讀取位元組
+            （JSON）/ cProfile 統計檔，格式與 _redirect_tooling 各工具相同
+            （共用 _redirect_tooling/_common.py 的計時工具）。
+
+結果快取（.cache/html_quality.json，已列入 .gitignore）：
+  以「repo 相對路徑 + (mtime_ns, size, 內容 sha256) + 規則版本」為鍵，
+  保存每個檔案上次的錯誤列表。mtime/size 相同直接沿用；不同時再比對
+  內容雜湊（例如 git checkout 只改了 mtime），相同也沿用。規則版本由
+  規則引擎原始碼與 RULES 雜湊而得，規則一改整份快取自動失效，不需要
+  手動清除。
+
+規則引擎：
+  每條規則是 RULES 內的一筆宣告（require / forbid / unless / when 四種
+  字面字串與 applies_to 檔名條件），所有字面字串在載入時編譯成「一支」以共同
+  前綴分岔的正則（trie 形式，效果等同 Aho-Corasick：每個位置只需比對
+  各分岔的首字元），每個檔案只做一次全文掃描得到命中集合，再逐條
+  規則查集合判定。新增規則不會再多一次全文掃描。帶 pattern 的規則只在
+  字面字串命中時，才檢查命中處所在的那個標籤。
 """
-import re, sys, os, subprocess, glob
+import re, sys, os, subprocess, glob, time, argparse, hashlib, inspect, json
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 
 # === 設定 ===
 P_PREFIX = "P%3DMW800%2CMH800%2CF%2CBFFFFFF/"
 
+# 平行模式每批派送給子 process 的檔案數：每批越大，IPC 來回越少；
+# 太大則最後幾批負載不均。332 頁、8 核心時約 10 批/核心。
+CHUNK_SIZE = 4
+
+# --timing 時列出的最慢檔案數
+TIMING_TOP_N = 10
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_PATH = os.path.join(REPO_ROOT, ".cache", "html_quality.json")
+
+# 分階段計時與 --profile / --timings-json 共用 _redirect_tooling/_common.py
+sys.path.insert(0, os.path.join(REPO_ROOT, "_redirect_tooling"))
+from _common import add_bytes, add_profiling_arguments, count, enable_profiling, phase  # noqa: E402
+
 IMAGES_NEEDING_P = [
     "%E7%B5%B1%E5%90%88%E5%88%86%E6%9E%90%E7%A0%94%E7%A9%B6%E5%B7%A5%E4%BD%9C%E5%9D%8A%E8%AA%B2%E7%A8%8B%E6%83%85%E5%BD%A21.png",
     "%E7%B5%B1%E5%90%88%E5%88%86%E6%9E%90%E7%A0%94%E7%A9%B6%E5%B7%A5%E4%BD%9C%E5%9D%8A%E8%AA%B2%E7%A8%8B%E6%83%85%E5%BD%A22.png",
     "%E7%B5%B1%E5%90%88%E5%88%86%E6%9E%90%E7%A0%94%E7%A9%B6%E5%B7%A5%E4%BD%9C%E5%9D%8A%E8%AC%9B%E7%BE%A9.png",
 ]
 
+# 由 _redirect_tooling/pagefind_ignore.py 標記 data-pagefind-ignore 的全站注入片段
+PAGEFIND_IGNORED_ROOTS = ["annc", "nlpop", "footer", "mascot"]
+
+# === 規則 ===
+# 規則成立（回報錯誤）的條件：
+#   require 不在頁面中；或 forbid 在頁面中且 unless 不在頁面中（unless 可省略）
+# applies_to：檔名（basename）正則，省略則適用所有頁面。
+# when：頁面含此字面字串時規則才適用（例如只檢查已遷移的頁面），省略則不限。
+# pattern：forbid 出現在標籤內時，該標籤（<...> 全文）須完全符合此正則
+#   才算命中，不在標籤內或在 HTML 註解內的 forbid 不算。用於字面字串
+#   無法表達的結構（屬性順序不定、「缺少某屬性」的開始標籤等）。
+Rule = namedtuple(
+    "Rule",
+    "rule_id message require forbid unless applies_to when pattern",
+    defaults=(None, None, None, None, None, None),
+)
+
+
+# 沒有 data-pagefind-ignore 的 <div> 開始標籤（屬性順序不限）
+UNMARKED_DIV = r"<div\b(?![^>]*\sdata-pagefind-ignore\b)[^>]*>"
+
+RULES = [
+    # 規則 1：禁止 margin:50px widget
+    Rule(
+        "widget-margin",
+        "__iv_dynamic_widget 未改為 display:none（仍為 margin:50px）",
+        forbid='__iv_dynamic_widget" style="margin: 50px"',
+    ),
+    # 規則 2：必須有 pagefind-search.js
+    Rule("pagefind-search", "缺少 pagefind-search.js 引入", require="pagefind-search.js"),
+] + [
+    # 規則 3：F26 頁面輪播圖路徑檢查
+    Rule(
+        "f26-carousel-p-prefix",
+        f"輪播圖缺 P= 前綴（...{img_name[-25:]}）",
+        forbid=f'data-lazy="_imagecache/{img_name}"',
+        unless=f'data-lazy="_imagecache/{P_PREFIX}{img_name}"',
+        applies_to=r"[fF]26",
+    )
+    for img_name in IMAGES_NEEDING_P
+] + [
+    # 規則 4：已標記 data-pagefind-ignore 的頁面，注入片段 root 與導覽選單
+    # 不得退回未標記版本（與 pagefind_ignore.py 認定的開始標籤相同：div 上
+    # 可有其他屬性，註解裡提到的同名字串不算）
+    Rule(
+        f"pagefind-ignore-{root}",
+        f"hdh-{root}-root 缺 data-pagefind-ignore（頁面已遷移，片段退回未標記版本）",
+        forbid=f'id="hdh-{root}-root"',
+        when="data-pagefind-ignore",
+        pattern=UNMARKED_DIV,
+    )
+    for root in PAGEFIND_IGNORED_ROOTS
+] + [
+    Rule(
+        "pagefind-ignore-nav",
+        '導覽選單 block_type="menu" 缺 data-pagefind-ignore（頁面已遷移，選單退回未標記版本）',
+        forbid='block_type="menu"',
+        when="data-pagefind-ignore",
+        pattern=UNMARKED_DIV,
+    ),
+]
+
+
+def build_trie_pattern(needles):
+    """
+    把字面字串清單編譯成單一正則：共同前綴只寫一次、在分岔點展開成
+    (?:a|b)，結尾可選的分支用 (?:...)? 表示（貪婪，優先比對較長者）。
+    """
+    trie = {}
+    for needle in needles:
+        node = trie
+        for ch in needle:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def emit(node):
+        branches = []
+        optional = "" in node
+        for ch, child in sorted(node.items()):
+            if ch == "":
+                continue
+            # 單一路徑的鏈直接串成字面字串，減少群組層數
+            chunk = ch
+            while len(child) == 1 and "" not in child:
+                (next_ch, child), = child.items()
+                chunk += next_ch
+            branches.append(re.escape(chunk) + emit(child))
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if optional else body
+
+    return re.compile(emit(trie))
+
+
+def compile_rules(rules):
+    """
+    回傳 (needle 正則, 隱含關係, 需補查的 needle)：
+      隱含關係：needle → 被它「包含」的其他 needle。finditer 不回報重疊
+        命中，長 needle 命中時，被包含的短 needle 也一定存在。
+      需補查：與其他 needle 首尾部分重疊的 needle（A 的後綴是 B 的前綴），
+        可能被前一個命中吃掉而漏報，掃描後若未命中再以 in 個別確認。
+    """
+    needles = sorted({n for r in rules for n in (r.require, r.forbid, r.unless, r.when) if n})
+    implied = {a: [b for b in needles if b != a and b in a] for a in needles}
+    recheck = [
+        b for b in needles
+        if any(
+            a != b and any(a.endswith(b[:k]) for k in range(1, min(len(a), len(b))))
+            for a in needles
+        )
+    ]
+    return build_trie_pattern(needles), implied, recheck
+
+
+NEEDLE_PATTERN, IMPLIED_NEEDLES, RECHECK_NEEDLES = compile_rules(RULES)
+
 
 def check_file(filepath):
     """檢查單一 HTML 檔案，回傳錯誤列表"""
-    errors = []
+    return scan_file(filepath)[0]
+
+
+def scan_file(filepath):
+    """
+    讀檔一次並檢查，回傳 (錯誤列表, 秒數, 快取指紋)。
+    快取指紋為 {"mtime_ns", "size", "sha256"}；讀取失敗時為 None（不快取）。
+    """
+    t0 = time.perf_counter()
     try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            content = f.read()
-    except (FileNotFoundError, UnicodeDecodeError) as e:
-        return [f"{filepath}: 無法讀取 ({e})"]
+        st = os.stat(filepath)
+        with open(filepath, "rb") as f:
+            data = f.read()
+        content = data.decode("utf-8")
+    except (OSError, UnicodeDecodeError) as e:
+        return [f"{filepath}: 無法讀取 ({e})"], time.perf_counter() - t0, None
 
-    basename = os.path.basename(filepath)
+    errors = check_content(os.path.basename(filepath), content)
+    fingerprint = {
+        "mtime_ns": st.st_mtime_ns,
+        "size": st.st_size,
+        "sha256": hashlib.sha256(data).hexdigest(),
+    }
+    return errors, time.perf_counter() - t0, fingerprint
 
-    # 規則 1：禁止 margin:50px widget
-    if '__iv_dynamic_widget" style="margin: 50px"' in content:
-        errors.append(f"{basename}: __iv_dynamic_widget 未改為 display:none（仍為 margin:50px）")
 
-    # 規則 2：必須有 pagefind-search.js
-    if "pagefind-search.js" not in content:
-        errors.append(f"{basename}: 缺少 pagefind-search.js 引入")
+def find_needles(content):
+    """單次掃描全文，回傳所有規則字面字串中出現在頁面內者的集合"""
+    hits = set()
+    for m in NEEDLE_PATTERN.finditer(content):
+        needle = m.group()
+        hits.add(needle)
+        hits.update(IMPLIED_NEEDLES[needle])
+    for needle in RECHECK_NEEDLES:
+        if needle not in hits and needle in content:
+            hits.add(needle)
+    return hits
 
-    # 規則 3：F26 頁面輪播圖路徑檢查
-    if re.search(r"[fF]26", basename):
-        for img_name in IMAGES_NEEDING_P:
-            old_path = f'data-lazy="_imagecache/{img_name}"'
-            new_path = f'data-lazy="_imagecache/{P_PREFIX}{img_name}"'
-            if old_path in content and new_path not in content:
-                short_name = img_name[-25:]
-                errors.append(f"{basename}: 輪播圖缺 P= 前綴（...{short_name}）")
 
+def in_comment(content, pos):
+    """pos 是否落在 HTML 註解 <!-- ... --> 之內。"""
+    return content.rfind("<!--", 0, pos) > content.rfind("-->", 0, pos)
+
+
+def enclosing_tags(content, needle):
+    """needle 每次出現時所在的標籤全文；不在標籤內、或標籤在註解內者略過。"""
+    pos = content.find(needle)
+    while pos != -1:
+        start = content.rfind("<", 0, pos)
+        end = content.find(">", pos)
+        if start != -1 and end != -1 and content.find(">", start, pos) == -1 and not in_comment(content, start):
+            yield content[start:end + 1]
+        pos = content.find(needle, pos + len(needle))
+
+
+def rule_fires(rule, hits, content):
+    if rule.when and rule.when not in hits:
+        return False
+    if rule.require and rule.require not in hits:
+        return True
+    if not rule.forbid or rule.forbid not in hits or (rule.unless and rule.unless in hits):
+        return False
+    if rule.pattern is None:
+        return True
+    return any(re.fullmatch(rule.pattern, tag) for tag in enclosing_tags(content, rule.forbid))
+
+
+def check_content(basename, content):
+    """檢查單一頁面內容（已解碼），回傳錯誤列表"""
+    hits = find_needles(content)
+    errors = []
+    for rule in RULES:
+        if rule.applies_to and not re.search(rule.applies_to, basename):
+            continue
+        if rule_fires(rule, hits, content):
+            errors.append(f"{basename}: {rule.message}")
     return errors
 
 
 def get_staged_html():
-    """取得本次 commit 異動的 HTML 檔"""
+    """
+    取得本次 commit 異動的 HTML 檔，回傳 [(路徑, index 內的 blob sha)]。
+    以 --raw -z 解析：每筆為 ":舊mode 新mode 舊sha 新sha 狀態" 後接路徑，
+    改名 / 複製（R / C）後接來源與目的兩個路徑，取目的路徑。
+    """
     try:
         result = subprocess.run(
-            ["git", "diff", "--cached", "--name-only", "--diff-filter=ACM"],
-            capture_output=True, text=True, check=True
+            ["git", "diff", "--cached", "--raw", "-z", "--no-abbrev", "--diff-filter=ACMR"],
+            capture_output=True, check=True
         )
-        return [f for f in result.stdout.strip().splitlines() if f.endswith(".html")]
-    except subprocess.CalledProcessError:
+    except (OSError, subprocess.CalledProcessError):
         return []
+    fields = result.stdout.split(b"\0")
+    staged = []
+    i = 0
+    while i + 1 < len(fields) and fields[i].startswith(b":"):
+        meta = fields[i].split()
+        n_paths = 2 if meta[4][:1] in (b"R", b"C") else 1
+        path = fields[i + n_paths].decode("utf-8")
+        i += 1 + n_paths
+        if path.endswith(".html"):
+            staged.append((path, meta[3].decode("ascii")))
+    return staged
 
 
-def main():
-    args = sys.argv[1:]
-
-    if not args or "--staged" in args:
-        # Pre-commit 模式：只掃 staged 檔案
-        html_files = get_staged_html()
-        mode = "staged"
-    elif "--all" in args:
-        # 全站掃描模式
-        html_files = glob.glob("*.html")
-        mode = "all"
+def read_blobs(shas):
+    """
+    經由單一 git cat-file --batch 管線依序讀出 blob 內容（與 shas 同順序；
+    讀不到的為 None）。一問一答，不會因管線緩衝區塞滿而互相等待。
+    """
+    contents = []
+    proc = subprocess.Popen(["git", "cat-file", "--batch"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    try:
+        for sha in shas:
+            proc.stdin.write(sha.encode("ascii") + b"\n")
+            proc.stdin.flush()
+            header = proc.stdout.readline().split()
+            if len(header) != 3 or header[1] != b"blob":
+                contents.append(None)
+                continue
+            data = proc.stdout.read(int(header[2]))
+            proc.stdout.read(1)  # blob 內容後的換行
+            contents.append(data)
+    finally:
+        proc.stdin.close()
+        proc.stdout.close()
+        proc.wait()
+    return contents
+
+
+def scan_blob(item):
+    """檢查一份 staged 內容，回傳 (錯誤列表, 秒數)；item 為 (路徑, bytes 或 None)"""
+    filepath, data = item
+    t0 = time.perf_counter()
+    if data is None:
+        return [f"{filepath}: 無法從 index 讀取"], time.perf_counter() - t0
+    try:
+        content = data.decode("utf-8")
+    except UnicodeDecodeError as e:
+        return [f"{filepath}: 無法讀取 ({e})"], time.perf_counter() - t0
+    return check_content(os.path.basename(filepath), content), time.perf_counter() - t0
+
+
+def run_staged_checks(staged, jobs):
+    """讀出所有 staged blob 後依序或平行檢查，回傳與 staged 同順序的 [(errors, 秒數), ...]"""
+    with phase("read_blobs"):
+        contents = read_blobs([sha for _, sha in staged])
+    items = [(path, data) for (path, _), data in zip(staged, contents)]
+    count("files_total", len(items))
+    count("files_scanned", len(items))
+    add_bytes(read=sum(len(data) for _, data in items if data is not None))
+    if jobs == 1 or len(items) <= 1:
+        return [scan_blob(item) for item in items]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(scan_blob, items, chunksize=CHUNK_SIZE))
+
+
+def compute_ruleset_version():
+    """規則版本：規則引擎原始碼 + RULES 的雜湊，任一改動即讓快取失效"""
+    h = hashlib.sha256()
+    engine = (build_trie_pattern, compile_rules, find_needles, in_comment, enclosing_tags, rule_fires, check_content)
+    for func in engine:
+        h.update(inspect.getsource(func).encode("utf-8"))
+    h.update(json.dumps(RULES, ensure_ascii=False).encode("utf-8"))
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    check_content 結果的磁碟快取，鍵為 repo 相對路徑。
+    規則版本不同（或快取檔損毀）時視為空快取，下次 save() 整份覆寫。
+    """
+
+    def __init__(self, path, ruleset):
+        self.path = path
+        self.ruleset = ruleset
+        self.entries = {}
+        self.dirty = False
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict) and data.get("ruleset") == ruleset and isinstance(data.get("entries"), dict):
+            self.entries = data["entries"]
+
+    @staticmethod
+    def key(filepath):
+        return os.path.relpath(os.path.abspath(filepath), REPO_ROOT).replace(os.sep, "/")
+
+    def lookup(self, filepath):
+        """命中回傳快取的錯誤列表，未命中回傳 None"""
+        entry = self.entries.get(self.key(filepath))
+        if not entry:
+            return None
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            return None
+        if entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+            return entry["errors"]
+        # mtime/size 變了但內容可能沒變（例如 git checkout、touch）：比對內容雜湊
+        if entry["size"] != st.st_size:
+            return None
+        try:
+            with open(filepath, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            return None
+        if digest != entry["sha256"]:
+            return None
+        entry["mtime_ns"] = st.st_mtime_ns
+        self.dirty = True
+        return entry["errors"]
+
+    def store(self, filepath, fingerprint, errors):
+        self.entries[self.key(filepath)] = dict(fingerprint, errors=errors)
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"ruleset": self.ruleset, "entries": self.entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+
+def run_checks(html_files, jobs, cache=None):
+    """
+    依序或平行檢查所有檔案，回傳 (與 html_files 同順序的 [(errors, 秒數), ...],
+    快取命中數)。快取命中的檔案不派送、秒數記為 0；executor.map 保證結果
+    順序與輸入順序一致，輸出因此是確定性的。
+    """
+    results = [None] * len(html_files)
+    pending = []
+    for i, f in enumerate(html_files):
+        cached = cache.lookup(f) if cache is not None else None
+        if cached is not None:
+            results[i] = (cached, 0.0)
+        else:
+            pending.append(i)
+
+    pending_files = [html_files[i] for i in pending]
+    if jobs == 1 or len(pending_files) <= 1:
+        scanned = [scan_file(f) for f in pending_files]
     else:
-        # 指定檔案模式
-        html_files = [f for f in args if f.endswith(".html")]
-        mode = "specified"
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            scanned = list(executor.map(scan_file, pending_files, chunksize=CHUNK_SIZE))
+
+    count("files_total", len(html_files))
+    count("cache_hits", len(html_files) - len(pending))
+    count("files_scanned", len(pending))
+    for i, (errors, seconds, fingerprint) in zip(pending, scanned):
+        results[i] = (errors, seconds)
+        if fingerprint is not None:
+            add_bytes(read=fingerprint["size"])
+        if cache is not None and fingerprint is not None:
+            cache.store(html_files[i], fingerprint, errors)
+
+    return results, len(html_files) - len(pending)
+
+
+def print_timing(html_files, results, wall_seconds, jobs, cache_hits):
+    """列出最慢的 TIMING_TOP_N 個檔案與總耗時"""
+    per_file = sorted(
+        ((seconds, f) for f, (_, seconds) in zip(html_files, results)),
+        reverse=True,
+    )
+    cpu_seconds = sum(seconds for seconds, _ in per_file)
+    print(f"\n[TIMING] 最慢 {min(TIMING_TOP_N, len(per_file))} 個檔案：")
+    for seconds, f in per_file[:TIMING_TOP_N]:
+        print(f"  {seconds * 1000:8.1f} ms  {f}")
+    print(
+        f"[TIMING] {len(html_files)} 個檔案（快取命中 {cache_hits}）｜jobs={jobs}｜"
+        f"單檔耗時合計 {cpu_seconds:.3f}s｜總 wall-clock {wall_seconds:.3f}s"
+    )
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="官網 HTML 頁面品質檢查")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--staged", action="store_true", help="只掃 staged 的 HTML 檔（預設）")
+    mode.add_argument("--all", action="store_true", help="掃描目前目錄所有 *.html")
+    parser.add_argument("files", nargs="*", help="指定要檢查的檔案")
+    parser.add_argument(
+        "--jobs", "-j", type=int, default=1,
+        help="平行 process 數（0 = CPU 核心數，預設 1）",
+    )
+    parser.add_argument("--timing", action="store_true", help="列出最慢檔案與總耗時")
+    parser.add_argument("--no-cache", action="store_true", help="不使用結果快取，強制重新檢查")
+    add_profiling_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args(sys.argv[1:])
+    enable_profiling(args)
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+
+    staged = None
+    with phase("collect"):
+        if args.staged or (not args.all and not args.files):
+            # Pre-commit 模式：只掃 staged 檔案（index 內的版本）
+            staged = sorted(get_staged_html())
+            html_files = [path for path, _ in staged]
+            mode = "staged"
+        elif args.all:
+            # 全站掃描模式
+            html_files = glob.glob("*.html")
+            mode = "all"
+        else:
+            # 指定檔案模式
+            html_files = [f for f in args.files if f.endswith(".html")]
+            mode = "specified"
 
     if not html_files:
         if mode == "staged":
@@ -89,11 +512,37 @@ def main():
             print("未找到任何 HTML 檔案")
             sys.exit(0)
 
+    # 固定排序：不論 glob 回傳順序或平行度為何，輸出都一樣
+    html_files = sorted(html_files)
+
+    with phase("cache_load"):
+        # 快取以工作區檔案為準；staged 模式檢查的是 index 內容，不讀寫快取
+        use_cache = not args.no_cache and staged is None
+        cache = ResultCache(CACHE_PATH, compute_ruleset_version()) if use_cache else None
+
+    t0 = time.perf_counter()
+    with phase("scan"):
+        if staged is not None:
+            results, cache_hits = run_staged_checks(staged, jobs), 0
+        else:
+            results, cache_hits = run_checks(html_files, jobs, cache)
+    wall_seconds = time.perf_counter() - t0
+
+    if cache is not None:
+        try:
+            with phase("cache_save"):
+                cache.save()
+        except OSError as e:
+            # 快取只是加速用，寫不進去不影響檢查結果
+            print(f"[WARN] 結果快取寫入失敗：{e}", file=sys.stderr)
+
     all_errors = []
-    for f in html_files:
-        errors = check_file(f)
+    for errors, _ in results:
         all_errors.extend(errors)
 
+    if args.timing:
+        print_timing(html_files, results, wall_seconds, jobs, cache_hits)
+
     if all_errors:
         print(f"\n[BLOCK] 官網頁面品質檢查失敗（{len(all_errors)} 個問題）：")
         for e in all_errors: